@@ -0,0 +1,84 @@
+"""
+Compares encode time and size of the gif, webp and apng outputs on one clip.
+
+The clip is generated with ffmpeg's lavfi test source unless a video is given,
+every format is converted from the same range with the same fps and width.
+
+Usage:
+    python benchmarks/bench_animation.py [video] [--start HH:MM:SS] [--end HH:MM:SS]
+"""
+
+import sys
+import time
+import argparse
+import tempfile
+import subprocess
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import lib.encoding as encoding
+import lib.capabilities as capabilities
+
+
+def make_source(path, seconds=8):
+    task = [
+        str(encoding.FFMPEG_PATH),
+        "-y",
+        "-v",
+        "error",
+        "-f",
+        "lavfi",
+        "-i",
+        f"testsrc2=size=1280x720:rate=30:duration={seconds}",
+        "-c:v",
+        "libx264",
+        "-g",
+        "60",
+        str(path),
+    ]
+    subprocess.run(task, check=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("video", nargs="?", default=None)
+    parser.add_argument("--start", default="00:00:01")
+    parser.add_argument("--end", default="00:00:05")
+    args = parser.parse_args()
+
+    capabilities.configure()
+
+    work_dir = Path(tempfile.mkdtemp(prefix="bench_animation_"))
+    source = args.video
+    if source is None:
+        source = work_dir / "source.mp4"
+        make_source(source)
+
+    contenders = [
+        ("gif", "clip.gif", encoding.to_gif, {"cache_palette": False}),
+        ("gif (cached palette)", "clip_cached.gif", encoding.to_gif, {}),
+        ("webp lossy", "clip.webp", encoding.to_webp, {"lossless": False}),
+        ("webp lossless", "clip_lossless.webp", encoding.to_webp, {"lossless": True}),
+        ("apng", "clip.apng", encoding.to_apng, {}),
+    ]
+    # fill the palette cache so the cached row only measures the second pass
+    encoding.gif_palette(source, args.start, args.end)
+
+    results = []
+    for name, filename, convert, options in contenders:
+        output = work_dir / filename
+        start = time.perf_counter()
+        convert(source, output, args.start, args.end, **options)
+        elapsed = time.perf_counter() - start
+        results.append((name, elapsed, output.stat().st_size))
+
+    print()
+    print(f"{'format':<22} {'time':>8} {'size':>10}")
+    for name, elapsed, size in results:
+        print(f"{name:<22} {elapsed:>7.2f}s {size / 1024:>7.0f} KiB")
+    print(f"\nWork directory: {work_dir}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+"""
+Compares fixed batch concurrency with the adaptive scheduler on a mixed workload.
+
+The workload is generated with ffmpeg's lavfi test sources so no sample media is
+needed: a few 4K clips encoded by encode_web_mp4 with the veryslow preset and
+many 480p clips that are only stream copied by trim_duration.
+
+Usage:
+    python benchmarks/bench_concurrency.py [work_dir] [--seconds N]
+"""
+
+import os
+import sys
+import time
+import argparse
+import tempfile
+import subprocess
+from functools import partial
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import lib.encoding as encoding
+import lib.scheduler as scheduler
+import lib.capabilities as capabilities
+
+
+def make_source(path, size, seconds):
+    task = [
+        str(encoding.FFMPEG_PATH),
+        "-y",
+        "-v",
+        "error",
+        "-f",
+        "lavfi",
+        "-i",
+        f"testsrc2=size={size}:rate=30:duration={seconds}",
+        "-f",
+        "lavfi",
+        "-i",
+        f"sine=frequency=440:duration={seconds}",
+        "-c:v",
+        "libx264",
+        "-preset",
+        "ultrafast",
+        "-c:a",
+        "aac",
+        "-shortest",
+        str(path),
+    ]
+    subprocess.run(task, check=True)
+
+
+def make_workload(work_dir, seconds):
+    sources = work_dir / "sources"
+    sources.mkdir(parents=True, exist_ok=True)
+    heavy = []
+    light = []
+    for index in range(3):
+        path = sources / f"uhd_{index}.mp4"
+        if not path.exists():
+            make_source(path, "3840x2160", seconds)
+        heavy.append(path)
+    for index in range(12):
+        path = sources / f"sd_{index}.mp4"
+        if not path.exists():
+            make_source(path, "854x480", seconds * 4)
+        light.append(path)
+    return heavy, light
+
+
+def jobs_for(heavy, light, output_dir):
+    output_dir.mkdir(parents=True, exist_ok=True)
+    jobs = []
+    # interleave so every scheduler sees the same mix over time
+    for index, path in enumerate(light):
+        jobs.append(
+            partial(
+                encoding.trim_duration,
+                "00:00:00",
+                "3600",
+                str(path),
+                str(output_dir / f"copy_{path.name}"),
+            )
+        )
+        if index % 4 == 0 and index // 4 < len(heavy):
+            source = heavy[index // 4]
+            jobs.append(
+                partial(
+                    encoding.encode_web_mp4, source, output_dir / f"web_{source.name}"
+                )
+            )
+    return jobs
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("work_dir", nargs="?", default=None)
+    parser.add_argument("--seconds", type=int, default=10)
+    args = parser.parse_args()
+
+    capabilities.configure()
+    work_dir = Path(args.work_dir or tempfile.mkdtemp(prefix="bench_concurrency_"))
+    heavy, light = make_workload(work_dir, args.seconds)
+    cpus = os.cpu_count() or 1
+
+    contenders = [("fixed 1", 1), ("fixed 2", 2)]
+    if cpus > 2:
+        contenders.append((f"fixed {cpus // 2}", cpus // 2))
+        contenders.append((f"fixed {cpus}", cpus))
+    contenders.append(("adaptive", "adaptive"))
+
+    results = []
+    for name, concurrency in contenders:
+        jobs = jobs_for(heavy, light, work_dir / name.replace(" ", "_"))
+        start = time.perf_counter()
+        scheduler.run_jobs(jobs, concurrency)
+        elapsed = time.perf_counter() - start
+        results.append((name, elapsed))
+        print(f"{name}: {elapsed:.1f}s")
+
+    best_fixed = min(elapsed for name, elapsed in results if name != "adaptive")
+    print()
+    print(f"{'scheduler':<12} {'wall time':>10} {'vs best fixed':>14}")
+    for name, elapsed in results:
+        print(f"{name:<12} {elapsed:>9.1f}s {best_fixed / elapsed:>13.2f}x")
+    print(f"\nWork directory: {work_dir}")
+
+
+if __name__ == "__main__":
+    main()
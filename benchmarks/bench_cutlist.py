@@ -0,0 +1,104 @@
+"""
+Measures cut list clipping with shared decodes against one decode per clip.
+
+The source is a 1080p lavfi test clip unless a video is given, the clips are
+--clips overlapping highlights of --length seconds every --step seconds, all
+re-encoded. "separate" runs one ffmpeg per clip (seek, decode, encode) like
+repeated trim calls, "grouped" lets lib/cutlist.py decode nearby clips once.
+
+Usage:
+    python benchmarks/bench_cutlist.py [video] [--clips 8] [--preset veryfast]
+"""
+
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+import subprocess
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import lib.encoding as encoding
+import lib.cutlist as cutlist
+import lib.capabilities as capabilities
+
+
+def make_source(path, seconds):
+    task = [
+        str(encoding.FFMPEG_PATH),
+        "-y",
+        "-v",
+        "error",
+        "-f",
+        "lavfi",
+        "-i",
+        f"testsrc2=size=1920x1080:rate=30:duration={seconds}",
+        "-f",
+        "lavfi",
+        "-i",
+        f"sine=frequency=440:duration={seconds}",
+        "-c:v",
+        "libx264",
+        "-preset",
+        "veryfast",
+        "-g",
+        "60",
+        "-c:a",
+        "aac",
+        str(path),
+    ]
+    subprocess.run(task, check=True)
+
+
+def timed_run(source, cuts, output_dir) -> float:
+    shutil.rmtree(output_dir, ignore_errors=True)
+    start = time.perf_counter()
+    cutlist.cut_clips(source, cuts, output_dir, concurrency=1)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("video", nargs="?", default=None)
+    parser.add_argument("--clips", type=int, default=8)
+    parser.add_argument("--length", type=float, default=8.0)
+    parser.add_argument("--step", type=float, default=5.0)
+    parser.add_argument("--preset", default="veryfast")
+    args = parser.parse_args()
+
+    capabilities.configure()
+
+    encoding.COMPRESSION_RATIO = args.preset
+    work_dir = Path(tempfile.mkdtemp(prefix="bench_cutlist_"))
+    source = args.video
+    if source is None:
+        source = work_dir / "source.mp4"
+        make_source(source, args.clips * args.step + args.length + 1)
+
+    cuts = [
+        cutlist.Cut(
+            1.3 + index * args.step,
+            1.3 + index * args.step + args.length,
+            f"highlight {index + 1}",
+            {"mode": "encode"},
+        )
+        for index in range(args.clips)
+    ]
+
+    max_outputs = cutlist.MAX_OUTPUTS_PER_DECODE
+    cutlist.MAX_OUTPUTS_PER_DECODE = 1
+    separate = timed_run(source, cuts, work_dir / "separate")
+    cutlist.MAX_OUTPUTS_PER_DECODE = max_outputs
+    grouped = timed_run(source, cuts, work_dir / "grouped")
+
+    print()
+    print(f"{args.clips} clips of {args.length:g}s, one every {args.step:g}s")
+    print(f"{'separate':<10} {separate:>7.2f}s")
+    print(f"{'grouped':<10} {grouped:>7.2f}s {separate / grouped:>6.2f}x")
+    print(f"\nWork directory: {work_dir}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""
+Times the duplicate search of lib/dedupe.py on synthetic fingerprints.
+
+Random 5 frame pHash fingerprints stand in for a library, a share of them are
+copied with a few flipped bits per frame (re-encodes), the search must find
+every planted pair.
+
+Usage:
+    python benchmarks/bench_dedupe.py [--files 50000] [--duplicates 500]
+"""
+
+import sys
+import time
+import argparse
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import numpy as np
+
+import lib.dedupe as dedupe
+import lib.capabilities as capabilities
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--files", type=int, default=50000)
+    parser.add_argument("--duplicates", type=int, default=500)
+    parser.add_argument("--flips", type=int, default=4, help="bits flipped per frame")
+    args = parser.parse_args()
+
+    capabilities.configure()
+
+    frames = len(dedupe.SAMPLE_POSITIONS)
+    rng = np.random.default_rng(1)
+    hashes = rng.integers(0, 2**64, size=(args.files, frames), dtype=np.uint64)
+    durations = rng.uniform(10, 3600, args.files)
+    rows = rng.permutation(args.files)
+    originals = rows[: args.duplicates]
+    copies = rows[args.duplicates : 2 * args.duplicates]
+    for original, copy in zip(originals, copies):
+        flipped = hashes[original].copy()
+        for word in range(frames):
+            for bit in rng.choice(64, rng.integers(0, args.flips + 1), replace=False):
+                flipped[word] ^= np.uint64(1) << np.uint64(bit)
+        hashes[copy] = flipped
+        durations[copy] = durations[original]
+
+    start = time.perf_counter()
+    pairs = dedupe.similar_pairs(hashes, dedupe.MAX_FRAME_DISTANCE * frames, durations)
+    elapsed = time.perf_counter() - start
+
+    expected = {
+        tuple(sorted(pair)) for pair in zip(originals.tolist(), copies.tolist())
+    }
+    found = {tuple(pair) for pair in pairs.tolist()}
+    print(f"{args.files} files, {args.duplicates} planted duplicates")
+    print(f"search      {elapsed:>7.2f}s")
+    print(f"found       {len(expected & found)} / {len(expected)}")
+    print(f"unexpected  {len(found - expected)}")
+
+
+if __name__ == "__main__":
+    main()
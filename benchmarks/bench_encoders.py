@@ -0,0 +1,132 @@
+"""
+Reports output size against encode speed for every encoder profile.
+
+Each sample video (a 1080p lavfi test clip when none is given) has its first
+--seconds encoded, video only, with every profile of lib/encoders.py (or the
+--profiles given). Profiles whose encoder is missing from the ffmpeg build
+(see lib/capabilities.py) are reported and skipped. Run it on one sample per
+channel to pick the cheapest profile that still looks right for each.
+
+Usage:
+    python benchmarks/bench_encoders.py [videos ...] [--seconds 20]
+        [--profiles x264-fast x265-fast av1-fast]
+"""
+
+import sys
+import time
+import argparse
+import tempfile
+import subprocess
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import lib.encoding as encoding
+import lib.encoders as encoders
+import lib.capabilities as capabilities
+
+
+def make_source(path, seconds):
+    task = [
+        str(encoding.FFMPEG_PATH),
+        "-y",
+        "-v",
+        "error",
+        "-f",
+        "lavfi",
+        "-i",
+        f"testsrc2=size=1920x1080:rate=30:duration={seconds}",
+        "-c:v",
+        "libx264",
+        "-preset",
+        "veryfast",
+        "-crf",
+        "16",
+        str(path),
+    ]
+    subprocess.run(task, check=True)
+
+
+def encode(source, output, profile, seconds) -> float:
+    """Encodes the first seconds of the source, returns the time or None."""
+    task = [
+        str(encoding.FFMPEG_PATH),
+        "-y",
+        "-v",
+        "error",
+        "-t",
+        str(seconds),
+        "-i",
+        str(source),
+        "-map",
+        "0:v:0",
+        *encoders.video_args(profile, output),
+        "-an",
+        str(output),
+    ]
+    start = time.perf_counter()
+    result = subprocess.run(task, stderr=subprocess.PIPE, text=True)
+    elapsed = time.perf_counter() - start
+    if result.returncode != 0:
+        error = result.stderr.strip().splitlines()
+        print(f"  {profile}: failed, {error[-1] if error else 'no output'}")
+        return None
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("videos", nargs="*")
+    parser.add_argument("--seconds", type=float, default=20.0)
+    parser.add_argument(
+        "--profiles", nargs="+", default=list(encoders.ENCODER_PROFILES)
+    )
+    args = parser.parse_args()
+
+    capabilities.configure()
+    print(capabilities.describe())
+    work_dir = Path(tempfile.mkdtemp(prefix="bench_encoders_"))
+    samples = [Path(video) for video in args.videos]
+    if not samples:
+        samples = [work_dir / "source.mp4"]
+        make_source(samples[0], args.seconds)
+
+    for sample in samples:
+        duration = args.seconds
+        if args.videos:
+            duration = min(duration, encoding.get_video_duration(sample) or duration)
+        print(f"\n{sample.name} (first {duration:g}s)")
+        print(f"{'profile':<15} {'seconds':>8} {'speed':>7} {'MB':>8} {'kb/s':>8}")
+        rows = []
+        for profile in args.profiles:
+            try:
+                usable = encoders.resolve(profile)
+            except RuntimeError as e:
+                print(f"  {profile}: skipped, {e}")
+                continue
+            if usable != profile:
+                print(f"  {profile}: skipped, measure {usable} instead")
+                continue
+            containers = encoders.get_profile(profile).get("containers")
+            extension = (
+                ".mkv" if not containers or ".mkv" in containers else containers[0]
+            )
+            output = work_dir / f"{sample.stem}_{profile}{extension}"
+            elapsed = encode(sample, output, profile, duration)
+            if elapsed is None:
+                continue
+            size = output.stat().st_size
+            rows.append((profile, elapsed, size))
+            print(
+                f"{profile:<15} {elapsed:>8.2f} {duration / elapsed:>6.2f}x "
+                f"{size / 1024 / 1024:>8.2f} {size * 8 / duration / 1000:>8.0f}"
+            )
+        if rows:
+            smallest = min(rows, key=lambda row: row[2])
+            fastest = min(rows, key=lambda row: row[1])
+            print(f"smallest: {smallest[0]}, fastest: {fastest[0]}")
+    print(f"\nWork directory: {work_dir}")
+
+
+if __name__ == "__main__":
+    main()
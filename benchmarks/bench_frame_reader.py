@@ -0,0 +1,93 @@
+"""
+Measures FrameReader throughput against ffmpeg decoding to a null output.
+
+The clip is a 1080p lavfi test source unless a video is given. "decode" is the
+speed ffmpeg reaches on its own, "reader" includes the rawvideo pipe and the
+copies into the NumPy ring, "batches" reads 32 frame batches.
+
+Usage:
+    python benchmarks/bench_frame_reader.py [video] [--width 640] [--pix-fmt gray]
+"""
+
+import sys
+import time
+import argparse
+import tempfile
+import subprocess
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import lib.encoding as encoding
+import lib.frame_reader as frame_reader
+import lib.capabilities as capabilities
+
+
+def make_source(path, seconds=10):
+    task = [
+        str(encoding.FFMPEG_PATH),
+        "-y",
+        "-v",
+        "error",
+        "-f",
+        "lavfi",
+        "-i",
+        f"testsrc2=size=1920x1080:rate=30:duration={seconds}",
+        "-c:v",
+        "libx264",
+        "-preset",
+        "veryfast",
+        str(path),
+    ]
+    subprocess.run(task, check=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("video", nargs="?", default=None)
+    parser.add_argument("--width", type=int, default=None)
+    parser.add_argument("--pix-fmt", default=frame_reader.PIXEL_FORMAT)
+    args = parser.parse_args()
+
+    capabilities.configure()
+
+    work_dir = Path(tempfile.mkdtemp(prefix="bench_frame_reader_"))
+    source = args.video
+    if source is None:
+        source = work_dir / "source.mp4"
+        make_source(source)
+
+    reader = frame_reader.FrameReader(
+        source, width=args.width, pixel_format=args.pix_fmt
+    )
+    reader_command = frame_reader.reader_command(
+        source, (reader.width, reader.height), args.pix_fmt
+    )
+    decode = [*reader_command[:-3], "-f", "null", "-"]
+    start = time.perf_counter()
+    subprocess.run(decode, check=True)
+    decode_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    frames = sum(1 for _ in reader)
+    reader_seconds = time.perf_counter() - start
+
+    reader.seek(0)
+    start = time.perf_counter()
+    batched = sum(len(batch) for batch in reader.batches(32))
+    batch_seconds = time.perf_counter() - start
+    reader.close()
+
+    print()
+    print(f"{reader.width}x{reader.height} {args.pix_fmt}, {frames} frames")
+    for name, count, seconds in [
+        ("decode", frames, decode_seconds),
+        ("reader", frames, reader_seconds),
+        ("batches", batched, batch_seconds),
+    ]:
+        print(f"{name:<10} {seconds:>7.2f}s {count / seconds:>8.1f} fps")
+    print(f"\nWork directory: {work_dir}")
+
+
+if __name__ == "__main__":
+    main()
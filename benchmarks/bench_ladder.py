@@ -0,0 +1,93 @@
+"""
+Measures an HLS ladder encoded from one decode against one decode per rendition.
+
+The source is a 1080p lavfi test clip unless a video is given. "separate" runs
+one ffmpeg per rendition of lib/ladder.py's LADDER (decode, scale, encode),
+"one decode" encodes the whole ladder in a single process from one split.
+
+Usage:
+    python benchmarks/bench_ladder.py [video] [--seconds 20] [--preset veryfast]
+"""
+
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+import subprocess
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import lib.encoding as encoding
+import lib.ladder as ladder
+import lib.capabilities as capabilities
+
+
+def make_source(path, seconds):
+    task = [
+        str(encoding.FFMPEG_PATH),
+        "-y",
+        "-v",
+        "error",
+        "-f",
+        "lavfi",
+        "-i",
+        f"testsrc2=size=1920x1080:rate=30:duration={seconds}",
+        "-f",
+        "lavfi",
+        "-i",
+        f"sine=frequency=440:duration={seconds}",
+        "-c:v",
+        "libx264",
+        "-preset",
+        "veryfast",
+        "-c:a",
+        "aac",
+        str(path),
+    ]
+    subprocess.run(task, check=True)
+
+
+def timed_run(task) -> float:
+    start = time.perf_counter()
+    encoding.run_ffmpeg(task, "bench_ladder", check=True)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("video", nargs="?", default=None)
+    parser.add_argument("--seconds", type=float, default=20.0)
+    parser.add_argument("--preset", default="veryfast")
+    parser.add_argument("--no-audio", action="store_true")
+    args = parser.parse_args()
+
+    capabilities.configure()
+
+    encoding.COMPRESSION_RATIO = args.preset
+    work_dir = Path(tempfile.mkdtemp(prefix="bench_ladder_"))
+    source = args.video
+    if source is None:
+        source = work_dir / "source.mp4"
+        make_source(source, args.seconds)
+    has_audio = not args.no_audio
+
+    separate = 0.0
+    for rung in ladder.LADDER:
+        output_dir = work_dir / f"separate_{rung[0]}"
+        shutil.rmtree(output_dir, ignore_errors=True)
+        separate += timed_run(ladder.hls_command(source, output_dir, [rung], has_audio))
+    one_decode = timed_run(
+        ladder.hls_command(source, work_dir / "one_decode", ladder.LADDER, has_audio)
+    )
+
+    print()
+    print(", ".join(f"{rung[0]}p" for rung in ladder.LADDER), f"({args.preset})")
+    print(f"{'separate':<11} {separate:>7.2f}s")
+    print(f"{'one decode':<11} {one_decode:>7.2f}s {separate / one_decode:>6.2f}x")
+    print(f"\nWork directory: {work_dir}")
+
+
+if __name__ == "__main__":
+    main()
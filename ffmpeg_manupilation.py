@@ -2,10 +2,13 @@ import sys
 from pathlib import Path
 from PySide6.QtWidgets import QApplication
 
+import lib.capabilities as capabilities
 import lib.video_window as video_window
 
 
 def main():
+    capabilities.configure()
+    print(capabilities.describe())
     app = QApplication(sys.argv)
     
     # Modern dark theme is now applied via stylesheet in VideoWindow
@@ -0,0 +1,728 @@
+# asyncio implementation of the lib.encoding operations, the synchronous
+# functions there are asyncio.run wrappers around these. The commands come
+# from the shared *_command builders. Probes run with
+# asyncio.create_subprocess_exec, ffmpeg jobs with metrics.run_measured_async
+# (reaped by wait4 in a worker thread for exact resource usage), so one event
+# loop can drive many probes and encodes; cancelling an operation terminates
+# its ffmpeg process.
+
+import os
+import json
+import uuid
+import asyncio
+import subprocess
+from shutil import copyfile
+from pathlib import Path
+
+import lib.encoding as encoding
+import lib.encoders as encoders
+import lib.capabilities as capabilities
+import lib.governor as governor
+import lib.metrics as metrics
+import lib.profiling as profiling
+import lib.progress as progress
+
+# -------------------------------------------------------------------------------
+# CONFIGURABLE SETTINGS
+# -------------------------------------------------------------------------------
+
+# probes running at once in probe_many, ffprobe is cheap but opens the file
+PROBE_CONCURRENCY = 32
+
+# encodes running at once in batch_encode
+ENCODE_CONCURRENCY = max(1, (os.cpu_count() or 1) // 2)
+# ==============================================================================
+
+
+async def _probe_output(command) -> bytes:
+    process = await asyncio.create_subprocess_exec(
+        *command, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL
+    )
+    try:
+        stdout, _ = await process.communicate()
+    except asyncio.CancelledError:
+        if process.returncode is None:
+            process.kill()
+            await process.wait()
+        raise
+    if process.returncode != 0:
+        raise subprocess.CalledProcessError(process.returncode, command, stdout)
+    return stdout
+
+
+async def run_ffmpeg(task, operation, check=False, profile=None, on_progress=None):
+    """
+    Runs an ffmpeg command and records its resource usage under an operation name.
+
+    Same as encoding.run_ffmpeg: the job class of the calling thread is applied
+    and -benchmark_all profiling is used when asked for.
+
+    Args:
+        task (list): ffmpeg command line.
+        operation (str): Name used to tag the job metrics.
+        check (bool): Raise CalledProcessError when ffmpeg fails.
+        profile (bool): Defaults to encoding.PROFILE_JOBS.
+        on_progress (callable): Called with the parse_stats dict of every stats
+            line, defaults to the calling thread's progress listener.
+
+    Returns:
+        subprocess.CompletedProcess
+    """
+    if profile is None:
+        profile = encoding.PROFILE_JOBS
+
+    profiler = None
+    annotate = None
+    if profile:
+        profiler = profiling.StageProfiler()
+        task = [task[0], "-benchmark_all", "-benchmark", *task[1:]]
+
+        def annotate(job):
+            job.stages = profiler.stages(job.wall_seconds)
+
+    if on_progress is None:
+        on_progress = progress.current_listener()
+    # the stats follower also gives the media duration of the job's output
+    stats = progress.StatsFollower(on_progress)
+    stderr_callback = progress.chain_callbacks(
+        profiler.feed if profiler else None, stats.feed
+    )
+
+    task, popen_kwargs, on_spawn = governor.govern(task)
+
+    result, job = await metrics.run_measured_async(
+        task,
+        operation,
+        media_duration=stats.media_duration,
+        stderr_callback=stderr_callback,
+        annotate=annotate,
+        on_spawn=on_spawn,
+        **popen_kwargs,
+    )
+    if profiler is not None:
+        print(profiling.format_breakdown(job))
+    if check:
+        result.check_returncode()
+    return result
+
+
+# -- probes -----------------------------------------------------------------
+
+
+async def get_video_duration(video_file) -> float:
+    try:
+        return float(await _probe_output(encoding.duration_command(video_file)))
+    except subprocess.CalledProcessError as e:
+        print(f"An error occurred while getting video duration: {e}")
+        return 0.0
+    except ValueError as e:
+        print(f"Could not convert duration to float: {e}")
+        return 0.0
+
+
+async def get_subtitle_format(input_file, subtitle_stream_index=0) -> str:
+    command = encoding.streams_command(input_file, f"s:{subtitle_stream_index}")
+    try:
+        return encoding.parse_subtitle_format(json.loads(await _probe_output(command)))
+    except (subprocess.CalledProcessError, IndexError, json.JSONDecodeError):
+        return None
+
+
+async def get_audio_tracks(input_file) -> list:
+    command = encoding.streams_command(input_file, "a")
+    try:
+        return encoding.parse_audio_tracks(json.loads(await _probe_output(command)))
+    except (subprocess.CalledProcessError, json.JSONDecodeError, KeyError) as e:
+        print(f"Error getting audio tracks: {e}")
+        return []
+
+
+async def get_subtitle_tracks(input_file) -> list:
+    command = encoding.streams_command(input_file, "s")
+    try:
+        return encoding.parse_subtitle_tracks(json.loads(await _probe_output(command)))
+    except (subprocess.CalledProcessError, json.JSONDecodeError, KeyError) as e:
+        print(f"Error getting subtitle tracks: {e}")
+        return []
+
+
+# -- operations -------------------------------------------------------------
+# the one implementation of the lib.encoding operations, the synchronous
+# functions there run these with asyncio.run and carry the documentation
+
+
+async def lossless_mp4(_input, _output, trim_start=None, trim_end=None, encoder="x264"):
+    task = encoding.lossless_mp4_command(_input, _output, trim_start, trim_end, encoder)
+
+    print("Processing lossless_mp4")
+    await run_ffmpeg(task, "lossless_mp4")
+    print("Process lossless_mp4 finished!")
+
+
+async def encode_web_mp4(
+    input_file,
+    output_file,
+    trim_start=None,
+    trim_end=None,
+    crop=None,
+    normalize=None,
+    encoder=None,
+):
+    # the crop and loudness analyses are blocking ffmpeg runs, off the loop
+    video_filter, audio_filter = await asyncio.to_thread(
+        encoding.resolve_filters,
+        input_file,
+        crop,
+        normalize,
+        trim_start,
+        trim_end,
+        encoding.WEB_MP4_WIDTH,
+    )
+    task = encoding.encode_web_mp4_command(
+        input_file,
+        output_file,
+        trim_start,
+        trim_end,
+        video_filter,
+        audio_filter,
+        encoder,
+    )
+
+    print("Processing encode_web_mp4")
+    try:
+        await run_ffmpeg(task, "encode_web_mp4", check=True)
+        print("Process encode_web_mp4 finished!")
+    except subprocess.CalledProcessError as e:
+        print(f"An error occurred: {e}")
+        raise
+
+
+async def extract_subtitle(_input, _output, subtitle_channel=0):
+    print(f"Extracting subtitle from {_input} at channel {subtitle_channel}")
+    _output = Path(_output)
+    task = encoding.extract_subtitle_command(_input, _output, subtitle_channel)
+    await run_ffmpeg(task, "extract_subtitle", check=True)
+    if _output.is_file():
+        print("Subtitle extracted!")
+        print(f"Subtitle saved at {_output.absolute().as_posix()}")
+        return _output.absolute().as_posix()
+    return None
+
+
+async def burn_subtitles(
+    _input, _output, _subtitle_path, trim_start=None, trim_end=None
+):
+    _subtitle_path = Path(_subtitle_path)
+    if not _subtitle_path.exists():
+        print(f"Error: Subtitle file not found: {_subtitle_path}")
+        return
+    # the subtitles filter needs an ffmpeg built with libass
+    capabilities.require(filters=["subtitles"], operation="burn_subtitles")
+
+    task = encoding.burn_subtitles_command(
+        _input, _output, _subtitle_path, trim_start, trim_end
+    )
+
+    print(f"Burning subtitles from: {_subtitle_path}")
+    print("Starting burn_subtitles")
+    try:
+        await run_ffmpeg(task, "burn_subtitles", check=True)
+        print("Subtitles burned!")
+    except subprocess.CalledProcessError as e:
+        print(f"Error burning subtitles: {e}")
+        raise
+
+
+async def gif_palette(_input, trim_start=None, trim_end=None, **settings) -> Path:
+    palette_path = encoding.gif_palette_path(_input, trim_start, trim_end, **settings)
+    if not palette_path.exists():
+        palette_path.parent.mkdir(parents=True, exist_ok=True)
+        temp_path = palette_path.with_name(
+            f"{palette_path.stem}.{uuid.uuid4().hex}.png"
+        )
+        task = encoding.gif_palette_command(
+            _input, temp_path, trim_start, trim_end, **settings
+        )
+        await run_ffmpeg(task, "gif_palette", check=True)
+        os.replace(temp_path, palette_path)
+    return palette_path
+
+
+async def to_gif(
+    _input,
+    _output,
+    trim_start=None,
+    trim_end=None,
+    fps=None,
+    width=None,
+    colors=None,
+    dither=None,
+    cache_palette=True,
+):
+    if _output:
+        settings = encoding.gif_settings(fps, width, colors, dither)
+        palette = None
+        palette_path = None
+        temp_path = None
+        if cache_palette:
+            palette_path = encoding.gif_palette_path(
+                _input, trim_start, trim_end, **settings
+            )
+            if palette_path.exists():
+                palette = palette_path
+            else:
+                # generated with the gif in one pass and kept for the next run
+                palette_path.parent.mkdir(parents=True, exist_ok=True)
+                temp_path = palette_path.with_name(
+                    f"{palette_path.stem}.{uuid.uuid4().hex}.png"
+                )
+        print("Starting gif conversion")
+        try:
+            task = encoding.to_gif_command(
+                _input, _output, trim_start, trim_end, palette, temp_path, **settings
+            )
+            await run_ffmpeg(task, "to_gif", check=True)
+            if temp_path is not None:
+                os.replace(temp_path, palette_path)
+            print("Gif conversion done!")
+        except subprocess.CalledProcessError as e:
+            print(f"Error during gif conversion: {e}")
+            raise
+        finally:
+            if temp_path is not None and temp_path.exists():
+                os.remove(temp_path)
+
+
+async def to_webp(
+    _input,
+    _output,
+    trim_start=None,
+    trim_end=None,
+    fps=None,
+    width=None,
+    quality=None,
+    lossless=None,
+):
+    if _output:
+        task = encoding.to_webp_command(
+            _input, _output, trim_start, trim_end, fps, width, quality, lossless
+        )
+        print("Starting webp conversion")
+        try:
+            await run_ffmpeg(task, "to_webp", check=True)
+            print("Webp conversion done!")
+        except subprocess.CalledProcessError as e:
+            print(f"Error during webp conversion: {e}")
+            raise
+
+
+async def to_apng(
+    _input, _output, trim_start=None, trim_end=None, fps=None, width=None
+):
+    if _output:
+        task = encoding.to_apng_command(
+            _input, _output, trim_start, trim_end, fps, width
+        )
+        print("Starting apng conversion")
+        try:
+            await run_ffmpeg(task, "to_apng", check=True)
+            print("Apng conversion done!")
+        except subprocess.CalledProcessError as e:
+            print(f"Error during apng conversion: {e}")
+            raise
+
+
+async def gif_to_mp4(_input, _output):
+    if _output:
+        task = encoding.gif_to_mp4_command(_input, _output)
+        print("Starting gif_to_mp4")
+        await run_ffmpeg(task, "gif_to_mp4")
+        print("gif_to_mp4 done!")
+
+
+async def loop_video(
+    _input, _output, _number_of_loops, _gif_flag=False, trim_start=None, trim_end=None
+):
+    task = encoding.loop_video_command(
+        _input, _output, _number_of_loops, trim_start, trim_end
+    )
+
+    print("Starting loop_video")
+    await run_ffmpeg(task, "loop_video")
+    print("loop_video done!")
+    if _gif_flag:
+        os.remove(_input)
+
+
+async def video_to_frames(input_file, output_dir, trim_start=None, trim_end=None):
+    encoding.check_directory_exists(output_dir)
+    task = encoding.video_to_frames_command(
+        input_file, output_dir, trim_start, trim_end
+    )
+
+    print("Starting video_to_frames")
+    try:
+        await run_ffmpeg(task, "video_to_frames", check=True)
+        print("video_to_frames done!")
+    except subprocess.CalledProcessError as e:
+        print(f"Error during frame extraction: {e}")
+        raise
+
+
+async def trim_basic(
+    _start, _end, _video_input, _output, video_channel=0, audio_channel=0
+):
+    task = encoding.trim_basic_command(
+        _start, _end, _video_input, _output, video_channel, audio_channel
+    )
+
+    print("Processing trim basic...")
+    await run_ffmpeg(task, "trim_basic")
+    print("Trim basic done!")
+
+
+async def trim_with_hard_subs(
+    _start,
+    _end,
+    _video_input,
+    _output,
+    video_channel=0,
+    audio_channel=0,
+    subtitles_channel=0,
+    subtitles_path=None,
+    crop=None,
+):
+    capabilities.require(filters=["subtitles"], operation="trim_with_hard_subs")
+    temp_subtitle = encoding.hard_subs_temp_subtitle(_output)
+
+    if not subtitles_path:
+        # internal subs
+        await extract_subtitle(
+            _video_input, temp_subtitle.absolute().as_posix(), subtitles_channel
+        )
+    else:
+        # external subs
+        copyfile(subtitles_path, temp_subtitle.absolute().as_posix())
+
+    try:
+        crop_filter = await asyncio.to_thread(encoding.resolve_crop, _video_input, crop)
+        task = encoding.trim_with_hard_subs_command(
+            _start,
+            _end,
+            _video_input,
+            _output,
+            temp_subtitle,
+            video_channel,
+            audio_channel,
+            crop_filter,
+        )
+
+        print("Processing trim with hard subs")
+        await run_ffmpeg(task, "trim_with_hard_subs", check=True)
+    finally:
+        if temp_subtitle.exists():
+            os.remove(temp_subtitle)
+    print("Trim with hard subs done!")
+
+
+async def trim_duration(
+    start,
+    duration,
+    input_file,
+    output_file,
+    video_channel=0,
+    audio_channel=0,
+    subtitle_channel=0,
+):
+    task = encoding.trim_duration_command(
+        start,
+        duration,
+        input_file,
+        output_file,
+        video_channel,
+        audio_channel,
+        subtitle_channel,
+    )
+
+    print("Starting trim_duration")
+    await run_ffmpeg(task, "trim_duration", check=True)
+    print("trim_duration done!")
+
+
+async def fade(input_file, output_file, video_duration):
+    task = encoding.fade_command(input_file, output_file, video_duration)
+
+    print("Starting fade effect")
+    try:
+        await run_ffmpeg(task, "fade", check=True)
+        print("Fade effect applied successfully to both video and audio.")
+    except subprocess.CalledProcessError as e:
+        print(f"An error occurred during the fade effect: {e}")
+        raise
+
+
+async def convert_3gp_to_mp4(input_file, output_file, encoder="x264"):
+    task = encoding.convert_3gp_to_mp4_command(input_file, output_file, encoder)
+
+    try:
+        await run_ffmpeg(task, "convert_3gp_to_mp4", check=True)
+        print(f"Conversion successful. {input_file} converted to {output_file}")
+    except subprocess.CalledProcessError as e:
+        print(f"Error during conversion: {e}")
+
+
+async def extract_audio(
+    _input, _output, trim_start=None, trim_end=None, normalize=None
+):
+    audio_filter = await asyncio.to_thread(
+        encoding.resolve_normalize, _input, normalize, trim_start, trim_end
+    )
+    task = encoding.extract_audio_command(
+        _input, _output, trim_start, trim_end, audio_filter
+    )
+
+    print("Starting audio extraction...")
+    try:
+        await run_ffmpeg(task, "extract_audio", check=True)
+        print("Audio extraction complete!")
+    except subprocess.CalledProcessError as e:
+        print(f"Error during audio extraction: {e}")
+        raise
+
+
+async def still_clip(image_path, encoder=None) -> Path:
+    clip_path = encoding.still_clip_path(image_path, encoder)
+    if not clip_path.exists():
+        clip_path.parent.mkdir(parents=True, exist_ok=True)
+        temp_path = clip_path.with_name(f"{clip_path.stem}.{uuid.uuid4().hex}.mp4")
+        task = encoding.still_clip_command(image_path, temp_path, encoder)
+        await run_ffmpeg(task, "still_clip", check=True)
+        os.replace(temp_path, clip_path)
+    return clip_path
+
+
+async def audio_codec(audio_path) -> str:
+    try:
+        data = json.loads(
+            await _probe_output(encoding.streams_command(audio_path, "a:0"))
+        )
+    except (subprocess.CalledProcessError, ValueError):
+        return None
+    return encoding.parse_audio_codec(data)
+
+
+async def can_copy_audio(audio_path, output_path) -> bool:
+    codecs = encoding.COPYABLE_AUDIO.get(Path(output_path).suffix.lower(), [])
+    return await audio_codec(audio_path) in codecs
+
+
+async def image_audio_to_video(
+    image_path, audio_path, output_path, fast=True, encoder=None
+):
+    # an encoder missing from the ffmpeg build fails here, not after the probe
+    encoder = encoders.resolve(encoder or encoding.WEB_ENCODER)
+    audio_duration = await get_video_duration(audio_path)
+
+    if audio_duration <= 0:
+        print("Error: Could not determine audio duration")
+        return
+
+    print(f"Creating video from image: {image_path}")
+    print(f"Audio file: {audio_path}")
+    print(f"Output: {output_path}")
+    print(f"Duration: {audio_duration:.2f} seconds")
+
+    try:
+        if fast:
+            task = encoding.still_audio_mux_command(
+                await still_clip(image_path, encoder),
+                audio_path,
+                output_path,
+                await can_copy_audio(audio_path, output_path),
+            )
+        else:
+            task = encoding.image_audio_to_video_command(
+                image_path, audio_path, output_path, encoder
+            )
+        await run_ffmpeg(task, "image_audio_to_video", check=True)
+        print("Image + Audio to Video conversion complete!")
+    except subprocess.CalledProcessError as e:
+        print(f"Error during image+audio to video conversion: {e}")
+        raise
+
+
+async def trim_preset_new(
+    video_path,
+    subtitles_path,
+    output_path,
+    trim_start,
+    trim_end,
+    subtitles_status,
+    audio_channel=0,
+    subtitles_channel=0,
+    crop=None,
+    normalize=None,
+    encoder=None,
+):
+    """The temporary files are removed even when the task is cancelled."""
+    video_path = Path(video_path)
+    subtitles_path = Path(subtitles_path)
+    output_path = Path(output_path)
+    output_base_path = output_path.parent
+
+    # Temporary files
+    temp_trim_output = output_base_path / f"basic_{video_path.name}"
+    temp_duration_output = output_base_path / f"duration_{video_path.name}"
+    temp_encoded_output = output_base_path / f"encoded_{output_path.name}"
+    print(f"{temp_trim_output=}")
+    print(f"{temp_duration_output=}")
+    print(f"{temp_encoded_output=}")
+
+    # fail before the first step rather than at the encode
+    encoder = encoders.resolve(encoder or encoding.WEB_ENCODER)
+    capabilities.require(filters=["subtitles"], operation="trim_preset_new")
+
+    # the loudness of the source range is measured while the first step runs
+    audio_filter = asyncio.ensure_future(
+        asyncio.to_thread(
+            encoding.resolve_normalize,
+            video_path,
+            normalize,
+            trim_start,
+            trim_end,
+            audio_channel,
+        )
+    )
+
+    try:
+        # Trim with hard subtitles if required
+        if "external" in subtitles_status:
+            await trim_with_hard_subs(
+                trim_start,
+                trim_end,
+                str(video_path),
+                str(temp_trim_output),
+                subtitles_path=str(subtitles_path),
+                audio_channel=audio_channel,
+                crop=crop,
+            )
+        else:
+            await trim_with_hard_subs(
+                trim_start,
+                trim_end,
+                str(video_path),
+                str(temp_trim_output),
+                audio_channel=audio_channel,
+                subtitles_channel=subtitles_channel,
+                crop=crop,
+            )
+
+        video_duration = encoding.calculate_duration(trim_end, trim_start)
+        await trim_duration(
+            "00:00:00",
+            video_duration,
+            str(temp_trim_output),
+            str(temp_duration_output),
+        )
+
+        # already cropped, normalised with the measurement of the source range
+        await encode_web_mp4(
+            temp_duration_output,
+            temp_encoded_output,
+            crop=False,
+            normalize=await audio_filter or False,
+            encoder=encoder,
+        )
+
+        video_duration_seconds = int(await get_video_duration(temp_encoded_output))
+        output_cleaned = encoding.clean_text(str(output_path))
+        await fade(str(temp_encoded_output), output_cleaned, video_duration_seconds)
+    finally:
+        audio_filter.cancel()
+        print("Cleaning up temporary files...")
+        for temp_file in [temp_trim_output, temp_duration_output, temp_encoded_output]:
+            if temp_file.exists():
+                temp_file.unlink()
+
+    print("All Done!")
+
+
+# -- batches ----------------------------------------------------------------
+
+
+async def gather_limited(coroutines, limit, return_exceptions=False) -> list:
+    """
+    asyncio.gather with at most limit coroutines running at once.
+
+    Args:
+        coroutines: Iterable of coroutines (not yet awaited).
+        limit (int): Maximum number running at once.
+        return_exceptions (bool): Same as for asyncio.gather.
+
+    Returns:
+        list: Results in the order of the coroutines.
+    """
+    semaphore = asyncio.Semaphore(max(1, limit))
+
+    async def limited(coroutine):
+        async with semaphore:
+            return await coroutine
+
+    return await asyncio.gather(
+        *(limited(coroutine) for coroutine in coroutines),
+        return_exceptions=return_exceptions,
+    )
+
+
+async def probe_many(files, probe=get_video_duration, limit=None) -> dict:
+    """
+    Runs a probe (e.g. get_audio_tracks) on many files concurrently.
+
+    Returns:
+        dict: file -> probe result.
+    """
+    files = list(files)
+    results = await gather_limited(
+        (probe(file) for file in files), limit or PROBE_CONCURRENCY
+    )
+    return dict(zip(files, results))
+
+
+async def batch_encode(
+    _media_folder,
+    limit=None,
+    skip_duplicates=False,
+    crop=None,
+    normalize=None,
+    encoder=None,
+) -> list:
+    """
+    Same as encoding.batch_encode with at most limit encodes running at once
+    instead of the adaptive scheduler.
+
+    Returns:
+        list: One entry per video, None or the exception it failed with.
+    """
+    # an encoder missing from the ffmpeg build fails here, not in the jobs
+    encoder = encoders.resolve(encoder or encoding.WEB_ENCODER)
+    jobs = await asyncio.to_thread(
+        encoding.batch_encode_jobs, _media_folder, skip_duplicates, normalize
+    )
+    # the tasks gather creates copy this context, so only they are background
+    with governor.job_class("background"):
+        results = await gather_limited(
+            (
+                encode_web_mp4(
+                    input_file,
+                    output_file,
+                    crop=crop,
+                    normalize=normalize,
+                    encoder=encoder,
+                )
+                for input_file, output_file in jobs
+            ),
+            limit or ENCODE_CONCURRENCY,
+            return_exceptions=True,
+        )
+    print("Encoding done!")
+    return results
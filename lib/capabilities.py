@@ -0,0 +1,203 @@
+import os
+import re
+import json
+import uuid
+import shutil
+import threading
+import subprocess
+from pathlib import Path
+
+import lib.encoding as encoding
+
+# -------------------------------------------------------------------------------
+# CONFIGURABLE SETTINGS
+# -------------------------------------------------------------------------------
+
+# seconds a capability query may take before ffmpeg is considered broken
+QUERY_TIMEOUT = 30
+
+CAPABILITIES_CACHE_DIR = encoding.CACHE_DIR / "capabilities"
+# ==============================================================================
+
+_ENCODER_LINE = re.compile(r"^\s*[VAS][.F][.S][.X][.B][.D]\s+(\S+)")
+_FILTER_LINE = re.compile(r"^\s*[T.][S.][C.]\s+(\S+)\s+\S*->\S*")
+
+_capabilities = {}
+_capabilities_lock = threading.Lock()
+
+
+def configure() -> bool:
+    """
+    Looks for ffmpeg and ffprobe again (see encoding.locate, run once on import)
+    after the settings or the environment changed, and reports the missing ones.
+
+    Returns:
+        bool: True if both were found.
+    """
+    ffmpeg_path = encoding.locate("ffmpeg", encoding.FFMPEG_PATH)
+    ffprobe_path = encoding.locate("ffprobe", encoding.FFPROBE_PATH)
+    if ffmpeg_path:
+        encoding.FFMPEG_PATH = ffmpeg_path
+    else:
+        print(
+            f"ffmpeg not found at {encoding.FFMPEG_PATH}, "
+            f"${encoding.FFMPEG_ENV} or PATH"
+        )
+    if ffprobe_path:
+        encoding.FFPROBE_PATH = ffprobe_path
+    else:
+        print(
+            f"ffprobe not found at {encoding.FFPROBE_PATH}, "
+            f"${encoding.FFPROBE_ENV} or PATH"
+        )
+    return bool(ffmpeg_path and ffprobe_path)
+
+
+def _query(ffmpeg_path, option) -> list:
+    result = subprocess.run(
+        [str(ffmpeg_path), "-hide_banner", option],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,
+        text=True,
+        errors="replace",
+        timeout=QUERY_TIMEOUT,
+    )
+    return result.stdout.splitlines()
+
+
+def parse_encoders(lines) -> list:
+    return [match[1] for match in map(_ENCODER_LINE.match, lines) if match]
+
+
+def parse_filters(lines) -> list:
+    return [match[1] for match in map(_FILTER_LINE.match, lines) if match]
+
+
+def parse_hwaccels(lines) -> list:
+    return [
+        line.strip()
+        for line in lines
+        if line.strip() and not line.startswith("Hardware acceleration")
+    ]
+
+
+def probe(ffmpeg_path) -> dict:
+    """Asks an ffmpeg binary for its version, encoders, filters and hwaccels."""
+    version = _query(ffmpeg_path, "-version")
+    return {
+        "path": str(ffmpeg_path),
+        "version": version[0].split(" Copyright")[0].strip() if version else "",
+        "encoders": parse_encoders(_query(ffmpeg_path, "-encoders")),
+        "filters": parse_filters(_query(ffmpeg_path, "-filters")),
+        "hwaccels": parse_hwaccels(_query(ffmpeg_path, "-hwaccels")),
+    }
+
+
+def capabilities_cache_path(ffmpeg_path) -> Path:
+    return CAPABILITIES_CACHE_DIR / (encoding.cache_key(ffmpeg_path) + ".json")
+
+
+def get_capabilities(ffmpeg_path=None) -> dict:
+    """
+    What the ffmpeg in use can do, queried once per binary: kept in memory and
+    cached on disk by path, size and modification time, so an updated ffmpeg
+    is queried again.
+
+    Returns:
+        dict: "path", "version" (first -version line), "encoders", "filters"
+              and "hwaccels" lists, None when ffmpeg cannot be found or run.
+    """
+    ffmpeg_path = shutil.which(str(ffmpeg_path or encoding.FFMPEG_PATH))
+    if ffmpeg_path is None:
+        return None
+    with _capabilities_lock:
+        key = str(ffmpeg_path)
+        if key in _capabilities:
+            return _capabilities[key]
+
+        cache_path = capabilities_cache_path(ffmpeg_path)
+        if cache_path.exists():
+            # a truncated or unreadable cache is queried again and rewritten
+            try:
+                with open(cache_path, encoding="utf-8") as cache_file:
+                    cached = json.load(cache_file)
+            except (OSError, ValueError) as e:
+                print(f"Ignoring the capabilities cache {cache_path}: {e}")
+            else:
+                if isinstance(cached, dict) and cached.get("encoders"):
+                    _capabilities[key] = cached
+                    return cached
+
+        try:
+            found = probe(ffmpeg_path)
+        except (OSError, subprocess.SubprocessError) as e:
+            print(f"Could not query {ffmpeg_path}: {e}")
+            return None
+        if not found["encoders"]:
+            print(f"{ffmpeg_path} listed no encoders")
+            return None
+        cache_path.parent.mkdir(parents=True, exist_ok=True)
+        temp_path = cache_path.with_name(f"{cache_path.stem}.{uuid.uuid4().hex}.json")
+        with open(temp_path, "w", encoding="utf-8") as cache_file:
+            json.dump(found, cache_file)
+        os.replace(temp_path, cache_path)
+        _capabilities[key] = found
+        return found
+
+
+def has_encoder(name) -> bool:
+    found = get_capabilities()
+    return bool(found) and name in found["encoders"]
+
+
+def has_filter(name) -> bool:
+    found = get_capabilities()
+    return bool(found) and name in found["filters"]
+
+
+def has_hwaccel(name) -> bool:
+    found = get_capabilities()
+    return bool(found) and name in found["hwaccels"]
+
+
+def pick_encoder(candidates) -> str:
+    """
+    The first of the candidates, fastest first, the ffmpeg build has. The
+    first one when ffmpeg cannot be queried (the job reports the error).
+    """
+    if get_capabilities() is None:
+        return candidates[0]
+    return next((name for name in candidates if has_encoder(name)), None)
+
+
+def require(encoders=(), filters=(), operation=None) -> None:
+    """
+    Raises RuntimeError before a job starts when ffmpeg is missing or lacks
+    one of the encoders or filters it needs.
+    """
+    found = get_capabilities()
+    label = f"{operation}: " if operation else ""
+    if found is None:
+        raise RuntimeError(
+            f"{label}ffmpeg not found at {encoding.FFMPEG_PATH}, "
+            f"${encoding.FFMPEG_ENV} or PATH"
+        )
+    missing = [name for name in encoders if name not in found["encoders"]]
+    missing += [f"{name} filter" for name in filters if name not in found["filters"]]
+    if missing:
+        raise RuntimeError(
+            f"{label}{found['path']} has no {', '.join(missing)} "
+            f"({found['version']})"
+        )
+
+
+def describe() -> str:
+    """One line summary of the ffmpeg in use."""
+    found = get_capabilities()
+    if found is None:
+        return "ffmpeg not found"
+    return (
+        f"{found['version']} at {found['path']}: {len(found['encoders'])} "
+        f"encoders, {len(found['filters'])} filters, hwaccels: "
+        f"{', '.join(found['hwaccels']) or 'none'}"
+    )
@@ -0,0 +1,218 @@
+import os
+import re
+import json
+import uuid
+import subprocess
+from pathlib import Path
+
+import lib.encoding as encoding
+
+# -------------------------------------------------------------------------------
+# CONFIGURABLE SETTINGS
+# -------------------------------------------------------------------------------
+
+# segments decoded across the video, each one is seeked to, not decoded to
+CROP_SAMPLES = 6
+CROP_SEGMENT_SECONDS = 2
+
+# luma (0-255) under which a row or column counts as black
+CROP_LIMIT = 24
+
+# crop only when it removes at least this share of the pixels
+MIN_CROP_SAVING = 0.03
+
+CROP_CACHE_DIR = encoding.CACHE_DIR / "crop"
+# ==============================================================================
+
+_CROP_LINE = re.compile(
+    r"Parsed_cropdetect_(\d+).* x1:(-?\d+) x2:(-?\d+) y1:(-?\d+) y2:(-?\d+) "
+)
+_VIDEO_SIZE = re.compile(r"Stream #0:\d+.*: Video: .*?, (\d+)x(\d+)")
+
+
+def sample_starts(duration) -> list:
+    """Start times of the CROP_SAMPLES segments, away from intros and credits."""
+    if not duration or duration <= CROP_SEGMENT_SECONDS * CROP_SAMPLES:
+        return [0.0]
+    usable = duration * 0.9 - CROP_SEGMENT_SECONDS
+    return [
+        duration * 0.05 + usable * index / max(1, CROP_SAMPLES - 1)
+        for index in range(CROP_SAMPLES)
+    ]
+
+
+def cropdetect_command(input_file, starts) -> list:
+    """
+    Runs cropdetect over short segments: every start is its own input seeked
+    with -ss, so only CROP_SEGMENT_SECONDS per segment are decoded.
+    """
+    task = [str(encoding.FFMPEG_PATH), "-nostdin"]
+    graph = []
+    for index, start in enumerate(starts):
+        task.extend(
+            ["-ss", f"{start:.3f}", "-t", str(CROP_SEGMENT_SECONDS)]
+            + ["-i", str(input_file)]
+        )
+        # cropdetect never resets, its last line is the segment's largest area
+        graph.append(
+            f"[{index}:v:0]cropdetect=limit={CROP_LIMIT}:round=2:reset=0[c{index}]"
+        )
+    labels = "".join(f"[c{index}]" for index in range(len(starts)))
+    graph.append(f"{labels}concat=n={len(starts)}:v=1:a=0[out]")
+    task.extend(
+        ["-filter_complex", ";".join(graph), "-map", "[out]", "-f", "null", "-"]
+    )
+    return task
+
+
+def aggregate_crop(boxes, size):
+    """
+    Combines the per segment boxes (x1, x2, y1, y2) into one crop (w, h, x, y).
+
+    The union of the segments is kept so a bright scene is never cut, segments
+    that were black or nearly black are ignored. Returns None when the crop
+    would save less than MIN_CROP_SAVING.
+    """
+    width, height = size
+    boxes = [
+        box
+        for box in boxes
+        if box[1] > box[0]
+        and box[3] > box[2]
+        and (box[1] - box[0] + 1) * (box[3] - box[2] + 1) >= width * height / 4
+    ]
+    if not boxes:
+        return None
+    x1 = max(0, min(box[0] for box in boxes))
+    x2 = min(width - 1, max(box[1] for box in boxes))
+    y1 = max(0, min(box[2] for box in boxes))
+    y2 = min(height - 1, max(box[3] for box in boxes))
+    # even sizes and offsets for 4:2:0 chroma
+    x = x1 + x1 % 2
+    y = y1 + y1 % 2
+    crop_width = (x2 + 1 - x) // 2 * 2
+    crop_height = (y2 + 1 - y) // 2 * 2
+    if crop_width * crop_height > width * height * (1 - MIN_CROP_SAVING):
+        return None
+    return crop_width, crop_height, x, y
+
+
+def detect_crop(input_file, duration=None):
+    """
+    Finds the black bars of a video.
+
+    Args:
+        input_file: Path to the video.
+        duration (float): Duration in seconds, probed when not given.
+
+    Returns:
+        tuple: ((width, height, x, y) of the picture or None when there is
+               nothing worth cropping, (width, height) of the source).
+    """
+    if duration is None:
+        duration = encoding.get_video_duration(input_file)
+    boxes = {}
+    size = []
+
+    def on_line(line):
+        match = _CROP_LINE.search(line)
+        if match:
+            index, *box = (int(value) for value in match.groups())
+            boxes[index] = box
+            return True
+        if not size:
+            match = _VIDEO_SIZE.search(line)
+            if match:
+                size.extend(int(value) for value in match.groups())
+        return False
+
+    encoding.run_ffmpeg(
+        cropdetect_command(input_file, sample_starts(duration)),
+        "crop_detect",
+        check=True,
+        stderr_callback=on_line,
+    )
+    if not size:
+        return None, None
+    return aggregate_crop(list(boxes.values()), size), tuple(size)
+
+
+def crop_cache_path(input_file) -> Path:
+    return CROP_CACHE_DIR / (
+        encoding.cache_key(
+            input_file,
+            samples=CROP_SAMPLES,
+            segment=CROP_SEGMENT_SECONDS,
+            limit=CROP_LIMIT,
+            saving=MIN_CROP_SAVING,
+        )
+        + ".json"
+    )
+
+
+def _cached_detection(input_file) -> dict:
+    """detect_crop, cached per file (see encoding.cache_key)."""
+    cache_path = crop_cache_path(input_file)
+    if cache_path.exists():
+        with open(cache_path, encoding="utf-8") as cache_file:
+            return json.load(cache_file)
+
+    print(f"Detecting black bars of {input_file}")
+    crop, size = detect_crop(input_file)
+    result = {"source": str(input_file), "crop": crop, "size": size}
+    cache_path.parent.mkdir(parents=True, exist_ok=True)
+    temp_path = cache_path.with_name(f"{cache_path.stem}.{uuid.uuid4().hex}.json")
+    with open(temp_path, "w", encoding="utf-8") as cache_file:
+        json.dump(result, cache_file)
+    os.replace(temp_path, cache_path)
+    print(f"Crop of {input_file}: {crop_filter(crop) or 'none'}")
+    return result
+
+
+def get_crop(input_file):
+    """Returns the cached (width, height, x, y) crop of a video, None for none."""
+    crop = _cached_detection(input_file)["crop"]
+    return tuple(crop) if crop else None
+
+
+def scaled_crop_filter(input_file, scale_width) -> str:
+    """
+    Crop followed by the scale the full frame would have had: a 1920 wide
+    source scaled to 1280 keeps the 2/3 factor, so the picture is not
+    enlarged and the encode gets the bars' share fewer pixels.
+    """
+    detection = _cached_detection(input_file)
+    if not detection["crop"]:
+        return None
+    crop_width = detection["crop"][0]
+    source_width = detection["size"][0]
+    width = max(2, round(scale_width * crop_width / source_width / 2) * 2)
+    return f"{crop_filter(detection['crop'])},scale={width}:-2"
+
+
+def video_width(input_file) -> int:
+    """Width of the first video stream, None when it cannot be probed."""
+    result = subprocess.run(
+        encoding.streams_command(input_file, "v:0"),
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        return int(json.loads(result.stdout)["streams"][0]["width"])
+    except (ValueError, KeyError, IndexError):
+        return None
+
+
+def crop_scale_filter(source_width, scale_width) -> str:
+    """
+    scale filter following any crop of a source_width wide video, keeping
+    the factor the full frame would be scaled by to reach scale_width.
+    """
+    return f"scale=round(iw*{scale_width}/{source_width}/2)*2:-2"
+
+
+def crop_filter(crop) -> str:
+    """crop filter of a (width, height, x, y) crop, None for no crop."""
+    if not crop:
+        return None
+    return "crop={}:{}:{}:{}".format(*crop)
@@ -0,0 +1,472 @@
+import re
+import csv
+import json
+import argparse
+import subprocess
+from dataclasses import dataclass, field
+from functools import partial
+from pathlib import Path
+
+import lib.encoding as encoding
+import lib.encoders as encoders
+import lib.capabilities as capabilities
+import lib.scheduler as scheduler
+
+# -------------------------------------------------------------------------------
+# CONFIGURABLE SETTINGS
+# -------------------------------------------------------------------------------
+
+# re-encoded clips closer than this (seconds) share one decode of the source
+CUT_GROUP_GAP_SECONDS = 30
+
+# outputs written by one shared decode at most
+MAX_OUTPUTS_PER_DECODE = 8
+
+# a clip starting this close (seconds) to a keyframe is stream copied from it
+KEYFRAME_TOLERANCE = 0.05
+
+# frame rate of the timecodes in EDL files
+EDL_FPS = 25
+# ==============================================================================
+
+# clip options read from the lists, everything else is ignored
+#   mode: "auto" (copy when keyframe aligned), "copy" (from the keyframe at or
+#         before the start) or "encode"
+#   width: scale re-encoded clips to this width
+CUT_MODES = ["auto", "copy", "encode"]
+
+_EDL_EVENT = re.compile(
+    r"^\d+\s+\S+\s+\S+\s+\S+\s+(?:\d+\s+)?"
+    r"(\d\d:\d\d:\d\d[:;]\d\d)\s+(\d\d:\d\d:\d\d[:;]\d\d)\s+"
+    r"\d\d:\d\d:\d\d[:;]\d\d\s+\d\d:\d\d:\d\d[:;]\d\d"
+)
+_EDL_NAME = re.compile(r"^\*\s*FROM CLIP NAME:\s*(.+)$", re.IGNORECASE)
+
+
+@dataclass
+class Cut:
+    start: float
+    end: float
+    name: str = ""
+    options: dict = field(default_factory=dict)
+
+    @property
+    def mode(self) -> str:
+        return self.options.get("mode") or "auto"
+
+    @property
+    def width(self) -> int:
+        width = self.options.get("width")
+        return int(width) if width else None
+
+
+def parse_time(value, fps=None) -> float:
+    """Seconds of "HH:MM:SS(.ms)", "MM:SS", "HH:MM:SS:FF" (timecode) or 12.5."""
+    if isinstance(value, (int, float)):
+        return float(value)
+    parts = str(value).strip().replace(";", ":").split(":")
+    if len(parts) == 4:
+        hours, minutes, seconds, frames = (int(part) for part in parts)
+        return hours * 3600 + minutes * 60 + seconds + frames / (fps or EDL_FPS)
+    seconds = 0.0
+    for part in parts:
+        seconds = seconds * 60 + float(part)
+    return seconds
+
+
+def _cut_from_fields(fields, index) -> Cut:
+    fields = {str(key).strip().lower(): value for key, value in fields.items()}
+    options = dict(fields.pop("options", None) or {})
+    if "start" not in fields or "end" not in fields:
+        raise ValueError(f"Cut {index + 1} needs a start and an end")
+    start = parse_time(fields.pop("start"))
+    end = parse_time(fields.pop("end"))
+    name = str(fields.pop("name", "") or "").strip()
+    options.update(
+        (key, value) for key, value in fields.items() if value not in (None, "")
+    )
+    if end <= start:
+        raise ValueError(f"Cut {index + 1} ends before it starts: {start} - {end}")
+    return Cut(start, end, name, options)
+
+
+def _read_edl(path, fps=None) -> list:
+    cuts = []
+    for line in Path(path).read_text(encoding="utf-8", errors="replace").splitlines():
+        match = _EDL_EVENT.match(line.strip())
+        if match:
+            cuts.append(
+                Cut(parse_time(match[1], fps), parse_time(match[2], fps), "", {})
+            )
+            continue
+        match = _EDL_NAME.match(line.strip())
+        if match and cuts and not cuts[-1].name:
+            cuts[-1].name = match[1].strip()
+    return cuts
+
+
+def load_cut_list(path, fps=None) -> list:
+    """
+    Reads a cut list.
+
+    CSV: a header with start, end, name and option columns (e.g. mode,
+    width). JSON: a list of objects (or {"cuts": [...]}) with the same keys,
+    options may also be nested under "options". EDL: CMX 3600 events, the
+    source in and out timecodes at fps (EDL_FPS) and "* FROM CLIP NAME:" as
+    the name.
+
+    Returns:
+        list: Cut objects in the order of the list.
+    """
+    path = Path(path)
+    suffix = path.suffix.lower()
+    if suffix == ".edl":
+        cuts = _read_edl(path, fps)
+    elif suffix == ".json":
+        with open(path, encoding="utf-8") as list_file:
+            data = json.load(list_file)
+        if isinstance(data, dict):
+            data = data.get("cuts", [])
+        cuts = [_cut_from_fields(fields, index) for index, fields in enumerate(data)]
+    else:
+        with open(path, encoding="utf-8", newline="") as list_file:
+            rows = list(csv.DictReader(list_file))
+        cuts = [_cut_from_fields(fields, index) for index, fields in enumerate(rows)]
+    for cut in cuts:
+        if cut.mode not in CUT_MODES:
+            raise ValueError(
+                f"Unknown cut mode for {cut.name or cut.start}: {cut.mode}"
+            )
+    return cuts
+
+
+def keyframes_command(input_file, starts) -> list:
+    """
+    Lists the video packets right after every start, ffprobe seeks to the
+    keyframe before each start so nothing else of the file is read.
+    """
+    intervals = ",".join(
+        f"{max(0.0, start - KEYFRAME_TOLERANCE):.3f}%+{2 * KEYFRAME_TOLERANCE:.3f}"
+        for start in starts
+    )
+    return [
+        str(encoding.FFPROBE_PATH),
+        "-v",
+        "error",
+        "-select_streams",
+        "v:0",
+        "-read_intervals",
+        intervals,
+        "-show_entries",
+        "packet=pts_time,flags",
+        "-of",
+        "csv=p=0",
+        str(input_file),
+    ]
+
+
+def keyframes_near(input_file, starts) -> list:
+    """Sorted keyframe times (seconds) found around the starts."""
+    if not starts:
+        return []
+    result = subprocess.run(
+        keyframes_command(input_file, starts),
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,
+        text=True,
+    )
+    keyframes = set()
+    for line in result.stdout.splitlines():
+        fields = line.split(",")
+        if len(fields) >= 2 and fields[1].startswith("K"):
+            try:
+                keyframes.add(float(fields[0]))
+            except ValueError:
+                continue
+    return sorted(keyframes)
+
+
+def _aligned_keyframe(start, keyframes) -> float:
+    close = [time for time in keyframes if abs(time - start) <= KEYFRAME_TOLERANCE]
+    return min(close, key=lambda time: abs(time - start)) if close else None
+
+
+def clip_path(output_dir, index, cut, suffix) -> Path:
+    name = encoding.clean_text(cut.name) if cut.name else "clip"
+    name = re.sub(r"[^\w.-]+", "_", name).strip("._") or "clip"
+    return Path(output_dir) / f"{index + 1:03d}_{name}{suffix}"
+
+
+def plan_cuts(input_file, cuts, output_dir) -> tuple:
+    """
+    Splits the cuts into stream copies and shared decodes.
+
+    Returns:
+        tuple: (copies as (cut, keyframe, path) tuples, groups as lists of
+               (cut, path) tuples re-encoded together).
+    """
+    source_suffix = Path(input_file).suffix or ".mp4"
+    auto_starts = [cut.start for cut in cuts if cut.mode == "auto" and not cut.width]
+    keyframes = keyframes_near(input_file, auto_starts)
+
+    copies = []
+    encodes = []
+    for index, cut in enumerate(cuts):
+        keyframe = None
+        if cut.mode == "copy":
+            keyframe = cut.start
+        elif cut.mode == "auto" and not cut.width:
+            keyframe = _aligned_keyframe(cut.start, keyframes)
+        if keyframe is not None:
+            copies.append(
+                (cut, keyframe, clip_path(output_dir, index, cut, source_suffix))
+            )
+        else:
+            encodes.append((cut, clip_path(output_dir, index, cut, ".mp4")))
+
+    groups = []
+    group_end = None
+    for cut, path in sorted(encodes, key=lambda item: item[0].start):
+        if (
+            groups
+            and cut.start <= group_end + CUT_GROUP_GAP_SECONDS
+            and len(groups[-1]) < MAX_OUTPUTS_PER_DECODE
+        ):
+            groups[-1].append((cut, path))
+            group_end = max(group_end, cut.end)
+        else:
+            groups.append([(cut, path)])
+            group_end = cut.end
+    return copies, groups
+
+
+def copy_cut_command(input_file, start, end, output_file, audio_channel=0) -> list:
+    """Stream copies a range starting on a keyframe."""
+    return [
+        str(encoding.FFMPEG_PATH),
+        "-y",
+        # a hair past the keyframe, the seek lands on it and not on the one before
+        "-ss",
+        f"{start + 0.0005:.3f}",
+        "-to",
+        f"{end:.3f}",
+        "-i",
+        str(input_file),
+        "-map",
+        "0:v:0?",
+        "-map",
+        f"0:a:{audio_channel}?",
+        "-c",
+        "copy",
+        "-avoid_negative_ts",
+        "make_zero",
+        str(output_file),
+    ]
+
+
+def group_command(
+    input_file, group, audio_channel=0, has_audio=True, encoder=None
+) -> list:
+    """
+    Decodes the span of a group of cuts once and writes every cut from it:
+    split/asplit hand the same frames to one trim branch per output, each
+    encoded with the encoder profile (WEB_ENCODER by default).
+    """
+    group_start = min(cut.start for cut, _path in group)
+    group_end = max(cut.end for cut, _path in group)
+    count = len(group)
+    task = [
+        str(encoding.FFMPEG_PATH),
+        "-y",
+        *encoding.seek_input_args(f"{group_start:.3f}", f"{group_end:.3f}"),
+        "-i",
+        str(input_file),
+    ]
+    graph = [f"[0:v:0]split={count}" + "".join(f"[v{k}]" for k in range(count))]
+    if has_audio:
+        graph.append(
+            f"[0:a:{audio_channel}]asplit={count}"
+            + "".join(f"[a{k}]" for k in range(count))
+        )
+    for index, (cut, _path) in enumerate(group):
+        # the input seek makes group_start the new zero
+        start = cut.start - group_start
+        end = cut.end - group_start
+        scale = f",scale={cut.width}:-2" if cut.width else ""
+        graph.append(
+            f"[v{index}]trim=start={start:.3f}:end={end:.3f},"
+            f"setpts=PTS-STARTPTS{scale}[ov{index}]"
+        )
+        if has_audio:
+            graph.append(
+                f"[a{index}]atrim=start={start:.3f}:end={end:.3f},"
+                f"asetpts=PTS-STARTPTS[oa{index}]"
+            )
+    task.extend(["-filter_complex", ";".join(graph)])
+    for index, (_cut, path) in enumerate(group):
+        task.extend(["-map", f"[ov{index}]"])
+        if has_audio:
+            task.extend(["-map", f"[oa{index}]", "-c:a", "aac", "-b:a", "192k"])
+        task.extend(
+            [
+                # split outputs carry no frame rate, keep the source timestamps
+                "-fps_mode",
+                "passthrough",
+                # see lib/encoders.py
+                *encoders.video_args(encoder or encoding.WEB_ENCODER, path),
+                "-movflags",
+                "+faststart",
+                str(path),
+            ]
+        )
+    return task
+
+
+def _has_audio(input_file, audio_channel=0) -> bool:
+    result = subprocess.run(
+        encoding.streams_command(input_file, f"a:{audio_channel}"),
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        return bool(json.loads(result.stdout)["streams"])
+    except (ValueError, KeyError):
+        return False
+
+
+def describe_plan(copies, groups) -> str:
+    lines = []
+    for cut, keyframe, path in copies:
+        lines.append(f"copy    {keyframe:10.3f} - {cut.end:10.3f}  {path.name}")
+    for number, group in enumerate(groups, 1):
+        for cut, path in group:
+            lines.append(
+                f"decode {number:>2} {cut.start:9.3f} - {cut.end:10.3f}  {path.name}"
+            )
+    return "\n".join(lines)
+
+
+def cut_clips(
+    input_file,
+    cuts,
+    output_dir=None,
+    audio_channel=0,
+    concurrency=None,
+    job_class="background",
+    encoder=None,
+) -> list:
+    """
+    Cuts many clips out of one source.
+
+    Clips starting on a keyframe (mode "auto") or marked "copy" are stream
+    copied. The others are re-encoded in groups: overlapping or nearby clips
+    (CUT_GROUP_GAP_SECONDS) share one seek and one decode of their span and
+    are written as separate outputs of the same ffmpeg process.
+
+    Args:
+        input_file: Path to the source video.
+        cuts: Cut objects, or a path to a CSV, JSON or EDL cut list.
+        output_dir: Folder of the clips, defaults to a "clips" folder next to
+            the source.
+        audio_channel (int): Audio stream kept in the clips.
+        concurrency: Jobs at once, "adaptive" or a number, defaults to
+            encoding.BATCH_CONCURRENCY.
+        job_class (str): Governor job class of the ffmpeg processes.
+        encoder (str): Encoder profile of the re-encoded clips (see
+            lib/encoders.py), defaults to encoding.WEB_ENCODER.
+
+    Returns:
+        list: The clip paths, in the order of the cuts.
+    """
+    input_file = Path(input_file)
+    if isinstance(cuts, (str, Path)):
+        cuts = load_cut_list(cuts)
+    output_dir = Path(output_dir or input_file.parent / "clips")
+    output_dir.mkdir(parents=True, exist_ok=True)
+    if concurrency is None:
+        concurrency = encoding.BATCH_CONCURRENCY
+
+    copies, groups = plan_cuts(input_file, cuts, output_dir)
+    if groups:
+        encoder = encoders.resolve(encoder or encoding.WEB_ENCODER)
+        capabilities.require(
+            [encoders.get_profile(encoder)["codec"]], operation="cut_clips"
+        )
+    has_audio = _has_audio(input_file, audio_channel) if groups else True
+    print(
+        f"Cutting {len(cuts)} clip(s) from {input_file}: {len(copies)} stream "
+        f"copied, {sum(len(group) for group in groups)} re-encoded in "
+        f"{len(groups)} decode(s)"
+    )
+
+    jobs = [
+        partial(
+            encoding.run_ffmpeg,
+            copy_cut_command(input_file, keyframe, cut.end, path, audio_channel),
+            "cut_copy",
+            check=True,
+        )
+        for cut, keyframe, path in copies
+    ]
+    jobs.extend(
+        partial(
+            encoding.run_ffmpeg,
+            group_command(input_file, group, audio_channel, has_audio, encoder),
+            "cut_group",
+            check=True,
+        )
+        for group in groups
+    )
+    paths = {id(cut): path for cut, _keyframe, path in copies}
+    paths.update((id(cut), path) for group in groups for cut, path in group)
+    clips = [paths[id(cut)] for cut in cuts]
+    try:
+        scheduler.run_jobs(jobs, concurrency, job_class=job_class)
+    except subprocess.CalledProcessError as e:
+        print(f"An error occurred: {e}")
+        missing = [path for path in clips if not path.is_file()]
+        print(f"{len(missing)} of {len(clips)} clips were not written")
+        raise
+    print("Cut list done!")
+    return clips
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Cut the clips of a CSV, JSON or EDL cut list out of a video"
+    )
+    parser.add_argument("cut_list", type=Path)
+    parser.add_argument("source", type=Path)
+    parser.add_argument("output_dir", type=Path, nargs="?")
+    parser.add_argument("--audio-channel", type=int, default=0)
+    parser.add_argument("--concurrency", default=None)
+    parser.add_argument("--edl-fps", type=float, default=None)
+    parser.add_argument(
+        "--encoder",
+        choices=list(encoders.ENCODER_PROFILES),
+        default=None,
+        help="encoder profile of the re-encoded clips",
+    )
+    parser.add_argument(
+        "--dry-run", action="store_true", help="print the plan without cutting"
+    )
+    args = parser.parse_args()
+
+    capabilities.configure()
+    cuts = load_cut_list(args.cut_list, args.edl_fps)
+    if args.dry_run:
+        output_dir = args.output_dir or args.source.parent / "clips"
+        print(describe_plan(*plan_cuts(args.source, cuts, output_dir)))
+        return
+    cut_clips(
+        args.source,
+        cuts,
+        args.output_dir,
+        args.audio_channel,
+        args.concurrency,
+        encoder=args.encoder,
+    )
+
+
+if __name__ == "__main__":
+    main()
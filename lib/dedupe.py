@@ -0,0 +1,324 @@
+import os
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+import lib.encoding as encoding
+import lib.governor as governor
+import lib.library as library
+
+# -------------------------------------------------------------------------------
+# CONFIGURABLE SETTINGS
+# -------------------------------------------------------------------------------
+
+# relative positions (0-1 of the duration) of the frames hashed per file
+SAMPLE_POSITIONS = [0.1, 0.3, 0.5, 0.7, 0.9]
+
+# "phash" (DCT, survives re-encodes, scaling and colour shifts) or "dhash"
+# (gradients, cheaper but more sensitive to brightness changes)
+HASH_METHOD = "phash"
+
+# files are duplicates when their frames differ by at most this many of the
+# 64 hash bits on average
+MAX_FRAME_DISTANCE = 6
+
+# durations may differ by this fraction (or one second) between duplicates
+DURATION_TOLERANCE = 0.02
+
+# ffmpeg processes sampling frames at once
+FINGERPRINT_WORKERS = min(8, os.cpu_count() or 1)
+# ==============================================================================
+
+# sampled frames are scaled to HASH_WIDTH x HASH_HEIGHT grey pixels, dHash
+# averages them down to 9x8 blocks, pHash keeps the lowest 8x8 DCT terms
+HASH_WIDTH = 36
+HASH_HEIGHT = 32
+
+
+def _positions_key(positions) -> str:
+    return ",".join(f"{position:g}" for position in positions)
+
+
+def sample_command(input_file, duration, positions=None) -> list:
+    """
+    Builds one ffmpeg command writing a small grey frame per position to stdout,
+    every position is its own input seeked with -ss.
+    """
+    positions = positions or SAMPLE_POSITIONS
+    task = [str(encoding.FFMPEG_PATH), "-v", "error", "-nostdin"]
+    graph = []
+    for index, position in enumerate(positions):
+        task.extend(["-ss", f"{duration * position:.3f}", "-i", str(input_file)])
+        graph.append(
+            f"[{index}:v:0]trim=end_frame=1,"
+            f"scale={HASH_WIDTH}:{HASH_HEIGHT}:flags=area,format=gray,setsar=1[f{index}]"
+        )
+    labels = "".join(f"[f{index}]" for index in range(len(positions)))
+    graph.append(f"{labels}concat=n={len(positions)}:v=1:a=0[out]")
+    task.extend(["-filter_complex", ";".join(graph), "-map", "[out]"])
+    task.extend(["-fps_mode", "passthrough"])
+    task.extend(["-f", "rawvideo", "-pix_fmt", "gray", "-"])
+    return task
+
+
+def sample_frames(input_file, duration, positions=None):
+    """Returns the sampled frames as a (positions, height, width) array or None."""
+    positions = positions or SAMPLE_POSITIONS
+    result = encoding.run_ffmpeg(
+        sample_command(input_file, duration, positions),
+        "dedupe_sample",
+        stdout=subprocess.PIPE,
+    )
+    frame_size = HASH_WIDTH * HASH_HEIGHT
+    if result.returncode != 0 or len(result.stdout) != frame_size * len(positions):
+        return None
+    frames = np.frombuffer(result.stdout, np.uint8)
+    return frames.reshape(len(positions), HASH_HEIGHT, HASH_WIDTH).astype(np.float32)
+
+
+def _pack(bits):
+    """(frames, 64) booleans to one big endian uint64 per frame."""
+    return np.packbits(bits, axis=1).view(">u8")[:, 0].astype(np.uint64)
+
+
+def dhash(frames):
+    """Difference hash of every frame, compares horizontally adjacent blocks."""
+    count = len(frames)
+    blocks = frames.reshape(count, 8, HASH_HEIGHT // 8, 9, HASH_WIDTH // 9)
+    blocks = blocks.mean(axis=(2, 4))
+    return _pack((blocks[:, :, 1:] > blocks[:, :, :-1]).reshape(count, 64))
+
+
+def _dct_matrix(size):
+    rows = np.arange(size)[:, None]
+    columns = np.arange(size)[None, :]
+    return np.cos(np.pi * (2 * columns + 1) * rows / (2 * size)).astype(np.float32)
+
+
+def phash(frames):
+    """DCT hash of every frame: low frequency terms above their median."""
+    count = len(frames)
+    terms = _dct_matrix(HASH_HEIGHT) @ frames @ _dct_matrix(HASH_WIDTH).T
+    low = terms[:, :8, :8].reshape(count, 64)
+    # the DC term only carries the brightness, keep it out of the median
+    median = np.median(low[:, 1:], axis=1, keepdims=True)
+    return _pack(low > median)
+
+
+def fingerprint(input_file, duration, positions=None) -> dict:
+    """
+    Samples the frames of a file and hashes them.
+
+    Returns:
+        dict: "dhash" and "phash" as bytes (8 per position), None when the
+              frames could not be sampled.
+    """
+    frames = sample_frames(input_file, duration, positions)
+    if frames is None:
+        return None
+    return {
+        "dhash": dhash(frames).astype(">u8").tobytes(),
+        "phash": phash(frames).astype(">u8").tobytes(),
+    }
+
+
+def _popcount(values):
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(values).sum(axis=-1)
+    table = np.array([bin(value).count("1") for value in range(256)], np.uint8)
+    return table[values.view(np.uint8)].sum(axis=-1, dtype=np.int64)
+
+
+def similar_pairs(hashes, max_distance, durations=None):
+    """
+    Finds the pairs of rows whose hashes differ by at most max_distance bits.
+
+    Multi-index hashing: the bits are cut into max_distance + 1 substrings, two
+    rows within the distance agree exactly on at least one of them. Rows are
+    grouped by each substring and only the rows sharing a group are compared,
+    with vectorised popcounts instead of a python loop over pairs.
+
+    Args:
+        hashes: (rows, words) uint64 array, e.g. one word per sampled frame.
+        max_distance (int): Largest total Hamming distance of a pair.
+        durations: Optional durations, pairs outside DURATION_TOLERANCE are
+            dropped.
+
+    Returns:
+        ndarray: (pairs, 2) row indices, first < second.
+    """
+    rows = len(hashes)
+    if rows < 2:
+        return np.empty((0, 2), np.int64)
+    bits = np.unpackbits(hashes.astype(">u8").view(np.uint8).reshape(rows, -1), axis=1)
+    # at least max_distance + 1 substrings, none wider than 32 bits
+    count = min(max(max_distance + 1, -(-bits.shape[1] // 32)), bits.shape[1])
+    edges = np.linspace(0, bits.shape[1], count + 1).astype(int)
+
+    found = []
+    for start, end in zip(edges[:-1], edges[1:]):
+        weights = np.left_shift(np.uint64(1), np.arange(end - start, dtype=np.uint64))
+        keys = (bits[:, start:end].astype(np.uint64) * weights).sum(axis=1)
+        order = np.argsort(keys, kind="stable")
+        sorted_keys = keys[order]
+        # pair every row with the ones `offset` places later in its group,
+        # only the rows of groups larger than offset stay active
+        active = np.arange(rows - 1)
+        offset = 1
+        while len(active):
+            active = active[active + offset < rows]
+            active = active[sorted_keys[active] == sorted_keys[active + offset]]
+            if not len(active):
+                break
+            first = order[active]
+            second = order[active + offset]
+            distance = _popcount(hashes[first] ^ hashes[second])
+            close = distance <= max_distance
+            if durations is not None:
+                a, b = durations[first], durations[second]
+                tolerance = np.maximum(1.0, DURATION_TOLERANCE * np.maximum(a, b))
+                close &= np.abs(a - b) <= tolerance
+            if close.any():
+                pair = np.stack([first[close], second[close]], axis=1)
+                found.append(np.sort(pair, axis=1))
+            offset += 1
+
+    if not found:
+        return np.empty((0, 2), np.int64)
+    return np.unique(np.concatenate(found), axis=0)
+
+
+def _clusters(pairs, rows) -> list:
+    parent = list(range(rows))
+
+    def root(node):
+        while parent[node] != node:
+            parent[node] = parent[parent[node]]
+            node = parent[node]
+        return node
+
+    for first, second in pairs:
+        parent[root(first)] = root(second)
+    groups = {}
+    for node in range(rows):
+        groups.setdefault(root(node), []).append(node)
+    return [group for group in groups.values() if len(group) > 1]
+
+
+def _quality(row) -> tuple:
+    # the copy kept from a cluster: highest resolution, then bitrate, then size
+    return (
+        (row["width"] or 0) * (row["height"] or 0),
+        row["bit_rate"] or 0,
+        row["size"] or 0,
+    )
+
+
+def find_duplicates(
+    source,
+    recursive=False,
+    method=None,
+    max_frame_distance=None,
+    workers=None,
+    media_library=None,
+) -> list:
+    """
+    Groups the near duplicate videos of a folder (re-uploads, re-encodes).
+
+    The files are indexed in the media library first, every file without a
+    stored fingerprint then has SAMPLE_POSITIONS frames sampled and hashed
+    (stored in the library, so later runs only hash new or changed files).
+    Files whose frames all hash alike and whose durations match are grouped.
+
+    Args:
+        source: Folder(s) with the videos, or a list of video paths.
+        recursive (bool): Descend into sub folders of a folder source.
+        method (str): "phash" or "dhash", defaults to HASH_METHOD.
+        max_frame_distance (int): Defaults to MAX_FRAME_DISTANCE.
+        workers (int): ffmpeg processes at once, defaults to FINGERPRINT_WORKERS.
+        media_library: MediaLibrary to use, defaults to the shared one.
+
+    Returns:
+        list: Clusters as lists of paths, the best copy first.
+    """
+    if np is None:
+        raise ImportError("Duplicate detection needs numpy: pip install numpy")
+    method = method or HASH_METHOD
+    if method not in ("phash", "dhash"):
+        raise ValueError(f"Unknown hash method: {method}")
+    if max_frame_distance is None:
+        max_frame_distance = MAX_FRAME_DISTANCE
+    media_library = media_library or library.get_library()
+
+    if isinstance(source, (str, Path)) and Path(source).is_dir():
+        paths = list(library.walk_media(source, recursive))
+    else:
+        paths = [Path(path).absolute() for path in encoding.media_files(source)]
+    media_library.scan(paths, prune=False)
+
+    positions_key = _positions_key(SAMPLE_POSITIONS)
+    known = media_library.fingerprint_rows()
+    rows = [known[str(path)] for path in paths if str(path) in known]
+    missing = [
+        row for row in rows if row["positions"] != positions_key and row["duration"]
+    ]
+    if missing:
+        print(f"Fingerprinting {len(missing)} file(s)")
+        klass = governor.current_job_class()
+
+        def compute(row):
+            return governor.run_as(
+                klass.name, fingerprint, row["path"], row["duration"]
+            )
+
+        with ThreadPoolExecutor(max_workers=workers or FINGERPRINT_WORKERS) as pool:
+            for row, hashes in zip(missing, pool.map(compute, missing)):
+                if hashes is None:
+                    print(f"Could not sample frames of {row['path']}")
+                    hashes = {"dhash": None, "phash": None}
+                media_library.store_fingerprint(
+                    row["path"], positions_key, hashes["dhash"], hashes["phash"]
+                )
+                row.update(positions=positions_key, **hashes)
+
+    rows = [row for row in rows if row["positions"] == positions_key and row[method]]
+    if len(rows) < 2:
+        return []
+    hashes = np.frombuffer(b"".join(row[method] for row in rows), ">u8")
+    hashes = hashes.reshape(len(rows), len(SAMPLE_POSITIONS)).astype(np.uint64)
+    durations = np.array([row["duration"] for row in rows], np.float64)
+    pairs = similar_pairs(hashes, max_frame_distance * len(SAMPLE_POSITIONS), durations)
+
+    clusters = []
+    for group in _clusters(pairs.tolist(), len(rows)):
+        group.sort(key=lambda index: _quality(rows[index]), reverse=True)
+        clusters.append([Path(rows[index]["path"]) for index in group])
+    clusters.sort(key=lambda cluster: str(cluster[0]))
+    print(
+        f"Found {len(clusters)} duplicate group(s), "
+        f"{sum(len(cluster) - 1 for cluster in clusters)} redundant file(s)"
+    )
+    return clusters
+
+
+def skip_duplicates(files, **options) -> list:
+    """
+    Drops the redundant copies from a list of videos, keeping the best copy
+    of every duplicate group and the order of the list.
+
+    Args:
+        files: Video paths (or a folder).
+        options: Passed to find_duplicates.
+    """
+    files = [Path(path).absolute() for path in encoding.media_files(files)]
+    redundant = {
+        path for cluster in find_duplicates(files, **options) for path in cluster[1:]
+    }
+    for path in sorted(redundant):
+        print(f"Skipping duplicate {path}")
+    return [path for path in files if path not in redundant]
@@ -0,0 +1,205 @@
+from pathlib import Path
+
+import lib.encoding as encoding
+import lib.capabilities as capabilities
+
+# -------------------------------------------------------------------------------
+# CONFIGURABLE SETTINGS
+# -------------------------------------------------------------------------------
+
+# named video encoder settings, selected per job with encoder="<name>"
+#   codec: ffmpeg encoder
+#   preset: speed preset (x264/x265 names, 0-13 for SVT-AV1, lower is slower)
+#   crf / qp: constant quality or constant quantizer (qp 0 is lossless)
+#   tune, profile, level, pix_fmt: passed as is when set
+#   tag: codec tag, hvc1 lets Apple players open HEVC in mp4/mov
+#   params: extra encoder options
+#   containers: output extensions the stream can be muxed in, None for any
+#   fallback: profile used when the ffmpeg build lacks the codec
+# "web" takes CRF_VALUE, PROFILE and COMPRESSION_RATIO from lib/encoding.py,
+# "ladder" COMPRESSION_RATIO
+ENCODER_PROFILES = {
+    "web": {
+        "codec": "libx264",
+        "pix_fmt": "yuv420p",
+        "level": "3.0",
+    },
+    # renditions of lib/ladder.py, their bitrates come from the ladder
+    "ladder": {
+        "codec": "libx264",
+        "profile": "main",
+        "pix_fmt": "yuv420p",
+    },
+    # preview proxies of lib/proxy.py, quick to encode and to decode
+    "proxy": {
+        "codec": "libx264",
+        "preset": "veryfast",
+        "crf": 26,
+        "tune": "fastdecode",
+        "pix_fmt": "yuv420p",
+    },
+    # libx264 defaults (medium, crf 23)
+    "x264": {"codec": "libx264"},
+    "x264-fast": {
+        "codec": "libx264",
+        "preset": "veryfast",
+        "crf": 23,
+        "profile": "high",
+        "pix_fmt": "yuv420p",
+    },
+    "x264-small": {
+        "codec": "libx264",
+        "preset": "slow",
+        "crf": 24,
+        "profile": "high",
+        "pix_fmt": "yuv420p",
+    },
+    "x264-lossless": {
+        "codec": "libx264",
+        "preset": "veryfast",
+        "qp": 0,
+        "containers": (".mp4", ".mkv", ".mov"),
+    },
+    "x265-fast": {
+        "codec": "libx265",
+        "preset": "fast",
+        "crf": 28,
+        "pix_fmt": "yuv420p",
+        "tag": "hvc1",
+        "params": ["-x265-params", "log-level=error"],
+        "containers": (".mp4", ".mkv", ".mov"),
+        "fallback": "x264-fast",
+    },
+    "x265-small": {
+        "codec": "libx265",
+        "preset": "slow",
+        "crf": 26,
+        "pix_fmt": "yuv420p10le",
+        "tag": "hvc1",
+        "params": ["-x265-params", "log-level=error"],
+        "containers": (".mp4", ".mkv", ".mov"),
+        "fallback": "x264-small",
+    },
+    "x265-grain": {
+        "codec": "libx265",
+        "preset": "medium",
+        "crf": 26,
+        "tune": "grain",
+        "pix_fmt": "yuv420p10le",
+        "tag": "hvc1",
+        "params": ["-x265-params", "log-level=error"],
+        "containers": (".mp4", ".mkv", ".mov"),
+        "fallback": "x264-small",
+    },
+    "av1-fast": {
+        "codec": "libsvtav1",
+        "preset": 10,
+        "crf": 35,
+        "pix_fmt": "yuv420p",
+        "containers": (".mp4", ".mkv", ".webm"),
+        "fallback": "av1-aom",
+    },
+    "av1-small": {
+        "codec": "libsvtav1",
+        "preset": 6,
+        "crf": 32,
+        "pix_fmt": "yuv420p10le",
+        "params": ["-svtav1-params", "tune=0"],
+        "containers": (".mp4", ".mkv", ".webm"),
+        "fallback": "av1-aom",
+    },
+    # libaom is slower than SVT-AV1 but in more ffmpeg builds
+    "av1-aom": {
+        "codec": "libaom-av1",
+        "crf": 34,
+        "pix_fmt": "yuv420p",
+        "params": ["-cpu-used", "6", "-row-mt", "1"],
+        "containers": (".mp4", ".mkv", ".webm"),
+        "fallback": "x265-fast",
+    },
+}
+# ==============================================================================
+
+
+def get_profile(name) -> dict:
+    """
+    Returns the settings of a named encoder profile, the "web" and "ladder"
+    ones with the current lib/encoding.py quality settings filled in.
+    """
+    try:
+        profile = dict(ENCODER_PROFILES[name])
+    except KeyError:
+        raise ValueError(
+            f"Unknown encoder profile {name}, use one of {', '.join(ENCODER_PROFILES)}"
+        ) from None
+    if name == "web":
+        profile.setdefault("preset", encoding.COMPRESSION_RATIO)
+        profile.setdefault("crf", encoding.CRF_VALUE)
+        profile.setdefault("profile", encoding.PROFILE)
+    elif name == "ladder":
+        profile.setdefault("preset", encoding.COMPRESSION_RATIO)
+    return profile
+
+
+def resolve(name) -> str:
+    """
+    The profile to use for name with the ffmpeg build at hand: name itself,
+    or its fallbacks in turn when the codec is missing. Raises RuntimeError
+    when none of them can run.
+    """
+    tried = []
+    while name and name not in tried:
+        codec = get_profile(name)["codec"]
+        if capabilities.pick_encoder([codec]):
+            if tried:
+                print(f"{tried[0]}: {codec} is used instead, see ENCODER_PROFILES")
+            return name
+        tried.append(name)
+        name = get_profile(name).get("fallback")
+    capabilities.require(
+        [get_profile(profile)["codec"] for profile in tried], operation="encode"
+    )
+    return tried[0]
+
+
+def check_container(name, output_file) -> None:
+    """Raises ValueError when the profile's codec cannot go in the output file."""
+    containers = get_profile(name).get("containers")
+    extension = Path(output_file).suffix.lower()
+    if containers and extension not in containers:
+        raise ValueError(
+            f"{name} ({get_profile(name)['codec']}) cannot be written to "
+            f"{extension} files, use {', '.join(containers)}"
+        )
+
+
+def video_args(name, output_file=None, rate_control=True) -> list:
+    """
+    ffmpeg output options encoding the video with a named profile, or the
+    fallback the ffmpeg build supports (see resolve).
+
+    Args:
+        name (str): Key of ENCODER_PROFILES.
+        output_file: Checked against the profile's containers when given.
+        rate_control (bool): False leaves the crf/qp out, for callers setting
+            bitrates themselves.
+    """
+    name = resolve(name)
+    if output_file is not None:
+        check_container(name, output_file)
+    profile = get_profile(name)
+    args = ["-c:v", profile["codec"]]
+    if profile.get("preset") is not None:
+        args.extend(["-preset", str(profile["preset"])])
+    if rate_control and profile.get("qp") is not None:
+        args.extend(["-qp", str(profile["qp"])])
+    elif rate_control and profile.get("crf") is not None:
+        args.extend(["-crf", str(profile["crf"])])
+    for option in ("tune", "profile", "level", "pix_fmt"):
+        if profile.get(option):
+            flag = "-profile:v" if option == "profile" else f"-{option}"
+            args.extend([flag, str(profile[option])])
+    if profile.get("tag"):
+        args.extend(["-tag:v", profile["tag"]])
+    args.extend(profile.get("params", []))
+    return args
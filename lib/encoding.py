@@ -1,24 +1,41 @@
 import os
 import json
+import asyncio
+import hashlib
 import subprocess
-from shutil import copyfile
+from concurrent.futures import ThreadPoolExecutor
+from shutil import which
 from datetime import datetime
+from functools import partial
 from pathlib import Path
 
+import lib.governor as governor
+import lib.metrics as metrics
+import lib.profiling as profiling
+import lib.progress as progress
+import lib.scheduler as scheduler
+
 # -------------------------------------------------------------------------------
 # CONFIGURABLE SETTINGS
 # -------------------------------------------------------------------------------
 
-# path to ffmpeg bin
+# path to ffmpeg bin, $FFMPEG_PATH/$FFPROBE_PATH or the ones on PATH are used
+# when they are missing (see locate)
 FFMPEG_PATH = Path("C:\\", "ffmpeg", "bin", "ffmpeg")
 
 FFPROBE_PATH = Path("C:\\", "ffmpeg", "bin", "ffprobe")
 
+# environment variables overriding FFMPEG_PATH and FFPROBE_PATH
+FFMPEG_ENV = "FFMPEG_PATH"
+FFPROBE_ENV = "FFPROBE_PATH"
+
 # fonts directory
 FONT_DIR = Path("C:\\", "Windows", "Fonts")
 
 SUPPORTED_MEDIA = ["mp4", "mkv", "avi", "mov"]
 
+SUPPORTED_AUDIO = ["wav", "mp3", "flac", "aac", "m4a", "ogg", "opus"]
+
 # Qdialogue filter
 VIDEO_FILTER = "Videos(*.mp4 *.mkv *.avi *.mov)"
 
@@ -35,13 +52,101 @@ PROFILE = "baseline"
 # veryslow, slower, slow, medium, fast, faster, veryfast, superfast, ultrafast
 COMPRESSION_RATIO = "veryslow"
 
+# gif output (see to_gif), GIF_WIDTH 0 keeps the source width
+GIF_FPS = 15
+GIF_WIDTH = 480
+GIF_COLORS = 256
+# none, bayer:bayer_scale=0-5, floyd_steinberg, sierra2, sierra2_4a
+GIF_DITHER = "sierra2_4a"
+# "full" optimises the palette for the whole clip, "diff" for what moves
+GIF_STATS_MODE = "diff"
+
+# animated webp, quality 0-100 (lossy) or compression effort (lossless)
+WEBP_QUALITY = 75
+WEBP_LOSSLESS = False
+# encoder effort 0-6, above 2 the files barely shrink but encode much slower
+WEBP_COMPRESSION_LEVEL = 2
+
+# image + audio videos: frame rate of the still picture and seconds between
+# keyframes (seeking granularity)
+STILL_FPS = 1
+STILL_KEYFRAME_SECONDS = 10
+
+# audio codecs that are copied instead of re-encoded, per output container
+COPYABLE_AUDIO = {
+    ".mp4": ["aac", "mp3", "alac", "ac3", "eac3"],
+    ".m4v": ["aac", "mp3", "alac", "ac3", "eac3"],
+    ".mov": ["aac", "mp3", "alac", "ac3", "pcm_s16le", "pcm_s24le"],
+    ".mkv": ["aac", "mp3", "alac", "ac3", "eac3", "flac", "opus", "vorbis"],
+}
+
+# encoders of extract_audio outputs that would otherwise be stream copied, used
+# when a filter (loudness normalisation) has to run
+FILTERED_AUDIO_CODECS = {
+    ".flac": ["-c:a", "flac"],
+    ".opus": ["-c:a", "libopus", "-b:a", "128k"],
+    ".m4a": ["-c:a", "aac", "-b:a", "192k"],
+    ".aac": ["-c:a", "aac", "-b:a", "192k"],
+}
+
+# run every ffmpeg job with -benchmark_all and print a per-stage breakdown
+PROFILE_JOBS = False
+
+# crop the black bars found by lib/crop.py in web mp4 encodes, trim presets and
+# batch encodes
+AUTO_CROP = False
+
+# normalise the loudness (see lib/loudness.py) of web mp4 encodes, audio
+# extractions, trim presets and batch encodes
+NORMALIZE_LOUDNESS = False
+
+# width of the web mp4 encodes
+WEB_MP4_WIDTH = 1280
+
+# encoder profile (see lib/encoders.py) of web mp4 encodes, trim presets and
+# batch encodes, "web" is libx264 with CRF_VALUE, PROFILE and COMPRESSION_RATIO
+WEB_ENCODER = "web"
+
+# number of batch encodes running at once, "adaptive" tunes it from the
+# measured throughput (see lib/scheduler.py)
+BATCH_CONCURRENCY = "adaptive"
+
 # current directory
 CURRENT_DIR_PATH = Path(__file__).resolve().parent
 
 ROOT_DIRECTORY = CURRENT_DIR_PATH.parent
+
+# palettes and analysis results that can be reused between runs
+CACHE_DIR = ROOT_DIRECTORY / "cache"
 # ==============================================================================
 
 
+def locate(name, configured=None) -> Path:
+    """
+    Finds an ffmpeg binary: the environment variable, then the configured path,
+    then PATH. None when none of them exists.
+
+    Args:
+        name (str): "ffmpeg" or "ffprobe".
+        configured: Path from the settings, tried after the environment.
+    """
+    environment = os.environ.get(FFMPEG_ENV if name == "ffmpeg" else FFPROBE_ENV)
+    for candidate in (environment, configured, name):
+        if not candidate:
+            continue
+        # which adds .exe on Windows and checks that the file is executable
+        found = which(str(candidate))
+        if found:
+            return Path(found)
+    return None
+
+
+# resolved once here, before any command is built, so the default Windows paths
+# do not end up in the commands run on other hosts
+FFMPEG_PATH = locate("ffmpeg", FFMPEG_PATH) or FFMPEG_PATH
+FFPROBE_PATH = locate("ffprobe", FFPROBE_PATH) or FFPROBE_PATH
+
+
 def check_directory_exists(path):
     path = Path(path)
     if not path.exists():
@@ -62,6 +167,34 @@ def clean_text(_text):
     return cleaned_text
 
 
+def cache_key(source, **params) -> str:
+    """
+    Key for a cached result derived from a media file, changes when the file
+    (path, size or modification time) or any of the params change.
+    """
+    source = Path(source).absolute()
+    try:
+        stat = source.stat()
+        identity = [str(source), stat.st_size, stat.st_mtime_ns]
+    except OSError:
+        identity = [str(source)]
+    payload = json.dumps([identity, params], sort_keys=True, default=str)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+
+def duration_command(video_file) -> list:
+    return [
+        str(FFPROBE_PATH),
+        "-v",
+        "error",  # Hide any warnings
+        "-show_entries",
+        "format=duration",
+        "-of",
+        "default=noprint_wrappers=1:nokey=1",
+        str(video_file),
+    ]
+
+
 def get_video_duration(video_file: str) -> float:
     """
     Gets the duration of a video file using ffprobe.
@@ -74,16 +207,7 @@ def get_video_duration(video_file: str) -> float:
     """
     try:
         # Construct the command to get the video duration using ffprobe
-        command = [
-            FFPROBE_PATH,
-            "-v",
-            "error",  # Hide any warnings
-            "-show_entries",
-            "format=duration",
-            "-of",
-            "default=noprint_wrappers=1:nokey=1",
-            video_file,
-        ]
+        command = duration_command(video_file)
 
         # Execute the command
         result = subprocess.run(
@@ -100,36 +224,223 @@ def get_video_duration(video_file: str) -> float:
         return 0.0
 
 
-def get_subtitle_format(input_file: str, subtitle_stream_index=0) -> str:
-    ffprobe_cmd = [
+def run_ffmpeg(task, operation, check=False, profile=None, **kwargs):
+    """
+    Runs an ffmpeg command and records its resource usage under an operation name.
+
+    The process is run with the niceness, I/O priority, CPU affinity and thread
+    count of the calling thread's job class (see lib/governor.py), and its stats
+    lines are reported to the calling thread's progress listener if it has one
+    (see lib/progress.py). The media duration recorded with the job metrics is
+    the time of ffmpeg's last stats line, so no extra ffprobe is run.
+
+    Args:
+        task (list): ffmpeg command line.
+        operation (str): Name used to tag the job metrics.
+        check (bool): Raise CalledProcessError when ffmpeg fails.
+        profile (bool): Run with -benchmark_all and print the per-stage timings,
+            defaults to PROFILE_JOBS.
+        stderr_callback (callable): Optional function called with every stderr
+            line, e.g. to read filter logs, next to the progress and profiling
+            listeners.
+
+    Returns:
+        subprocess.CompletedProcess: Same as subprocess.run.
+    """
+    if profile is None:
+        profile = PROFILE_JOBS
+
+    profiler = None
+    if profile:
+        profiler = profiling.StageProfiler()
+        task = [task[0], "-benchmark_all", "-benchmark", *task[1:]]
+
+        def annotate(job):
+            job.stages = profiler.stages(job.wall_seconds)
+
+        kwargs["annotate"] = annotate
+
+    # the stats follower also gives the media duration of the job's output
+    stats = progress.StatsFollower(progress.current_listener())
+    kwargs["stderr_callback"] = progress.chain_callbacks(
+        kwargs.pop("stderr_callback", None),
+        profiler.feed if profiler else None,
+        stats.feed,
+    )
+
+    task, popen_kwargs, on_spawn = governor.govern(task)
+    kwargs.update(popen_kwargs)
+
+    result, job = metrics.run_measured(
+        task,
+        operation,
+        check=False,
+        media_duration=stats.media_duration,
+        on_spawn=on_spawn,
+        **kwargs,
+    )
+    if profiler is not None:
+        print(profiling.format_breakdown(job))
+    if check:
+        result.check_returncode()
+    return result
+
+
+def profile_filter_chain(input_file, filters, trim_start=None, trim_end=None):
+    """
+    Measures what each filter of a video filter chain costs.
+
+    Runs a decode-only pass, then one pass per filter prefix
+    (e.g. "subtitles=..." then "subtitles=...,scale=1280:-2") into the null muxer,
+    so the difference between passes is the cost of the added filter.
+
+    Args:
+        input_file: Path to the input video file.
+        filters (list): Filters in the order they are chained.
+        trim_start: Optional start time for trimming (HH:mm:ss format).
+        trim_end: Optional end time for trimming (HH:mm:ss format).
+
+    Returns:
+        list: (step, seconds) tuples, "decode" first.
+    """
+    steps = [("decode", None)]
+    for position in range(len(filters)):
+        steps.append((filters[position], ",".join(filters[: position + 1])))
+
+    timings = []
+    previous = 0.0
+    for step, chain in steps:
+        task = [str(FFMPEG_PATH), "-v", "error"]
+        if trim_start:
+            task.extend(["-ss", trim_start])
+        if trim_end:
+            task.extend(["-to", trim_end])
+        task.extend(["-i", str(input_file), "-map", "0:v:0"])
+        if chain:
+            task.extend(["-vf", chain])
+        task.extend(["-f", "null", "-"])
+
+        result, job = metrics.run_measured(task, "profile_filter_chain")
+        if result.returncode != 0:
+            print(f"Profiling stopped, ffmpeg failed on: {step}")
+            break
+        timings.append((step, max(job.wall_seconds - previous, 0.0)))
+        previous = job.wall_seconds
+
+    print(profiling.filter_chain_breakdown(timings))
+    return timings
+
+
+def streams_command(input_file, select_streams=None) -> list:
+    """Builds the ffprobe command listing the streams of a file as json."""
+    command = [
         str(FFPROBE_PATH),
         "-v",
         "quiet",
         "-print_format",
         "json",
         "-show_streams",
-        "-select_streams",
-        f"s:{subtitle_stream_index}",
-        input_file,
     ]
+    if select_streams is not None:
+        command.extend(["-select_streams", select_streams])
+    command.append(str(input_file))
+    return command
+
+
+def probe_command(input_file) -> list:
+    """Builds the ffprobe command listing format, streams and chapters as json."""
+    return [
+        str(FFPROBE_PATH),
+        "-v",
+        "quiet",
+        "-print_format",
+        "json",
+        "-show_format",
+        "-show_streams",
+        "-show_chapters",
+        str(input_file),
+    ]
+
+
+def media_files(source) -> list:
+    """
+    Returns the files a batch operation works on.
+
+    Args:
+        source: A folder (its supported videos are used) or an iterable of file
+            paths, e.g. the result of lib.library.MediaLibrary.find.
+    """
+    if isinstance(source, (str, Path)):
+        folder = Path(source)
+        return [
+            file_path
+            for file_path in sorted(folder.iterdir())
+            if file_path.suffix[1:].lower() in SUPPORTED_MEDIA
+        ]
+    return [Path(file_path) for file_path in source]
+
+
+def parse_subtitle_format(data: dict) -> str:
+    codec_name = data["streams"][0]["codec_name"]
+
+    if codec_name == "ass":
+        return "ass"
+    elif codec_name == "subrip":
+        return "srt"
+    else:
+        return codec_name
+
+
+def get_subtitle_format(input_file: str, subtitle_stream_index=0) -> str:
+    ffprobe_cmd = streams_command(input_file, f"s:{subtitle_stream_index}")
 
     try:
         result = subprocess.run(
             ffprobe_cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True
         )
-        stream_info = json.loads(result.stdout)["streams"][0]
-        codec_name = stream_info["codec_name"]
-
-        if codec_name == "ass":
-            return "ass"
-        elif codec_name == "subrip":
-            return "srt"
-        else:
-            return codec_name
+        return parse_subtitle_format(json.loads(result.stdout))
     except (subprocess.CalledProcessError, IndexError, json.JSONDecodeError):
         return None
 
 
+def parse_audio_tracks(data: dict) -> list:
+    """Builds the get_audio_tracks list from ffprobe's json output."""
+    audio_tracks = []
+
+    if "streams" in data:
+        # Use relative index for audio streams (0, 1, 2, ...)
+        relative_index = 0
+        for stream in data["streams"]:
+            if stream.get("codec_type") == "audio":
+                track_info = {
+                    "index": relative_index,  # Relative index for -map 0:a:0, 0:a:1, etc.
+                    "stream_index": stream.get("index", 0),  # Global stream index
+                    "codec": stream.get("codec_name", "unknown"),
+                    "language": stream.get("tags", {}).get("language", "unknown"),
+                    "title": stream.get("tags", {}).get("title", ""),
+                    "channels": stream.get("channels", 0),
+                }
+                # Create a display name
+                display_parts = []
+                if track_info["language"] != "unknown":
+                    display_parts.append(track_info["language"].upper())
+                if track_info["title"]:
+                    display_parts.append(track_info["title"])
+                display_parts.append(f"({track_info['codec']})")
+                if track_info["channels"]:
+                    display_parts.append(f"{track_info['channels']}ch")
+
+                track_info["display_name"] = (
+                    " ".join(display_parts)
+                    if display_parts
+                    else f"Audio Track {relative_index}"
+                )
+                audio_tracks.append(track_info)
+                relative_index += 1
+
+    return audio_tracks
+
+
 def get_audio_tracks(input_file: str) -> list:
     """
     Gets a list of audio tracks from a video file using ffprobe.
@@ -142,17 +453,7 @@ def get_audio_tracks(input_file: str) -> list:
               'stream_index' (global stream index), 'codec', 'language', and 'title' keys.
               Format: [{'index': 0, 'stream_index': 1, 'codec': 'aac', 'language': 'eng', 'title': 'English'}, ...]
     """
-    ffprobe_cmd = [
-        str(FFPROBE_PATH),
-        "-v",
-        "quiet",
-        "-print_format",
-        "json",
-        "-show_streams",
-        "-select_streams",
-        "a",
-        input_file,
-    ]
+    ffprobe_cmd = streams_command(input_file, "a")
 
     try:
         result = subprocess.run(
@@ -162,46 +463,47 @@ def get_audio_tracks(input_file: str) -> list:
             check=True,
             text=True,
         )
-        data = json.loads(result.stdout)
-        audio_tracks = []
-
-        if "streams" in data:
-            # Use relative index for audio streams (0, 1, 2, ...)
-            relative_index = 0
-            for stream in data["streams"]:
-                if stream.get("codec_type") == "audio":
-                    track_info = {
-                        "index": relative_index,  # Relative index for -map 0:a:0, 0:a:1, etc.
-                        "stream_index": stream.get("index", 0),  # Global stream index
-                        "codec": stream.get("codec_name", "unknown"),
-                        "language": stream.get("tags", {}).get("language", "unknown"),
-                        "title": stream.get("tags", {}).get("title", ""),
-                        "channels": stream.get("channels", 0),
-                    }
-                    # Create a display name
-                    display_parts = []
-                    if track_info["language"] != "unknown":
-                        display_parts.append(track_info["language"].upper())
-                    if track_info["title"]:
-                        display_parts.append(track_info["title"])
-                    display_parts.append(f"({track_info['codec']})")
-                    if track_info["channels"]:
-                        display_parts.append(f"{track_info['channels']}ch")
-
-                    track_info["display_name"] = (
-                        " ".join(display_parts)
-                        if display_parts
-                        else f"Audio Track {relative_index}"
-                    )
-                    audio_tracks.append(track_info)
-                    relative_index += 1
-
-        return audio_tracks
+        return parse_audio_tracks(json.loads(result.stdout))
     except (subprocess.CalledProcessError, json.JSONDecodeError, KeyError) as e:
         print(f"Error getting audio tracks: {e}")
         return []
 
 
+def parse_subtitle_tracks(data: dict) -> list:
+    """Builds the get_subtitle_tracks list from ffprobe's json output."""
+    subtitle_tracks = []
+
+    if "streams" in data:
+        # Use relative index for subtitle streams (0, 1, 2, ...)
+        relative_index = 0
+        for stream in data["streams"]:
+            if stream.get("codec_type") == "subtitle":
+                track_info = {
+                    "index": relative_index,  # Relative index for -map 0:s:0, 0:s:1, etc.
+                    "stream_index": stream.get("index", 0),  # Global stream index
+                    "codec": stream.get("codec_name", "unknown"),
+                    "language": stream.get("tags", {}).get("language", "unknown"),
+                    "title": stream.get("tags", {}).get("title", ""),
+                }
+                # Create a display name
+                display_parts = []
+                if track_info["language"] != "unknown":
+                    display_parts.append(track_info["language"].upper())
+                if track_info["title"]:
+                    display_parts.append(track_info["title"])
+                display_parts.append(f"({track_info['codec']})")
+
+                track_info["display_name"] = (
+                    " ".join(display_parts)
+                    if display_parts
+                    else f"Subtitle Track {relative_index}"
+                )
+                subtitle_tracks.append(track_info)
+                relative_index += 1
+
+    return subtitle_tracks
+
+
 def get_subtitle_tracks(input_file: str) -> list:
     """
     Gets a list of subtitle tracks from a video file using ffprobe.
@@ -214,17 +516,7 @@ def get_subtitle_tracks(input_file: str) -> list:
               'stream_index' (global stream index), 'codec', 'language', and 'title' keys.
               Format: [{'index': 0, 'stream_index': 2, 'codec': 'subrip', 'language': 'eng', 'title': 'English'}, ...]
     """
-    ffprobe_cmd = [
-        str(FFPROBE_PATH),
-        "-v",
-        "quiet",
-        "-print_format",
-        "json",
-        "-show_streams",
-        "-select_streams",
-        "s",
-        input_file,
-    ]
+    ffprobe_cmd = streams_command(input_file, "s")
 
     try:
         result = subprocess.run(
@@ -234,38 +526,7 @@ def get_subtitle_tracks(input_file: str) -> list:
             check=True,
             text=True,
         )
-        data = json.loads(result.stdout)
-        subtitle_tracks = []
-
-        if "streams" in data:
-            # Use relative index for subtitle streams (0, 1, 2, ...)
-            relative_index = 0
-            for stream in data["streams"]:
-                if stream.get("codec_type") == "subtitle":
-                    track_info = {
-                        "index": relative_index,  # Relative index for -map 0:s:0, 0:s:1, etc.
-                        "stream_index": stream.get("index", 0),  # Global stream index
-                        "codec": stream.get("codec_name", "unknown"),
-                        "language": stream.get("tags", {}).get("language", "unknown"),
-                        "title": stream.get("tags", {}).get("title", ""),
-                    }
-                    # Create a display name
-                    display_parts = []
-                    if track_info["language"] != "unknown":
-                        display_parts.append(track_info["language"].upper())
-                    if track_info["title"]:
-                        display_parts.append(track_info["title"])
-                    display_parts.append(f"({track_info['codec']})")
-
-                    track_info["display_name"] = (
-                        " ".join(display_parts)
-                        if display_parts
-                        else f"Subtitle Track {relative_index}"
-                    )
-                    subtitle_tracks.append(track_info)
-                    relative_index += 1
-
-        return subtitle_tracks
+        return parse_subtitle_tracks(json.loads(result.stdout))
     except (subprocess.CalledProcessError, json.JSONDecodeError, KeyError) as e:
         print(f"Error getting subtitle tracks: {e}")
         return []
@@ -279,7 +540,53 @@ def calculate_duration(_end_time, _start_time):
     return f"{int(_duration.total_seconds())}"
 
 
-def lossless_mp4(_input, _output, trim_start=None, trim_end=None):
+def _run_async(operation, *args, **kwargs):
+    """
+    Runs an operation of lib/async_encoding.py, where the operations below are
+    implemented once, to completion in a new event loop.
+    """
+    # imported here, lib.async_encoding depends on this module
+    import lib.async_encoding as async_encoding
+
+    return asyncio.run(getattr(async_encoding, operation)(*args, **kwargs))
+
+
+def _video_args(encoder, output_file) -> list:
+    # imported here, lib.encoders depends on this module
+    import lib.encoders as encoders
+
+    return encoders.video_args(encoder, output_file)
+
+
+def _resolve_encoder(encoder) -> str:
+    # imported here, lib.encoders depends on this module
+    import lib.encoders as encoders
+
+    return encoders.resolve(encoder or WEB_ENCODER)
+
+
+def _require(encoders=(), filters=(), operation=None) -> None:
+    """
+    Fails fast when the ffmpeg build lacks what a job needs, see
+    lib/capabilities.py.
+    """
+    # imported here, lib.capabilities depends on this module
+    import lib.capabilities as capabilities
+
+    capabilities.require(encoders, filters, operation)
+
+
+def _pick_encoder(candidates) -> str:
+    """First of the candidate encoders the ffmpeg build has, see lib/capabilities.py."""
+    # imported here, lib.capabilities depends on this module
+    import lib.capabilities as capabilities
+
+    return capabilities.pick_encoder(candidates)
+
+
+def lossless_mp4_command(
+    _input, _output, trim_start=None, trim_end=None, encoder="x264"
+) -> list:
     _lossless_mp4_task = [str(FFMPEG_PATH)]
 
     # Add trim start time before input for faster seeking
@@ -294,22 +601,126 @@ def lossless_mp4(_input, _output, trim_start=None, trim_end=None):
 
     _lossless_mp4_task.extend(
         [
-            "-c:v",
-            "libx264",
-            # ☻"-qp",
-            # "0",
+            # "x264-lossless" for -qp 0
+            *_video_args(encoder, _output),
             "-c:a",
             "aac",
             _output,
         ]
     )
-    print("Processing lossless_mp4")
-    subprocess.run(_lossless_mp4_task)
-    print("Process lossless_mp4 finished!")
+    return _lossless_mp4_task
+
+
+def lossless_mp4(_input, _output, trim_start=None, trim_end=None, encoder="x264"):
+    _run_async("lossless_mp4", _input, _output, trim_start, trim_end, encoder)
+
+
+def resolve_crop(input_file, crop=None, scale_width=None) -> str:
+    """
+    Returns the crop filter to apply to an input, None for no crop.
+
+    Args:
+        crop: None follows AUTO_CROP, True detects the black bars (cached, see
+            lib/crop.py), False never crops, a (width, height, x, y) tuple or a
+            "crop=w:h:x:y" string is used as given.
+        scale_width (int): Width the full frame is scaled to afterwards. The
+            crop is then followed by the scale keeping the same factor, so
+            cropping lowers the encoded size instead of enlarging the picture.
+    """
+    if crop is None:
+        crop = AUTO_CROP
+    if crop is False or not crop:
+        return None
+    # imported here, lib.crop depends on this module
+    import lib.crop as crop_analysis
+
+    if isinstance(crop, str):
+        crop_filter = crop if crop.startswith("crop=") else f"crop={crop}"
+    else:
+        if crop is True:
+            if scale_width:
+                return crop_analysis.scaled_crop_filter(input_file, scale_width)
+            crop = crop_analysis.get_crop(input_file)
+        crop_filter = crop_analysis.crop_filter(crop)
+    if crop_filter and scale_width:
+        source_width = crop_analysis.video_width(input_file)
+        if source_width:
+            scale = crop_analysis.crop_scale_filter(source_width, scale_width)
+        else:
+            # the source width is unknown, at least never enlarge the crop
+            scale = f"scale='min(iw,{scale_width})':-2"
+        crop_filter = f"{crop_filter},{scale}"
+    return crop_filter
+
+
+def resolve_normalize(
+    input_file, normalize=None, trim_start=None, trim_end=None, audio_channel=0
+) -> str:
+    """
+    Returns the audio filter normalising an input, None for no change.
+
+    Args:
+        normalize: None follows NORMALIZE_LOUDNESS, True measures the range
+            (cached, see lib/loudness.py), False never normalises, a string is
+            used as the audio filter.
+        trim_start, trim_end: Range that is encoded, it is what gets measured.
+        audio_channel (int): Audio stream that is encoded.
+    """
+    if normalize is None:
+        normalize = NORMALIZE_LOUDNESS
+    if not normalize:
+        return None
+    if isinstance(normalize, str):
+        return normalize
+    # imported here, lib.loudness depends on this module
+    import lib.loudness as loudness
+
+    return loudness.normalize_filter(input_file, trim_start, trim_end, audio_channel)
 
 
-def encode_web_mp4(input_file: Path, output_file: Path, trim_start=None, trim_end=None):
+def resolve_filters(
+    input_file,
+    crop=None,
+    normalize=None,
+    trim_start=None,
+    trim_end=None,
+    scale_width=None,
+    audio_channel=0,
+) -> tuple:
+    """
+    resolve_crop and resolve_normalize together: when both analyses have to
+    run, the loudness pass (audio only) runs next to the crop detection.
+
+    Returns:
+        tuple: (video filter or None, audio filter or None).
+    """
+    klass = governor.current_job_class()
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        audio_filter = pool.submit(
+            governor.run_as,
+            klass.name,
+            resolve_normalize,
+            input_file,
+            normalize,
+            trim_start,
+            trim_end,
+            audio_channel,
+        )
+        video_filter = resolve_crop(input_file, crop, scale_width)
+        return video_filter, audio_filter.result()
+
+
+def encode_web_mp4_command(
+    input_file: Path,
+    output_file: Path,
+    trim_start=None,
+    trim_end=None,
+    video_filter=None,
+    audio_filter=None,
+    encoder=None,
+) -> list:
     # Ensure the output file has the correct .mp4 extension
+    output_file = Path(output_file)
     output_file_name = f"{output_file.stem}.mp4"
     output_file = output_file.with_name(output_file_name)
 
@@ -332,8 +743,8 @@ def encode_web_mp4(input_file: Path, output_file: Path, trim_start=None, trim_en
             "0",
             "-movflags",
             "use_metadata_tags",
-            "-c:v",
-            "libx264",
+            # see lib/encoders.py, WEB_ENCODER by default
+            *_video_args(encoder or WEB_ENCODER, output_file),
             "-c:a",
             "aac",
             "-ac",
@@ -342,18 +753,11 @@ def encode_web_mp4(input_file: Path, output_file: Path, trim_start=None, trim_en
             "48000",  # Set audio sample rate
             "-b:a",
             "192k",  # Set audio bitrate
-            "-pix_fmt",
-            "yuv420p",
-            "-profile:v",
-            PROFILE,
-            "-level",
-            "3.0",
-            "-crf",
-            CRF_VALUE,
-            "-preset",
-            COMPRESSION_RATIO,
+            # resolve_normalize(...) when normalising the loudness
+            *(["-af", audio_filter] if audio_filter else []),
             "-vf",
-            "scale=1280:-2",
+            # resolve_crop(..., scale_width=WEB_MP4_WIDTH) when cropping
+            video_filter or f"scale={WEB_MP4_WIDTH}:-2",
             "-movflags",
             "+faststart",
             "-threads",
@@ -363,58 +767,68 @@ def encode_web_mp4(input_file: Path, output_file: Path, trim_start=None, trim_en
             str(output_file),
         ]
     )
+    return encode_task
+
+
+def encode_web_mp4(
+    input_file: Path,
+    output_file: Path,
+    trim_start=None,
+    trim_end=None,
+    crop=None,
+    normalize=None,
+    encoder=None,
+):
+    _run_async(
+        "encode_web_mp4",
+        input_file,
+        output_file,
+        trim_start,
+        trim_end,
+        crop,
+        normalize,
+        encoder,
+    )
 
-    print("Processing encode_web_mp4")
-    try:
-        subprocess.run(encode_task, check=True)
-        print("Process encode_web_mp4 finished!")
-    except subprocess.CalledProcessError as e:
-        print(f"An error occurred: {e}")
-        raise
+
+def extract_subtitle_command(_input, _output, subtitle_channel=0) -> list:
+    return [
+        str(FFMPEG_PATH),
+        # "-txt_format",
+        # "text",
+        "-i",
+        str(_input),
+        # "-vsync",
+        "-map",
+        f"0:s:{subtitle_channel}",
+        str(Path(_output).absolute()),
+    ]
 
 
 def extract_subtitle(_input, _output, subtitle_channel=0):
-    print(f"Extracting subtitle from {_input} at channel {subtitle_channel}")
-    _output = Path(_output)
-    if _output:
-        _extract_subtitle = [
-            str(FFMPEG_PATH),
-            # "-txt_format",
-            # "text",
-            "-i",
-            str(_input),
-            # "-vsync",
-            "-map",
-            f"0:s:{subtitle_channel}",
-            str(_output.absolute()),
-        ]
+    return _run_async("extract_subtitle", _input, _output, subtitle_channel)
 
-        subprocess.run(_extract_subtitle, check=True)
-        if _output.is_file():
-            print("Subtitle extracted!")
-            print(f"Subtitle saved at {_output.absolute().as_posix()}")
-            return _output.absolute().as_posix()
-        else:
-            return None
+
+def escape_filter_path(path) -> str:
+    """Escapes a path for use inside a filter argument (e.g. the subtitles filter)."""
+    # Properly escape path for ffmpeg subtitles filter on Windows
+    # Convert to forward slashes and escape the colon after drive letter
+    escaped_path = str(Path(path).absolute()).replace("\\", "/")
+    # Escape colon after drive letter (e.g., D:/ -> D\:/)
+    if len(escaped_path) >= 2 and escaped_path[1] == ":":
+        escaped_path = escaped_path[0] + "\\:" + escaped_path[2:]
+    return escaped_path
 
 
-def burn_subtitles(_input, _output, _subtitle_path, trim_start=None, trim_end=None):
+def burn_subtitles_command(
+    _input, _output, _subtitle_path, trim_start=None, trim_end=None
+) -> list:
     _subtitle_path = Path(_subtitle_path)
-    if not _subtitle_path.exists():
-        print(f"Error: Subtitle file not found: {_subtitle_path}")
-        return
 
     # Convert paths to strings and ensure proper format
     input_path = str(_input)
     output_path = str(_output)
-    subtitle_file = str(_subtitle_path.absolute())
-
-    # Properly escape path for ffmpeg subtitles filter on Windows
-    escaped_subtitle_path = subtitle_file.replace("\\", "/")
-    if len(escaped_subtitle_path) >= 2 and escaped_subtitle_path[1] == ":":
-        escaped_subtitle_path = (
-            escaped_subtitle_path[0] + "\\:" + escaped_subtitle_path[2:]
-        )
+    escaped_subtitle_path = escape_filter_path(_subtitle_path)
 
     # Check subtitle format - DON'T override ASS styling
     subtitle_ext = _subtitle_path.suffix.lower()
@@ -452,59 +866,324 @@ def burn_subtitles(_input, _output, _subtitle_path, trim_start=None, trim_end=No
             output_path,
         ]
     )
+    return _task
 
-    print(f"Burning subtitles from: {_subtitle_path}")
-    print("Starting burn_subtitles")
-    try:
-        subprocess.run(_task, check=True)
-        print("Subtitles burned!")
-    except subprocess.CalledProcessError as e:
-        print(f"Error burning subtitles: {e}")
-        raise
 
+def burn_subtitles(_input, _output, _subtitle_path, trim_start=None, trim_end=None):
+    _run_async("burn_subtitles", _input, _output, _subtitle_path, trim_start, trim_end)
 
-def to_gif(_input, _output, trim_start=None, trim_end=None):
-    if _output:
-        _task = [str(FFMPEG_PATH)]
 
-        # Add trim start time before input for faster seeking
-        if trim_start:
-            _task.extend(["-ss", trim_start])
+def gif_settings(
+    fps=None, width=None, colors=None, dither=None, stats_mode=None
+) -> dict:
+    """Fills the unset gif settings from the GIF_* defaults."""
+    return {
+        "fps": fps or GIF_FPS,
+        "width": GIF_WIDTH if width is None else width,
+        "colors": colors or GIF_COLORS,
+        "dither": dither or GIF_DITHER,
+        "stats_mode": stats_mode or GIF_STATS_MODE,
+    }
 
-        _task.extend(["-i", str(_input)])
 
-        # Add trim end time after input for accurate trimming
-        if trim_end:
-            _task.extend(["-to", trim_end])
+def seek_input_args(trim_start=None, trim_end=None) -> list:
+    """
+    -ss/-to given as input options, ffmpeg seeks to the keyframe before
+    trim_start and decodes from there, both times refer to the source.
+    """
+    args = []
+    if trim_start:
+        args.extend(["-ss", trim_start])
+    if trim_end:
+        args.extend(["-to", trim_end])
+    return args
 
-        _task.extend(["-vf", "fps=30", "-loop", "0", _output])
-        print("Starting gif conversion")
-        subprocess.run(_task)
-        print("Gif conversion done!")
 
+def animation_scale_filter(fps, width) -> str:
+    """fps and scale filters shared by the gif, webp and apng outputs."""
+    scale = f"fps={fps}"
+    if width:
+        scale += f",scale={width}:-1:flags=lanczos"
+    return scale
 
-def gif_to_mp4(_input, _output):
-    if _output:
-        _task = [
-            str(FFMPEG_PATH),
-            "-i",
-            str(_input),
-            "-movflags",
-            "faststart",
-            "-pix_fmt",
-            "yuv420p",
-            "-vf",
-            "scale=trunc(iw/2)*2:trunc(ih/2)*2",
-            str(_output),
-        ]
-        print("Starting gif_to_mp4")
-        subprocess.run(_task)
-        print("gif_to_mp4 done!")
 
+def _gif_filters(settings) -> tuple:
+    scale = animation_scale_filter(settings["fps"], settings["width"])
+    palettegen = (
+        f"palettegen=max_colors={settings['colors']}"
+        f":stats_mode={settings['stats_mode']}"
+    )
+    paletteuse = f"paletteuse=dither={settings['dither']}"
+    if settings["stats_mode"] == "diff":
+        # only redraw the changed rectangle, smaller frames for mostly still clips
+        paletteuse += ":diff_mode=rectangle"
+    return scale, palettegen, paletteuse
+
+
+def gif_palette_command(
+    _input, palette_path, trim_start=None, trim_end=None, **settings
+) -> list:
+    settings = gif_settings(**settings)
+    scale, palettegen, _ = _gif_filters(settings)
+    return [
+        str(FFMPEG_PATH),
+        "-y",
+        *seek_input_args(trim_start, trim_end),
+        "-i",
+        str(_input),
+        "-vf",
+        f"{scale},{palettegen}",
+        "-frames:v",
+        "1",
+        "-update",
+        "1",
+        str(palette_path),
+    ]
 
-def loop_video(
-    _input, _output, _number_of_loops, _gif_flag=False, trim_start=None, trim_end=None
+
+def gif_palette_path(_input, trim_start=None, trim_end=None, **settings) -> Path:
+    """Cache location of the palette of a clip, the dither does not affect it."""
+    settings = gif_settings(**settings)
+    key = cache_key(
+        _input,
+        trim_start=trim_start,
+        trim_end=trim_end,
+        fps=settings["fps"],
+        width=settings["width"],
+        colors=settings["colors"],
+        stats_mode=settings["stats_mode"],
+    )
+    return CACHE_DIR / "palettes" / f"{key}.png"
+
+
+def to_gif_command(
+    _input,
+    _output,
+    trim_start=None,
+    trim_end=None,
+    palette=None,
+    save_palette=None,
+    **settings,
+) -> list:
+    """
+    Builds the gif conversion, using a palette image when given, otherwise the
+    palette is generated in the same run with a split filter graph and, when
+    save_palette is given, also written there for later runs.
+    """
+    settings = gif_settings(**settings)
+    scale, palettegen, paletteuse = _gif_filters(settings)
+
+    # the save dialog already asked before overwriting
+    _task = [
+        str(FFMPEG_PATH),
+        "-y",
+        *seek_input_args(trim_start, trim_end),
+        "-i",
+        str(_input),
+    ]
+    if palette:
+        _task.extend(["-i", str(palette)])
+        graph = f"[0:v]{scale}[x];[x][1:v]{paletteuse}"
+    elif save_palette:
+        graph = (
+            f"[0:v]{scale},split[a][b];[a]{palettegen},split[p][s];"
+            f"[b][p]{paletteuse}[gif]"
+        )
+        _task.extend(["-filter_complex", graph])
+        # the gif stays the last output so the metrics report its size
+        _task.extend(["-map", "[s]", "-frames:v", "1", "-update", "1"])
+        _task.extend([str(save_palette), "-map", "[gif]", "-loop", "0"])
+        _task.append(str(_output))
+        return _task
+    else:
+        graph = f"[0:v]{scale},split[a][b];[a]{palettegen}[p];[b][p]{paletteuse}"
+
+    _task.extend(["-filter_complex", graph, "-loop", "0", str(_output)])
+    return _task
+
+
+def gif_palette(_input, trim_start=None, trim_end=None, **settings) -> Path:
+    """Returns the cached palette of a clip, generating it if needed."""
+    return _run_async("gif_palette", _input, trim_start, trim_end, **settings)
+
+
+def to_gif(
+    _input,
+    _output,
+    trim_start=None,
+    trim_end=None,
+    fps=None,
+    width=None,
+    colors=None,
+    dither=None,
+    cache_palette=True,
 ):
+    """
+    Converts a clip to gif with a palette generated for the clip
+    (palettegen/paletteuse).
+
+    Args:
+        _input: Input video file path.
+        _output: Output gif file path.
+        trim_start: Optional start time for trimming (HH:mm:ss format).
+        trim_end: Optional end time for trimming (HH:mm:ss format).
+        fps, width, colors, dither: Override the GIF_* settings.
+        cache_palette (bool): Reuse the palette kept in CACHE_DIR for the same
+            range and palette settings (e.g. when only the dither changes).
+            Without one the palette is generated in the same run as the gif
+            and stored there.
+    """
+    _run_async(
+        "to_gif",
+        _input,
+        _output,
+        trim_start,
+        trim_end,
+        fps,
+        width,
+        colors,
+        dither,
+        cache_palette,
+    )
+
+
+def to_webp_command(
+    _input,
+    _output,
+    trim_start=None,
+    trim_end=None,
+    fps=None,
+    width=None,
+    quality=None,
+    lossless=None,
+) -> list:
+    fps = fps or GIF_FPS
+    width = GIF_WIDTH if width is None else width
+    quality = WEBP_QUALITY if quality is None else quality
+    lossless = WEBP_LOSSLESS if lossless is None else lossless
+    return [
+        str(FFMPEG_PATH),
+        "-y",
+        *seek_input_args(trim_start, trim_end),
+        "-i",
+        str(_input),
+        "-an",
+        "-sn",
+        "-vf",
+        animation_scale_filter(fps, width),
+        "-c:v",
+        # the webp muxer animates libwebp frames too
+        _pick_encoder(["libwebp_anim", "libwebp"]) or "libwebp_anim",
+        "-lossless",
+        "1" if lossless else "0",
+        "-quality",
+        str(quality),
+        "-compression_level",
+        str(WEBP_COMPRESSION_LEVEL),
+        "-loop",
+        "0",
+        str(_output),
+    ]
+
+
+def to_apng_command(
+    _input, _output, trim_start=None, trim_end=None, fps=None, width=None
+) -> list:
+    fps = fps or GIF_FPS
+    width = GIF_WIDTH if width is None else width
+    return [
+        str(FFMPEG_PATH),
+        "-y",
+        *seek_input_args(trim_start, trim_end),
+        "-i",
+        str(_input),
+        "-an",
+        "-sn",
+        "-vf",
+        animation_scale_filter(fps, width),
+        "-c:v",
+        "apng",
+        # paeth/sub/up chosen per row, smaller files for a little more cpu
+        "-pred",
+        "mixed",
+        "-plays",
+        "0",
+        "-f",
+        "apng",
+        str(_output),
+    ]
+
+
+def to_webp(
+    _input,
+    _output,
+    trim_start=None,
+    trim_end=None,
+    fps=None,
+    width=None,
+    quality=None,
+    lossless=None,
+):
+    """
+    Converts a clip to an animated webp, with the same range, fps and width
+    handling as to_gif.
+
+    Args:
+        quality: 0-100, overrides WEBP_QUALITY.
+        lossless (bool): Overrides WEBP_LOSSLESS.
+    """
+    _run_async(
+        "to_webp", _input, _output, trim_start, trim_end, fps, width, quality, lossless
+    )
+
+
+def to_apng(_input, _output, trim_start=None, trim_end=None, fps=None, width=None):
+    """Converts a clip to an animated png (always lossless)."""
+    _run_async("to_apng", _input, _output, trim_start, trim_end, fps, width)
+
+
+def to_animation(_input, _output, trim_start=None, trim_end=None, **settings):
+    """
+    Converts a clip to gif, webp or apng depending on the output extension
+    (.gif, .webp, .png/.apng).
+
+    Args:
+        settings: fps and width for every format, plus colors/dither for gif and
+            quality/lossless for webp.
+    """
+    if not _output:
+        return
+    suffix = Path(_output).suffix.lower()
+    if suffix == ".webp":
+        to_webp(_input, _output, trim_start, trim_end, **settings)
+    elif suffix in (".png", ".apng"):
+        to_apng(_input, _output, trim_start, trim_end, **settings)
+    else:
+        to_gif(_input, _output, trim_start, trim_end, **settings)
+
+
+def gif_to_mp4_command(_input, _output) -> list:
+    return [
+        str(FFMPEG_PATH),
+        "-i",
+        str(_input),
+        "-movflags",
+        "faststart",
+        "-pix_fmt",
+        "yuv420p",
+        "-vf",
+        "scale=trunc(iw/2)*2:trunc(ih/2)*2",
+        str(_output),
+    ]
+
+
+def gif_to_mp4(_input, _output):
+    _run_async("gif_to_mp4", _input, _output)
+
+
+def loop_video_command(
+    _input, _output, _number_of_loops, trim_start=None, trim_end=None
+) -> list:
     _task = [str(FFMPEG_PATH)]
 
     # Add trim start time before input for faster seeking
@@ -518,33 +1197,27 @@ def loop_video(
         _task.extend(["-to", trim_end])
 
     _task.extend(["-c", "copy", _output])
+    return _task
 
-    print("Starting loop_video")
-    subprocess.run(_task)
-    print("loop_video done!")
-    if _gif_flag:
-        os.remove(_input)
 
+def loop_video(
+    _input, _output, _number_of_loops, _gif_flag=False, trim_start=None, trim_end=None
+):
+    _run_async(
+        "loop_video", _input, _output, _number_of_loops, _gif_flag, trim_start, trim_end
+    )
 
-def video_to_frames(input_file, output_dir, trim_start=None, trim_end=None):
-    """
-    Extract frames from a video file.
-
-    Args:
-        input_file: Path to the input video file.
-        output_dir: Path to the output directory where frames will be saved.
-        trim_start: Optional start time for trimming (HH:mm:ss format).
-        trim_end: Optional end time for trimming (HH:mm:ss format).
-    """
+
+def video_to_frames_command(
+    input_file, output_dir, trim_start=None, trim_end=None
+) -> list:
     # Convert paths to Path objects if they're strings
     input_path = Path(input_file)
     output_path = Path(output_dir)
 
-    # Ensure output directory exists
-    check_directory_exists(output_path)
-
-    # Construct output pattern for frames
-    output_pattern = output_path / "out-%03d.png"
+    # Construct output pattern for frames, padded for up to a million frames so
+    # the names sort in order (see lib/frame_export.py for sized padding)
+    output_pattern = output_path / "out-%06d.png"
 
     # Build ffmpeg command
     task = [str(FFMPEG_PATH)]
@@ -560,57 +1233,119 @@ def video_to_frames(input_file, output_dir, trim_start=None, trim_end=None):
         task.extend(["-to", trim_end])
 
     task.append(str(output_pattern))
+    return task
+
+
+def video_to_frames(input_file, output_dir, trim_start=None, trim_end=None):
+    """
+    Extract frames from a video file.
+
+    Args:
+        input_file: Path to the input video file.
+        output_dir: Path to the output directory where frames will be saved.
+        trim_start: Optional start time for trimming (HH:mm:ss format).
+        trim_end: Optional end time for trimming (HH:mm:ss format).
+    """
+    _run_async("video_to_frames", input_file, output_dir, trim_start, trim_end)
 
-    print("Starting video_to_frames")
-    try:
-        subprocess.run(task, check=True)
-        print("video_to_frames done!")
-    except subprocess.CalledProcessError as e:
-        print(f"Error during frame extraction: {e}")
-        raise
 
+def batch_encode(
+    _media_folder,
+    concurrency=None,
+    skip_duplicates=False,
+    crop=None,
+    normalize=None,
+    encoder=None,
+):
+    """
+    Encodes videos to web mp4 in an "encoded" folder next to each video.
 
-def batch_encode(_media_folder):
+    Args:
+        _media_folder: Folder with the videos, or a list of video paths such as
+            a lib.library query result.
+        concurrency: "adaptive" or a fixed number of concurrent encodes,
+            defaults to BATCH_CONCURRENCY.
+        skip_duplicates (bool): Encode only the best copy of videos that are
+            near duplicates of each other (see lib/dedupe.py).
+        crop: Black bar cropping of every video, see resolve_crop.
+        normalize: Loudness normalisation of every video, see
+            resolve_normalize. All the files are measured at once before the
+            first encode starts.
+        encoder: Encoder profile of every video (see lib/encoders.py),
+            defaults to WEB_ENCODER.
+
+    A failed encode does not stop the others, its error is raised once they
+    are done (see scheduler.run_jobs).
+    """
     if _media_folder:
-        _encoded_path = os.path.join(_media_folder, "encoded")
-        if not os.path.exists(_encoded_path):
-            os.makedirs(_encoded_path)
-        directory = os.listdir(_media_folder)
-        for filename in directory:
-            if filename[-3:].lower() in SUPPORTED_MEDIA:
-                _input = os.path.join(_media_folder, filename)
-                _output = os.path.join(
-                    _encoded_path, f"{filename[:len(filename) - 4]}.mp4"
-                )
-                encode_web_mp4(
-                    _input,
-                    _output,
-                )
+        if concurrency is None:
+            concurrency = BATCH_CONCURRENCY
+        # an encoder missing from the ffmpeg build fails here, not in the jobs
+        encoder = _resolve_encoder(encoder)
+        jobs = [
+            partial(
+                encode_web_mp4,
+                str(input_file),
+                str(output_file),
+                crop=crop,
+                normalize=normalize,
+                encoder=encoder,
+            )
+            for input_file, output_file in batch_encode_jobs(
+                _media_folder, skip_duplicates, normalize
+            )
+        ]
+        # batch jobs run in the background class so they never starve the GUI
+        scheduler.run_jobs(jobs, concurrency, job_class="background")
         print("Encoding done!")
 
 
-def batch_extract_subtitles(media_folder: str, subtitle_channel: int = 0) -> None:
+def batch_encode_jobs(_media_folder, skip_duplicates=False, normalize=None) -> list:
+    """
+    The (video, output) pairs of a batch encode, creating the "encoded"
+    folders. When normalising, all the videos are measured at once here.
+    """
+    files = media_files(_media_folder)
+    if skip_duplicates:
+        # imported here, lib.dedupe depends on this module
+        import lib.dedupe as dedupe
+
+        files = dedupe.skip_duplicates(files)
+    if normalize is None:
+        normalize = NORMALIZE_LOUDNESS
+    if normalize is True:
+        # imported here, lib.loudness depends on this module
+        import lib.loudness as loudness
+
+        loudness.measure_many(files)
+    jobs = []
+    for file_path in files:
+        _encoded_path = file_path.parent / "encoded"
+        _encoded_path.mkdir(exist_ok=True)
+        jobs.append((file_path, _encoded_path / f"{file_path.stem}.mp4"))
+    return jobs
+
+
+def batch_extract_subtitles(media_folder, subtitle_channel: int = 0) -> None:
+    """
+    Extracts a subtitle stream of every video next to the video.
+
+    Args:
+        media_folder: Folder with the videos, or a list of video paths.
+        subtitle_channel (int): Subtitle stream to extract.
+    """
     if media_folder:
-        media_path = Path(media_folder)
-        for file_path in media_path.iterdir():
-            if file_path.suffix[1:].lower() in SUPPORTED_MEDIA:
-                subtitle_extension = get_subtitle_format(file_path, subtitle_channel)
-                output_path = media_path / f"{file_path.stem}.{subtitle_extension}"
-                print("Processing batch extract subtitles...")
-                extract_subtitle(file_path, output_path, subtitle_channel)
+        for file_path in media_files(media_folder):
+            subtitle_extension = get_subtitle_format(file_path, subtitle_channel)
+            output_path = file_path.parent / f"{file_path.stem}.{subtitle_extension}"
+            print("Processing batch extract subtitles...")
+            extract_subtitle(file_path, output_path, subtitle_channel)
         print("Batch extract subtitles done!")
 
 
-def trim_basic(_start, _end, _video_input, _output, video_channel=0, audio_channel=0):
-    """
-    :param _start: time to start the cutting in this format HH:mm:ss
-    :param _end: time to end the cutting in this format HH:mm:ss
-    :param _video_input: path of the file to _trim
-    :param _output: path and name of the new clip c:\clips\clip.mkv
-    :param video_channel: the default video stream is 0
-    :param audio_channel: the default audio stream is 0
-    :return: runs the ffmpeg command to _trim the video and create the new clip
-    """
+def trim_basic_command(
+    _start, _end, _video_input, _output, video_channel=0, audio_channel=0
+) -> list:
     # simple ffmpeg trim_basic
     trim_task = [
         str(FFMPEG_PATH),
@@ -631,10 +1366,22 @@ def trim_basic(_start, _end, _video_input, _output, video_channel=0, audio_chann
         _start,
         str(_output),
     ]
+    return trim_task
+
 
-    print("Processing trim basic...")
-    subprocess.run(trim_task)
-    print("Trim basic done!")
+def trim_basic(_start, _end, _video_input, _output, video_channel=0, audio_channel=0):
+    """
+    :param _start: time to start the cutting in this format HH:mm:ss
+    :param _end: time to end the cutting in this format HH:mm:ss
+    :param _video_input: path of the file to _trim
+    :param _output: path and name of the new clip c:\clips\clip.mkv
+    :param video_channel: the default video stream is 0
+    :param audio_channel: the default audio stream is 0
+    :return: runs the ffmpeg command to _trim the video and create the new clip
+    """
+    _run_async(
+        "trim_basic", _start, _end, _video_input, _output, video_channel, audio_channel
+    )
 
 
 def trim_with_hard_subs(
@@ -646,6 +1393,7 @@ def trim_with_hard_subs(
     audio_channel=0,
     subtitles_channel=0,
     subtitles_path=None,
+    crop=None,
 ):
     """
     :param _start: time to start the cutting in this format HH:mm:ss.
@@ -656,31 +1404,41 @@ def trim_with_hard_subs(
     :param video_channel: the default video stream is 0.
     :param audio_channel: the default audio stream is 0.
     :param subtitle_channel: the default subtitle stream is 0, if internal subs are available.
+    :param crop: black bar cropping applied before the subtitles, see resolve_crop.
     :return: runs the ffmpeg command to trim_with_hard_subs the video and create the new clip.
     """
-    _base_dir = os.path.split(_video_input)[0]
-    _base_name = os.path.split(_video_input)[1]
+    _run_async(
+        "trim_with_hard_subs",
+        _start,
+        _end,
+        _video_input,
+        _output,
+        video_channel,
+        audio_channel,
+        subtitles_channel,
+        subtitles_path,
+        crop,
+    )
 
-    _temp_subtitle = f"{_output[:len(_output)-4]}.srt"
-    _temp_subtitle = Path(_temp_subtitle)
 
-    if not subtitles_path:
-        # internal subs
-        subtitles_path = extract_subtitle(
-            _video_input, _temp_subtitle.absolute().as_posix(), subtitles_channel
-        )
-    else:
-        # external subs
-        copyfile(subtitles_path, _temp_subtitle.absolute().as_posix())
+def hard_subs_temp_subtitle(_output) -> Path:
+    """Path of the subtitle copy trim_with_hard_subs burns, next to the output."""
+    _output = str(_output)
+    return Path(f"{_output[:len(_output)-4]}.srt")
 
-    # Properly escape path for ffmpeg subtitles filter on Windows
-    # Convert to forward slashes and escape the colon after drive letter
-    _subtitles_filter_path = str(_temp_subtitle.absolute()).replace("\\", "/")
-    # Escape colon after drive letter (e.g., D:/ -> D\:/)
-    if len(_subtitles_filter_path) >= 2 and _subtitles_filter_path[1] == ":":
-        _subtitles_filter_path = (
-            _subtitles_filter_path[0] + "\\:" + _subtitles_filter_path[2:]
-        )
+
+def trim_with_hard_subs_command(
+    _start,
+    _end,
+    _video_input,
+    _output,
+    subtitle_file,
+    video_channel=0,
+    audio_channel=0,
+    crop_filter=None,
+) -> list:
+    _temp_subtitle = Path(subtitle_file)
+    _subtitles_filter_path = escape_filter_path(_temp_subtitle)
     print(f"{_subtitles_filter_path=}")
 
     # Check subtitle format and use appropriate filter with scaling for 4K
@@ -696,8 +1454,12 @@ def trim_with_hard_subs(
         # Use 'subtitles' filter for SRT and other formats (no scaling needed)
         subtitle_filter = f"subtitles='{_subtitles_filter_path}'"
 
+    # crop before burning so the subtitles are placed inside the picture
+    if crop_filter:
+        subtitle_filter = f"{crop_filter},{subtitle_filter}"
+
     # Convert all paths to strings for subprocess
-    trim_with_subs_task = [
+    return [
         str(FFMPEG_PATH),
         "-ss",
         _start,
@@ -726,14 +1488,8 @@ def trim_with_hard_subs(
         str(_output),
     ]
 
-    print("Processing trim with hard subs")
-    subprocess.run(trim_with_subs_task, check=True)
-    if _temp_subtitle.exists():
-        os.remove(_temp_subtitle)
-    print("Trim with hard subs done!")
 
-
-def trim_duration(
+def trim_duration_command(
     start: str,
     duration: str,
     input_file: str,
@@ -741,20 +1497,7 @@ def trim_duration(
     video_channel: int = 0,
     audio_channel: int = 0,
     subtitle_channel: int = 0,
-):
-    """
-    Trims a video file to the specified duration from the start time, copies the streams,
-    and resets timestamps.
-
-    Args:
-    start (str): Start time for trimming.
-    duration (str): Duration to keep after the start time.
-    input_file (str): Path to the input video file.
-    output_file (str): Path to the output video file.
-    video_channel (int, optional): Video channel to map. Defaults to 0.
-    audio_channel (int, optional): Audio channel to map. Defaults to 0.
-    subtitle_channel (int, optional): Subtitle channel to map. Defaults to 0.
-    """
+) -> list:
     # Convert paths to strings if they're Path objects
     input_file = str(input_file)
     output_file = str(output_file)
@@ -780,22 +1523,44 @@ def trim_duration(
         "copy",
         output_file,
     ]
+    return trim_command
 
-    # Execute the command
-    print("Starting trim_duration")
-    subprocess.run(trim_command, check=True)
-    print("trim_duration done!")
 
-
-def fade(input_file: str, output_file: str, video_duration: int) -> None:
+def trim_duration(
+    start: str,
+    duration: str,
+    input_file: str,
+    output_file: str,
+    video_channel: int = 0,
+    audio_channel: int = 0,
+    subtitle_channel: int = 0,
+):
     """
-    Applies a fade-out effect to the video and audio of the input file.
+    Trims a video file to the specified duration from the start time, copies the streams,
+    and resets timestamps.
 
     Args:
-        input_file (str): Path to the input video file.
-        output_file (str): Path to the output video file.
-        video_duration (int): Duration of the video in seconds.
+    start (str): Start time for trimming.
+    duration (str): Duration to keep after the start time.
+    input_file (str): Path to the input video file.
+    output_file (str): Path to the output video file.
+    video_channel (int, optional): Video channel to map. Defaults to 0.
+    audio_channel (int, optional): Audio channel to map. Defaults to 0.
+    subtitle_channel (int, optional): Subtitle channel to map. Defaults to 0.
     """
+    _run_async(
+        "trim_duration",
+        start,
+        duration,
+        input_file,
+        output_file,
+        video_channel,
+        audio_channel,
+        subtitle_channel,
+    )
+
+
+def fade_command(input_file: str, output_file: str, video_duration: int) -> list:
     fade_duration = 1  # Duration of the fade effect in seconds
     fade_start = video_duration - fade_duration  # Start time of the fade effect
 
@@ -810,52 +1575,49 @@ def fade(input_file: str, output_file: str, video_duration: int) -> None:
         f"afade=t=out:st={fade_start}:d={fade_duration}",  # Audio fade
         str(output_file),
     ]
-
-    print("Starting fade effect")
-    try:
-        subprocess.run(task, check=True)
-        print("Fade effect applied successfully to both video and audio.")
-    except subprocess.CalledProcessError as e:
-        print(f"An error occurred during the fade effect: {e}")
-        raise
+    return task
 
 
-def convert_3gp_to_mp4(input_file, output_file):
+def fade(input_file: str, output_file: str, video_duration: int) -> None:
     """
-    Convert a .3gp video to mp4 format.
+    Applies a fade-out effect to the video and audio of the input file.
 
-    :param input_file: Path to the input .3gp file.
-    :param output_file: Path to the output mp4 file.
+    Args:
+        input_file (str): Path to the input video file.
+        output_file (str): Path to the output video file.
+        video_duration (int): Duration of the video in seconds.
     """
+    _run_async("fade", input_file, output_file, video_duration)
+
+
+def convert_3gp_to_mp4_command(input_file, output_file, encoder="x264") -> list:
     # Use FFmpeg to perform the conversion
     conversion_command = [
         str(FFMPEG_PATH),
         "-i",
         str(input_file),
-        "-c:v",
-        "libx264",
+        *_video_args(encoder, output_file),
         "-c:a",
         "aac",
         str(output_file),
     ]
-
-    try:
-        subprocess.run(conversion_command, check=True)
-        print(f"Conversion successful. {input_file} converted to {output_file}")
-    except subprocess.CalledProcessError as e:
-        print(f"Error during conversion: {e}")
+    return conversion_command
 
 
-def extract_audio(_input, _output, trim_start=None, trim_end=None):
+def convert_3gp_to_mp4(input_file, output_file, encoder="x264"):
     """
-    Extract audio from video file.
+    Convert a .3gp video to mp4 format.
 
-    Args:
-        _input: Input video file path
-        _output: Output audio file path (e.g. output.mp3)
-        trim_start: Optional start time for trimming (HH:mm:ss format)
-        trim_end: Optional end time for trimming (HH:mm:ss format)
+    :param input_file: Path to the input .3gp file.
+    :param output_file: Path to the output mp4 file.
+    :param encoder: Encoder profile, see lib/encoders.py.
     """
+    _run_async("convert_3gp_to_mp4", input_file, output_file, encoder)
+
+
+def extract_audio_command(
+    _input, _output, trim_start=None, trim_end=None, audio_filter=None
+) -> list:
     output_ext = Path(_output).suffix.lower()
 
     # Base command
@@ -873,16 +1635,27 @@ def extract_audio(_input, _output, trim_start=None, trim_end=None):
 
     _task.append("-vn")  # Disable video
 
+    # resolve_normalize(...) when normalising the loudness
+    if audio_filter:
+        _task.extend(["-af", audio_filter])
+
     # Add format-specific encoding parameters
     if output_ext == ".mp3":
-        _task.extend(
-            [
-                "-c:a",
-                "libmp3lame",
-                "-q:a",
-                "2",  # VBR quality (0-9, lower is better)
-            ]
-        )
+        mp3_encoder = _pick_encoder(["libmp3lame", "mp3_mf"])
+        if mp3_encoder is None:
+            _require(["libmp3lame"], operation="extract_audio")
+        if mp3_encoder == "mp3_mf":
+            # Windows builds without lame, Media Foundation has no VBR quality
+            _task.extend(["-c:a", "mp3_mf", "-b:a", "192k"])
+        else:
+            _task.extend(
+                [
+                    "-c:a",
+                    "libmp3lame",
+                    "-q:a",
+                    "2",  # VBR quality (0-9, lower is better)
+                ]
+            )
     elif output_ext == ".wav":
         _task.extend(
             [
@@ -890,6 +1663,8 @@ def extract_audio(_input, _output, trim_start=None, trim_end=None):
                 "pcm_s16le",  # Standard 16-bit PCM
             ]
         )
+    elif output_ext == ".ogg" and _pick_encoder(["libvorbis", "libopus"]) == "libopus":
+        _task.extend(["-c:a", "libopus", "-b:a", "128k"])
     elif output_ext == ".ogg":
         _task.extend(
             [
@@ -899,21 +1674,33 @@ def extract_audio(_input, _output, trim_start=None, trim_end=None):
                 "4",  # Quality scale (0-10)
             ]
         )
+    elif audio_filter:
+        # filtered audio cannot be stream copied
+        _task.extend(
+            FILTERED_AUDIO_CODECS.get(output_ext, ["-c:a", "aac", "-b:a", "192k"])
+        )
     else:
         _task.extend(["-c:a", "copy"])  # Default to stream copy for other formats
 
     _task.append(_output)
+    return _task
 
-    print("Starting audio extraction...")
-    try:
-        subprocess.run(_task, check=True)
-        print("Audio extraction complete!")
-    except subprocess.CalledProcessError as e:
-        print(f"Error during audio extraction: {e}")
-        raise
 
+def extract_audio(_input, _output, trim_start=None, trim_end=None, normalize=None):
+    """
+    Extract audio from video file.
+
+    Args:
+        _input: Input video file path
+        _output: Output audio file path (e.g. output.mp3)
+        trim_start: Optional start time for trimming (HH:mm:ss format)
+        trim_end: Optional end time for trimming (HH:mm:ss format)
+        normalize: Loudness normalisation, see resolve_normalize
+    """
+    _run_async("extract_audio", _input, _output, trim_start, trim_end, normalize)
 
-def image_audio_to_video(image_path, audio_path, output_path):
+
+def image_audio_to_video(image_path, audio_path, output_path, fast=True, encoder=None):
     """
     Create a video from a single image and audio file.
     The video duration will match the audio duration.
@@ -922,16 +1709,170 @@ def image_audio_to_video(image_path, audio_path, output_path):
         image_path (str): Path to the input image file
         audio_path (str): Path to the input audio file
         output_path (str): Path to the output video file
+        fast (bool): Encode a short clip of the still once and loop it with
+            stream copy, copying the audio when the container allows it,
+            instead of encoding every frame at 30 fps (see still_clip).
+        encoder (str): Encoder profile of the picture (see lib/encoders.py),
+            defaults to WEB_ENCODER.
     """
-    # Get audio duration to determine video length
-    audio_duration = get_video_duration(audio_path)
+    _run_async(
+        "image_audio_to_video", image_path, audio_path, output_path, fast, encoder
+    )
 
-    if audio_duration <= 0:
-        print("Error: Could not determine audio duration")
-        return
 
-    # FFmpeg command to create video from image and audio
+def _still_video_args(encoder, output_path) -> list:
+    """Encoder profile options, tuned for a still picture when libx264."""
+    args = _video_args(encoder or WEB_ENCODER, output_path)
+    # stillimage is a libx264 tune and a profile's own tune comes first
+    if "libx264" in args and "-tune" not in args:
+        args.extend(["-tune", "stillimage"])
+    if "-pix_fmt" not in args:
+        args.extend(["-pix_fmt", "yuv420p"])
+    return args
+
+
+def still_clip_command(image_path, output_path, encoder=None) -> list:
+    """Encodes STILL_KEYFRAME_SECONDS of the picture at STILL_FPS, one gop."""
+    gop = max(1, int(STILL_FPS * STILL_KEYFRAME_SECONDS))
+    return [
+        str(FFMPEG_PATH),
+        "-y",
+        "-loop",
+        "1",
+        "-framerate",
+        str(STILL_FPS),
+        "-i",
+        str(image_path),
+        "-t",
+        str(STILL_KEYFRAME_SECONDS),
+        # yuv420p needs even dimensions
+        "-vf",
+        "scale=trunc(iw/2)*2:trunc(ih/2)*2",
+        *_still_video_args(encoder, output_path),
+        "-r",
+        str(STILL_FPS),
+        "-g",
+        str(gop),
+        "-f",
+        "mp4",
+        str(output_path),
+    ]
+
+
+def still_clip_path(image_path, encoder=None) -> Path:
+    """Cache location of the clip of a still picture."""
+    key = cache_key(
+        image_path,
+        fps=STILL_FPS,
+        keyframe_seconds=STILL_KEYFRAME_SECONDS,
+        encoder=_resolve_encoder(encoder),
+    )
+    return CACHE_DIR / "stills" / f"{key}.mp4"
+
+
+def still_clip(image_path, encoder=None) -> Path:
+    """
+    Returns the cached clip of a still picture, encoding it if needed.
+
+    The clip is looped with stream copy for as long as the audio lasts, so the
+    picture is encoded once however long the audio is, and once for a whole
+    batch.
+    """
+    return _run_async("still_clip", image_path, encoder)
+
+
+def audio_codec(audio_path) -> str:
+    """Returns the codec name of the first audio stream, None if unknown."""
+    result = subprocess.run(
+        streams_command(audio_path, "a:0"),
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        return parse_audio_codec(json.loads(result.stdout))
+    except ValueError:
+        return None
+
+
+def parse_audio_codec(data: dict) -> str:
+    try:
+        return data["streams"][0]["codec_name"]
+    except (KeyError, IndexError):
+        return None
+
+
+def can_copy_audio(audio_path, output_path) -> bool:
+    """True when the audio can be stream copied into the output container."""
+    codecs = COPYABLE_AUDIO.get(Path(output_path).suffix.lower(), [])
+    return audio_codec(audio_path) in codecs
+
+
+def still_audio_mux_command(still_path, audio_path, output_path, copy_audio) -> list:
     task = [
+        str(FFMPEG_PATH),
+        "-y",
+        "-stream_loop",
+        "-1",
+        "-i",
+        str(still_path),
+        "-i",
+        str(audio_path),
+        "-map",
+        "0:v:0",
+        "-map",
+        "1:a:0",
+        "-c:v",
+        "copy",
+    ]
+    if copy_audio:
+        task.extend(["-c:a", "copy"])
+    else:
+        task.extend(["-c:a", "aac", "-b:a", "192k"])
+    task.extend(["-shortest", "-movflags", "+faststart", str(output_path)])
+    return task
+
+
+def batch_image_audio_to_video(
+    image_path, audio_folder, output_folder=None, encoder=None
+):
+    """
+    Makes one video per audio file of a folder, all showing the same picture.
+
+    The picture is encoded once (still_clip) and every video is a stream copy
+    mux of that clip with the audio.
+
+    Args:
+        image_path: Picture shown in every video.
+        audio_folder: Folder with the audio files (SUPPORTED_AUDIO).
+        output_folder: Defaults to <audio_folder>/video.
+        encoder (str): Encoder profile of the picture (see lib/encoders.py),
+            defaults to WEB_ENCODER.
+    """
+    audio_folder = Path(audio_folder)
+    output_folder = Path(output_folder or audio_folder / "video")
+    output_folder.mkdir(parents=True, exist_ok=True)
+    clip = still_clip(image_path, encoder)
+
+    for audio_path in sorted(audio_folder.iterdir()):
+        if audio_path.suffix[1:].lower() not in SUPPORTED_AUDIO:
+            continue
+        output_path = output_folder / f"{audio_path.stem}.mp4"
+        print(f"Processing {audio_path.name}")
+        task = still_audio_mux_command(
+            clip, audio_path, output_path, can_copy_audio(audio_path, output_path)
+        )
+        try:
+            run_ffmpeg(task, "image_audio_to_video", check=True)
+        except subprocess.CalledProcessError as e:
+            print(f"Error during image+audio to video conversion: {e}")
+    print("Batch image + audio to video done!")
+
+
+def image_audio_to_video_command(
+    image_path, audio_path, output_path, encoder=None
+) -> list:
+    # FFmpeg command to create video from image and audio
+    return [
         str(FFMPEG_PATH),
         "-y",  # Overwrite output file without asking
         "-loop",
@@ -940,34 +1881,18 @@ def image_audio_to_video(image_path, audio_path, output_path):
         str(image_path),  # Input image
         "-i",
         str(audio_path),  # Input audio
-        "-c:v",
-        "libx264",  # Video codec
-        "-tune",
-        "stillimage",  # Optimize for still images
+        # Video codec, tuned for still images when libx264
+        *_still_video_args(encoder, output_path),
         "-c:a",
         "aac",  # Audio codec
         "-b:a",
         "192k",  # Audio bitrate
-        "-pix_fmt",
-        "yuv420p",  # Pixel format for compatibility
         "-shortest",  # End when shortest input ends (audio)
         "-r",
         "30",  # Frame rate
         str(output_path),
     ]
 
-    print(f"Creating video from image: {image_path}")
-    print(f"Audio file: {audio_path}")
-    print(f"Output: {output_path}")
-    print(f"Duration: {audio_duration:.2f} seconds")
-
-    try:
-        subprocess.run(task, check=True)
-        print("Image + Audio to Video conversion complete!")
-    except subprocess.CalledProcessError as e:
-        print(f"Error during image+audio to video conversion: {e}")
-        raise
-
 
 def trim_preset(
     _video_location,
@@ -1061,78 +1986,32 @@ def trim_preset_new(
     subtitles_status,
     audio_channel=0,
     subtitles_channel=0,
+    crop=None,
+    normalize=None,
+    encoder=None,
 ):
     """
     Trims and encodes video with optional hard subtitles, handling temporary files cleanly.
-    """
-    # Convert string paths to Path objects
-    video_path = Path(video_path)
-    subtitles_path = Path(subtitles_path)
-    output_path = Path(output_path)
-    output_base_path = output_path.parent
-
-    output_base_path = output_path.parent
-
-    # Temporary files
-    temp_trim_output = output_base_path / f"basic_{video_path.name}"
-    temp_duration_output = output_base_path / f"duration_{video_path.name}"
-    temp_encoded_output = output_base_path / f"encoded_{output_path.name}"
-    print(f"{temp_trim_output=}")
-    print(f"{temp_duration_output=}")
-    print(f"{temp_encoded_output=}")
 
-    try:
-        # Trim with hard subtitles if required
-        if "external" in subtitles_status:
-            trim_with_hard_subs(
-                trim_start,
-                trim_end,
-                str(video_path),
-                str(temp_trim_output),
-                subtitles_path=str(subtitles_path),
-                audio_channel=audio_channel,
-            )
-        else:
-            trim_with_hard_subs(
-                trim_start,
-                trim_end,
-                str(video_path),
-                str(temp_trim_output),
-                audio_channel=audio_channel,
-                subtitles_channel=subtitles_channel,
-            )
-
-        # Calculate video duration
-        video_duration = calculate_duration(trim_end, trim_start)
-
-        # Trim duration
-        trim_duration(
-            "00:00:00",
-            video_duration,
-            str(temp_trim_output),
-            str(temp_duration_output),
-        )
-
-        # Encode to web mp4 format
-        encode_web_mp4(temp_duration_output, temp_encoded_output)
-
-        # Get video duration in seconds
-        video_duration_seconds = int(get_video_duration(str(temp_encoded_output)))
-
-        # Clean text for output
-        output_cleaned = clean_text(str(output_path))
-
-        # Apply fade effect
-        fade(str(temp_encoded_output), output_cleaned, video_duration_seconds)
-
-    finally:
-        print("Cleaning up temporary files...")
-        # Clean up temporary files
-        for temp_file in [temp_trim_output, temp_duration_output, temp_encoded_output]:
-            if temp_file.exists():
-                temp_file.unlink()
-
-    print("All Done!")
+    The black bars (see resolve_crop) are cropped in the first step, every
+    later step works on the smaller picture. The loudness of the range (see
+    resolve_normalize) is measured on the source while the first step runs and
+    applied in the web mp4 encode.
+    """
+    _run_async(
+        "trim_preset_new",
+        video_path,
+        subtitles_path,
+        output_path,
+        trim_start,
+        trim_end,
+        subtitles_status,
+        audio_channel,
+        subtitles_channel,
+        crop,
+        normalize,
+        encoder,
+    )
 
 
 if __name__ == "__main__":
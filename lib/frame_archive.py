@@ -0,0 +1,331 @@
+import io
+import os
+import struct
+import tarfile
+import zipfile
+from pathlib import Path
+
+import lib.encoding as encoding
+import lib.frame_export as frame_export
+
+# -------------------------------------------------------------------------------
+# CONFIGURABLE SETTINGS
+# -------------------------------------------------------------------------------
+
+# digits of the frame number in the archive member names
+NAME_DIGITS = 6
+# ==============================================================================
+
+# chunked container (.fpak):
+#   header  MAGIC, format (4 bytes, e.g. b"png\0")
+#   frames  image bytes back to back
+#   index   one INDEX_ENTRY (offset, length) per frame
+#   footer  FOOTER (index offset, frame count) + MAGIC
+MAGIC = b"FPAK0001"
+INDEX_ENTRY = struct.Struct("<QI")
+FOOTER = struct.Struct("<QQ")
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+
+
+class ImageStreamSplitter:
+    """
+    Splits the byte stream of ffmpeg's image2pipe muxer into single images and
+    calls on_image with each one, without buffering more than one image.
+
+    png is split on its chunk structure (up to IEND), jpg on the end of image
+    marker (0xFFD9 cannot appear inside entropy coded data) and webp on the
+    RIFF size.
+    """
+
+    def __init__(self, image_format, on_image):
+        self.image_format = image_format
+        self.on_image = on_image
+        self.buffer = bytearray()
+        self.position = 0
+
+    def feed(self, chunk: bytes) -> None:
+        self.buffer += chunk
+        while True:
+            end = self._image_end()
+            if end is None:
+                break
+            self.on_image(bytes(self.buffer[:end]))
+            del self.buffer[:end]
+            self.position = 0
+
+    def close(self) -> None:
+        if self.buffer:
+            raise ValueError(f"{len(self.buffer)} trailing bytes in the frame stream")
+
+    def _image_end(self):
+        if self.image_format == "png":
+            return self._png_end()
+        if self.image_format in ("jpg", "jpeg"):
+            end = self.buffer.find(b"\xff\xd9", max(self.position, 2))
+            if end < 0:
+                self.position = max(len(self.buffer) - 1, 2)
+                return None
+            return end + 2
+        if self.image_format == "webp":
+            if len(self.buffer) < 8:
+                return None
+            size = struct.unpack_from("<I", self.buffer, 4)[0] + 8
+            size += size % 2
+            return size if len(self.buffer) >= size else None
+        raise ValueError(f"Unknown frame format: {self.image_format}")
+
+    def _png_end(self):
+        # self.position remembers the first chunk not parsed yet
+        position = self.position or len(PNG_SIGNATURE)
+        while len(self.buffer) >= position + 8:
+            length, kind = struct.unpack_from(">I4s", self.buffer, position)
+            chunk_end = position + 12 + length
+            if len(self.buffer) < chunk_end:
+                break
+            position = chunk_end
+            if kind == b"IEND":
+                return position
+        self.position = position
+        return None
+
+
+class TarWriter:
+    """Streams frames into a tar, plus a .idx sidecar with the data offsets."""
+
+    def __init__(self, path, image_format):
+        self.path = Path(path)
+        self.image_format = image_format
+        self.file = open(self.path, "wb")
+        self.tar = tarfile.open(fileobj=self.file, mode="w|")
+        self.index = []
+
+    def add(self, number, data) -> None:
+        info = tarfile.TarInfo(frame_name(number, self.image_format))
+        info.size = len(data)
+        self.tar.addfile(info, io.BytesIO(data))
+        # the data follows the 512 byte header the tar module just wrote
+        self.index.append((self.tar.offset - _padded(len(data)), len(data)))
+
+    def close(self) -> None:
+        self.tar.close()
+        self.file.close()
+        with open(index_path(self.path), "wb") as index_file:
+            _write_index(index_file, self.index, 0)
+
+
+class ZipWriter:
+    """Streams frames into an uncompressed zip (the images are compressed)."""
+
+    def __init__(self, path, image_format):
+        self.image_format = image_format
+        self.zip = zipfile.ZipFile(path, "w", compression=zipfile.ZIP_STORED)
+
+    def add(self, number, data) -> None:
+        self.zip.writestr(frame_name(number, self.image_format), data)
+
+    def close(self) -> None:
+        self.zip.close()
+
+
+class ChunkedWriter:
+    """Writes the .fpak container: frames back to back and an offset index."""
+
+    def __init__(self, path, image_format):
+        self.file = open(path, "wb")
+        self.file.write(MAGIC + image_format.encode("ascii")[:4].ljust(4, b"\0"))
+        self.index = []
+
+    def add(self, number, data) -> None:
+        self.index.append((self.file.tell(), len(data)))
+        self.file.write(data)
+
+    def close(self) -> None:
+        _write_index(self.file, self.index, self.file.tell())
+        self.file.close()
+
+
+WRITERS = {".tar": TarWriter, ".zip": ZipWriter, ".fpak": ChunkedWriter}
+
+
+def _padded(size) -> int:
+    return (size + 511) // 512 * 512
+
+
+def _write_index(file, index, index_offset) -> None:
+    for offset, length in index:
+        file.write(INDEX_ENTRY.pack(offset, length))
+    file.write(FOOTER.pack(index_offset, len(index)) + MAGIC)
+
+
+def _read_footer(file):
+    file.seek(-(FOOTER.size + len(MAGIC)), os.SEEK_END)
+    footer = file.read(FOOTER.size + len(MAGIC))
+    if footer[FOOTER.size :] != MAGIC:
+        raise ValueError("Not a frame index")
+    return FOOTER.unpack(footer[: FOOTER.size])
+
+
+def frame_name(number, image_format) -> str:
+    return f"frame_{number:0{NAME_DIGITS}d}.{image_format}"
+
+
+def index_path(archive_path) -> Path:
+    archive_path = Path(archive_path)
+    return archive_path.with_name(archive_path.name + ".idx")
+
+
+def archive_command(
+    input_file,
+    trim_start=None,
+    trim_end=None,
+    mode="all",
+    value=None,
+    image_format=None,
+) -> list:
+    """Builds the ffmpeg command writing the selected frames to stdout."""
+    image_format = image_format or frame_export.FRAME_FORMAT
+    input_args, video_filter = frame_export.selection_args(mode, value)
+    task = [str(encoding.FFMPEG_PATH), *input_args]
+    task.extend(encoding.seek_input_args(trim_start, trim_end))
+    task.extend(["-i", str(input_file), "-map", "0:v:0"])
+    if video_filter:
+        task.extend(["-vf", video_filter])
+    if mode != "fps":
+        task.extend(["-fps_mode", "passthrough"])
+    task.extend(frame_export.format_args(image_format))
+    task.extend(["-f", "image2pipe", "-"])
+    return task
+
+
+def archive_frames(
+    input_file,
+    archive_path,
+    trim_start=None,
+    trim_end=None,
+    mode="all",
+    value=None,
+    image_format=None,
+) -> int:
+    """
+    Streams the selected frames of a video into one archive file, no image is
+    ever written as its own file.
+
+    Args:
+        input_file: Path to the input video file.
+        archive_path: .tar, .zip or .fpak (chunked container with an index).
+        trim_start, trim_end, mode, value, image_format: Same as
+            frame_export.export_frames.
+
+    Returns:
+        int: Number of frames written.
+    """
+    image_format = image_format or frame_export.FRAME_FORMAT
+    suffix = Path(archive_path).suffix.lower()
+    if suffix not in WRITERS:
+        raise ValueError(f"Unsupported archive type: {suffix}")
+
+    writer = WRITERS[suffix](archive_path, image_format)
+    count = 0
+
+    def on_image(data):
+        nonlocal count
+        count += 1
+        writer.add(count, data)
+
+    splitter = ImageStreamSplitter(image_format, on_image)
+    task = archive_command(input_file, trim_start, trim_end, mode, value, image_format)
+    print(f"Streaming frames to {archive_path}")
+    try:
+        encoding.run_ffmpeg(
+            task, "archive_frames", check=True, stdout_callback=splitter.feed
+        )
+        splitter.close()
+    finally:
+        writer.close()
+    print(f"Archived {count} frames")
+    return count
+
+
+class FrameArchive:
+    """
+    Random access to the frames of a .tar, .zip or .fpak frame archive.
+
+    Frame numbers start at 1 like the names. Reading a frame seeks straight to
+    it: .fpak and .tar (with its .idx sidecar) through the offset index, .zip
+    through its central directory.
+
+    Example:
+        with FrameArchive("frames.fpak") as frames:
+            png_bytes = frames[120]
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.kind = self.path.suffix.lower()
+        self.file = None
+        self.zip = None
+        self.names = None
+        if self.kind == ".zip":
+            self.zip = zipfile.ZipFile(self.path)
+            self.names = sorted(self.zip.namelist())
+        elif self.kind == ".fpak":
+            self.file = open(self.path, "rb")
+            header = self.file.read(len(MAGIC) + 4)
+            if header[: len(MAGIC)] != MAGIC:
+                raise ValueError(f"Not a frame container: {self.path}")
+            self.image_format = header[len(MAGIC) :].rstrip(b"\0").decode("ascii")
+            self._index_file = self.file
+            self.index_offset, self.count = _read_footer(self.file)
+        elif self.kind == ".tar":
+            self.file = open(self.path, "rb")
+            if index_path(self.path).exists():
+                self._index_file = open(index_path(self.path), "rb")
+                self.index_offset, self.count = _read_footer(self._index_file)
+            else:
+                # no sidecar, fall back to reading every member header once
+                tar = tarfile.open(fileobj=self.file)
+                members = sorted(
+                    (member for member in tar if member.isfile()),
+                    key=lambda member: member.name,
+                )
+                self._offsets = [
+                    (member.offset_data, member.size) for member in members
+                ]
+                self._index_file = None
+                self.count = len(self._offsets)
+        else:
+            raise ValueError(f"Unsupported archive type: {self.kind}")
+
+    def __len__(self) -> int:
+        return len(self.names) if self.names is not None else self.count
+
+    def _entry(self, number):
+        if self._index_file is None:
+            return self._offsets[number - 1]
+        self._index_file.seek(self.index_offset + (number - 1) * INDEX_ENTRY.size)
+        return INDEX_ENTRY.unpack(self._index_file.read(INDEX_ENTRY.size))
+
+    def __getitem__(self, number) -> bytes:
+        if not 1 <= number <= len(self):
+            raise IndexError(f"Frame {number} out of range 1-{len(self)}")
+        if self.zip is not None:
+            return self.zip.read(self.names[number - 1])
+        offset, length = self._entry(number)
+        self.file.seek(offset)
+        return self.file.read(length)
+
+    def __iter__(self):
+        for number in range(1, len(self) + 1):
+            yield self[number]
+
+    def close(self) -> None:
+        for handle in (self.zip, self.file, getattr(self, "_index_file", None)):
+            if handle is not None:
+                handle.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
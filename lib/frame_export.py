@@ -0,0 +1,250 @@
+import os
+import json
+import shutil
+import tempfile
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import lib.encoding as encoding
+import lib.governor as governor
+
+# -------------------------------------------------------------------------------
+# CONFIGURABLE SETTINGS
+# -------------------------------------------------------------------------------
+
+# png, jpg or webp
+FRAME_FORMAT = "png"
+
+# jpeg -q:v, 2 (best) - 31
+JPEG_QUALITY = 2
+
+# webp quality 0-100
+WEBP_FRAME_QUALITY = 90
+
+# zlib level of the png encoder, 9 is much slower for a few percent smaller files
+PNG_COMPRESSION_LEVEL = 3
+
+# scene change score (0-1) above which a frame is exported in "scene" mode
+SCENE_THRESHOLD = 0.3
+
+# ffmpeg processes exporting parts of the range at once
+EXPORT_WORKERS = max(1, (os.cpu_count() or 1) // 2)
+
+# ranges shorter than this are not split
+MIN_CHUNK_SECONDS = 20.0
+# ==============================================================================
+
+MODES = ["all", "every", "fps", "keyframes", "scene"]
+
+
+def _seconds(value) -> float:
+    """Converts "HH:MM:SS(.ms)", "MM:SS" or a number of seconds to seconds."""
+    if value is None or value == "":
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    seconds = 0.0
+    for part in str(value).split(":"):
+        seconds = seconds * 60 + float(part)
+    return seconds
+
+
+def _frame_rate(input_file) -> float:
+    result = subprocess.run(
+        encoding.streams_command(input_file, "v:0"),
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        rate = json.loads(result.stdout)["streams"][0]["avg_frame_rate"]
+        numerator, denominator = rate.split("/")
+        return float(numerator) / float(denominator)
+    except (ValueError, KeyError, IndexError, ZeroDivisionError):
+        return None
+
+
+def selection_args(mode, value=None, frame_rate=None) -> tuple:
+    """
+    Returns (input options, video filter) selecting the frames of a mode.
+
+    Args:
+        mode (str): "all", "every" (every value-th frame), "fps" (value frames
+            per second), "keyframes" or "scene" (score above value).
+        value: Parameter of the mode.
+        frame_rate (float): Source frame rate, lets "every" count frames from
+            the timestamps so split ranges agree on which frames are picked.
+    """
+    if mode == "all":
+        return [], None
+    if mode == "every":
+        step = int(value or 1)
+        if frame_rate:
+            return [], f"select='not(mod(round(t*{frame_rate:.6f})\\,{step}))'"
+        return [], f"select='not(mod(n\\,{step}))'"
+    if mode == "fps":
+        return [], f"fps={value or 1}"
+    if mode == "keyframes":
+        # the decoder skips everything but keyframes, far less work than select
+        return ["-skip_frame", "nokey"], None
+    if mode == "scene":
+        return [], f"select='gt(scene\\,{value or SCENE_THRESHOLD})'"
+    raise ValueError(f"Unknown frame export mode: {mode}")
+
+
+def format_args(image_format) -> list:
+    if image_format in ("jpg", "jpeg"):
+        return ["-c:v", "mjpeg", "-q:v", str(JPEG_QUALITY), "-pix_fmt", "yuvj420p"]
+    if image_format == "webp":
+        return ["-c:v", "libwebp", "-quality", str(WEBP_FRAME_QUALITY)]
+    if image_format == "png":
+        return ["-c:v", "png", "-compression_level", str(PNG_COMPRESSION_LEVEL)]
+    raise ValueError(f"Unknown frame format: {image_format}")
+
+
+def chunk_command(
+    input_file,
+    output_dir,
+    start,
+    end,
+    mode,
+    value=None,
+    image_format=None,
+    frame_rate=None,
+) -> list:
+    """
+    Exports the selected frames of [start, end) into output_dir, named by their
+    presentation timestamp so chunks can be merged in order.
+    """
+    image_format = image_format or FRAME_FORMAT
+    input_args, video_filter = selection_args(mode, value, frame_rate)
+    task = [str(encoding.FFMPEG_PATH), "-y", *input_args]
+    if start:
+        task.extend(["-ss", f"{start:.3f}"])
+    if end:
+        task.extend(["-to", f"{end:.3f}"])
+    # -copyts keeps the source timestamps, so "every" and the file names agree
+    # between chunks
+    task.extend(["-copyts", "-i", str(input_file), "-map", "0:v:0"])
+    if video_filter:
+        task.extend(["-vf", video_filter])
+    if mode != "fps":
+        task.extend(["-fps_mode", "passthrough"])
+    task.extend(format_args(image_format))
+    task.extend(["-frame_pts", "1", str(Path(output_dir) / f"%d.{image_format}")])
+    return task
+
+
+def split_range(start, end, workers) -> list:
+    """Splits [start, end) into at most workers chunks of MIN_CHUNK_SECONDS+."""
+    length = end - start
+    count = max(1, min(workers, int(length // MIN_CHUNK_SECONDS)))
+    step = length / count
+    return [
+        (start + step * index, start + step * (index + 1)) for index in range(count)
+    ]
+
+
+def export_frames(
+    input_file,
+    output_dir,
+    trim_start=None,
+    trim_end=None,
+    mode="all",
+    value=None,
+    image_format=None,
+    prefix="frame_",
+    workers=None,
+) -> list:
+    """
+    Exports frames of a video as images.
+
+    The range is split into chunks exported by parallel ffmpeg processes
+    (each seeks to its chunk), then the images are named in order with a
+    zero padding sized to the number of frames, e.g. frame_00001.png.
+
+    Args:
+        input_file: Path to the input video file.
+        output_dir: Folder the images are written to.
+        trim_start: Optional start time (HH:mm:ss format or seconds).
+        trim_end: Optional end time (HH:mm:ss format or seconds).
+        mode (str): One of MODES, see selection_args.
+        value: Parameter of the mode (N for "every", the rate for "fps", the
+            threshold for "scene").
+        image_format (str): "png", "jpg" or "webp", defaults to FRAME_FORMAT.
+        prefix (str): File name prefix.
+        workers (int): Parallel ffmpeg processes, defaults to EXPORT_WORKERS.
+
+    Returns:
+        list: Paths of the exported images, in order.
+    """
+    image_format = image_format or FRAME_FORMAT
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    start = _seconds(trim_start) or 0.0
+    end = _seconds(trim_end)
+    if end is None:
+        end = encoding.get_video_duration(input_file) or None
+    chunks = [(start or None, end)]
+    if end is not None and end > start:
+        chunks = split_range(start, end, workers or EXPORT_WORKERS)
+
+    frame_rate = _frame_rate(input_file) if mode == "every" else None
+    if mode == "every" and frame_rate is None and len(chunks) > 1:
+        # frame numbers restart in every chunk without the frame rate
+        chunks = [(start or None, end)]
+
+    klass = governor.current_job_class()
+    cpus = governor.thread_count(klass) or len(
+        governor.allowed_cpus(klass) or range(os.cpu_count() or 1)
+    )
+    threads = max(1, cpus // len(chunks))
+
+    with tempfile.TemporaryDirectory(prefix="frames_", dir=output_dir) as work_dir:
+
+        def export(index):
+            chunk_dir = Path(work_dir, str(index))
+            chunk_dir.mkdir()
+            chunk_start, chunk_end = chunks[index]
+            task = chunk_command(
+                input_file,
+                chunk_dir,
+                chunk_start,
+                chunk_end,
+                mode,
+                value,
+                image_format,
+                frame_rate,
+            )
+            with governor.job_class(klass.name), governor.thread_cap(threads):
+                encoding.run_ffmpeg(task, "export_frames", check=True)
+            return [
+                (int(path.stem), path)
+                for path in chunk_dir.iterdir()
+                if path.stem.isdigit()
+            ]
+
+        print(f"Exporting frames in {len(chunks)} part(s)")
+        with ThreadPoolExecutor(max_workers=len(chunks)) as pool:
+            frames = [
+                frame for part in pool.map(export, range(len(chunks))) for frame in part
+            ]
+
+        # chunks overlap by at most one frame at their boundary
+        frames.sort(key=lambda frame: frame[0])
+        unique = []
+        for pts, path in frames:
+            if unique and unique[-1][0] == pts:
+                continue
+            unique.append((pts, path))
+
+        padding = max(len(str(len(unique))), 3)
+        exported = []
+        for number, (_, path) in enumerate(unique, start=1):
+            target = output_dir / f"{prefix}{number:0{padding}d}.{image_format}"
+            shutil.move(str(path), target)
+            exported.append(target)
+
+    print(f"Exported {len(exported)} frames to {output_dir}")
+    return exported
@@ -0,0 +1,321 @@
+import json
+import threading
+import subprocess
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+import lib.encoding as encoding
+import lib.governor as governor
+
+# -------------------------------------------------------------------------------
+# CONFIGURABLE SETTINGS
+# -------------------------------------------------------------------------------
+
+# frames handed out before a buffer is filled again, a yielded frame stays
+# valid until RING_SIZE more frames were read
+RING_SIZE = 4
+
+# pixel format of the decoded frames (see PIXEL_FORMATS)
+PIXEL_FORMAT = "rgb24"
+
+# swscale algorithm used when downscaling, "bilinear" keeps up with 1080p on one
+# core, "lanczos" looks better but is several times slower
+SCALE_FLAGS = "bilinear"
+
+# bytes of the stdout pipe (Linux), 64 KiB by default, 1 MiB cuts the reads of
+# a 1080p rgb24 frame from ~95 to 6
+PIPE_SIZE = 1024 * 1024
+# ==============================================================================
+
+# pixel format: (channels, numpy dtype name), channels None for a 2-D frame
+PIXEL_FORMATS = {
+    "rgb24": (3, "uint8"),
+    "bgr24": (3, "uint8"),
+    "rgba": (4, "uint8"),
+    "bgra": (4, "uint8"),
+    "gray": (None, "uint8"),
+    "gray16le": (None, "uint16"),
+    "rgb48le": (3, "uint16"),
+}
+
+
+def _video_size(input_file) -> tuple:
+    result = subprocess.run(
+        encoding.streams_command(input_file, "v:0"),
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        stream = json.loads(result.stdout)["streams"][0]
+        return int(stream["width"]), int(stream["height"])
+    except (ValueError, KeyError, IndexError):
+        raise ValueError(f"No video stream in {input_file}")
+
+
+def output_size(source_size, width=None, height=None) -> tuple:
+    """
+    Size of the decoded frames, a missing width or height keeps the aspect
+    ratio (rounded to even), the source is never upscaled.
+    """
+    source_width, source_height = source_size
+    if width is None and height is None:
+        return source_width, source_height
+    if width is None:
+        width = source_width * height / source_height
+    elif height is None:
+        height = source_height * width / source_width
+    width = min(int(width), source_width)
+    height = min(int(height), source_height)
+    return max(2, width - width % 2), max(2, height - height % 2)
+
+
+def reader_command(
+    input_file,
+    size,
+    pixel_format=None,
+    start=None,
+    end=None,
+    fps=None,
+    scale_flags=None,
+) -> list:
+    """Builds the ffmpeg command writing raw frames to stdout."""
+    task = [str(encoding.FFMPEG_PATH), "-v", "error", "-nostdin"]
+    task.extend(
+        encoding.seek_input_args(
+            None if start is None else str(start),
+            None if end is None else str(end),
+        )
+    )
+    task.extend(["-i", str(input_file), "-map", "0:v:0", "-an", "-sn"])
+    # scaling and the pixel format conversion run in the filter graph, the
+    # python side only copies bytes
+    filters = []
+    if fps:
+        filters.append(f"fps={fps}")
+    filters.append(f"scale={size[0]}:{size[1]}:flags={scale_flags or SCALE_FLAGS}")
+    filters.append(f"format={pixel_format or PIXEL_FORMAT}")
+    task.extend(["-vf", ",".join(filters)])
+    task.extend(["-f", "rawvideo", "-pix_fmt", pixel_format or PIXEL_FORMAT, "-"])
+    return task
+
+
+class FrameReader:
+    """
+    Decodes a video to NumPy arrays through ffmpeg's rawvideo output.
+
+    Frames are read with readinto straight into a ring of preallocated
+    buffers, nothing is allocated per frame. A yielded array is a view into
+    the ring: it is overwritten RING_SIZE frames later, copy it to keep it.
+    batches() reads into preallocated (count, height, width, channels)
+    arrays the same way.
+
+    Args:
+        input_file: Path to the video.
+        width, height (int): Downscale in the ffmpeg graph, one of them keeps
+            the aspect ratio.
+        pixel_format (str): One of PIXEL_FORMATS, defaults to PIXEL_FORMAT.
+        start, end: Range to decode (seconds or HH:MM:SS), start seeks.
+        fps (float): Resample to this rate in the ffmpeg graph.
+        ring_size (int): Buffers in the ring, defaults to RING_SIZE.
+
+    Example:
+        with FrameReader("clip.mp4", width=640) as reader:
+            for frame in reader:
+                brightness = frame.mean()
+            reader.seek(30)
+            for batch in reader.batches(32):
+                model(batch)
+    """
+
+    def __init__(
+        self,
+        input_file,
+        width=None,
+        height=None,
+        pixel_format=None,
+        start=None,
+        end=None,
+        fps=None,
+        ring_size=None,
+    ):
+        if np is None:
+            raise ImportError("FrameReader needs numpy: pip install numpy")
+        self.input_file = input_file
+        self.pixel_format = pixel_format or PIXEL_FORMAT
+        if self.pixel_format not in PIXEL_FORMATS:
+            raise ValueError(f"Unsupported pixel format: {self.pixel_format}")
+        self.start = start
+        self.end = end
+        self.fps = fps
+        self.width, self.height = output_size(_video_size(input_file), width, height)
+
+        channels, dtype = PIXEL_FORMATS[self.pixel_format]
+        self.dtype = np.dtype(dtype)
+        self.frame_shape = (self.height, self.width) + ((channels,) if channels else ())
+        self.frame_bytes = (
+            self.width * self.height * (channels or 1) * self.dtype.itemsize
+        )
+        self.ring = np.empty((ring_size or RING_SIZE, *self.frame_shape), self.dtype)
+        self._ring_position = 0
+        self._batches = {}
+        self.process = None
+        self.frames_read = 0
+        self.finished = False
+        self._errors = []
+
+    # -- process ------------------------------------------------------------
+
+    def _open(self) -> None:
+        task = reader_command(
+            self.input_file,
+            (self.width, self.height),
+            self.pixel_format,
+            self.start,
+            self.end,
+            self.fps,
+        )
+        task, popen_kwargs, on_spawn = governor.govern(task)
+        # bufsize=0: readinto goes straight from the pipe into the arrays
+        self.process = subprocess.Popen(
+            task,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            bufsize=0,
+            **popen_kwargs,
+        )
+        on_spawn(self.process)
+        if fcntl is not None and hasattr(fcntl, "F_SETPIPE_SZ"):
+            try:
+                fcntl.fcntl(self.process.stdout, fcntl.F_SETPIPE_SZ, PIPE_SIZE)
+            except OSError:
+                pass
+        self._errors = []
+        self._stderr_thread = threading.Thread(
+            target=lambda stream: self._errors.append(stream.read()),
+            args=(self.process.stderr,),
+            daemon=True,
+        )
+        self._stderr_thread.start()
+
+    def _stop(self) -> None:
+        if self.process is None:
+            return
+        process, self.process = self.process, None
+        process.stdout.close()
+        if process.poll() is None:
+            process.terminate()
+        try:
+            process.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+
+    def _finish(self) -> None:
+        """Waits for ffmpeg after the last frame, raises if it failed."""
+        process, self.process = self.process, None
+        self.finished = True
+        process.stdout.close()
+        returncode = process.wait()
+        self._stderr_thread.join()
+        if returncode != 0:
+            message = b"".join(self._errors).decode(errors="replace").strip()
+            print(f"Frame reader failed on {self.input_file}: {message}")
+            raise subprocess.CalledProcessError(returncode, process.args)
+
+    def _read_into(self, view) -> int:
+        """Fills view (whole frames), returns the bytes read, less at the end."""
+        if self.process is None:
+            self._open()
+        stream = self.process.stdout
+        filled = 0
+        size = len(view)
+        while filled < size:
+            count = stream.readinto(view[filled:])
+            if not count:
+                if filled % self.frame_bytes:
+                    raise ValueError("Truncated frame in the rawvideo stream")
+                return filled
+            filled += count
+        return filled
+
+    # -- reading ------------------------------------------------------------
+
+    def read(self):
+        """Returns the next frame (a view into the ring) or None at the end."""
+        if self.finished:
+            return None
+        frame = self.ring[self._ring_position]
+        filled = self._read_into(memoryview(frame.reshape(-1).view(np.uint8)))
+        if filled < self.frame_bytes:
+            self._finish()
+            return None
+        self._ring_position = (self._ring_position + 1) % len(self.ring)
+        self.frames_read += 1
+        return frame
+
+    def __iter__(self):
+        while True:
+            frame = self.read()
+            if frame is None:
+                return
+            yield frame
+
+    def batches(self, count, buffers=2):
+        """
+        Yields (count, *frame_shape) arrays, the last one may hold fewer frames.
+
+        The arrays come from a ring of `buffers` preallocated batches, a batch
+        is overwritten `buffers` batches later.
+        """
+        key = (count, buffers)
+        if key not in self._batches:
+            self._batches[key] = np.empty(
+                (buffers, count, *self.frame_shape), self.dtype
+            )
+        ring = self._batches[key]
+        position = 0
+        while not self.finished:
+            batch = ring[position]
+            filled = self._read_into(memoryview(batch.reshape(-1).view(np.uint8)))
+            frames = filled // self.frame_bytes
+            self.frames_read += frames
+            if frames < count:
+                self._finish()
+                if frames:
+                    yield batch[:frames]
+                return
+            yield batch
+            position = (position + 1) % buffers
+
+    def seek(self, start, end=None) -> None:
+        """
+        Restarts decoding at start (seconds or HH:MM:SS), input side seek. The
+        range keeps its end unless a new one is given.
+        """
+        self._stop()
+        self.start = start
+        if end is not None:
+            self.end = end
+        self.frames_read = 0
+        self.finished = False
+
+    def close(self) -> None:
+        self._stop()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __del__(self):
+        if getattr(self, "process", None) is not None:
+            self._stop()
@@ -0,0 +1,285 @@
+import os
+import json
+import math
+import shutil
+import tempfile
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+
+import lib.encoding as encoding
+import lib.governor as governor
+
+# -------------------------------------------------------------------------------
+# CONFIGURABLE SETTINGS
+# -------------------------------------------------------------------------------
+
+# values searched by fit_gif, the first of each list is the best quality
+BUDGET_WIDTHS = [640, 540, 480, 400, 320, 240]
+BUDGET_FPS = [20, 15, 12, 10, 8]
+BUDGET_COLORS = [256, 128, 64, 32]
+
+# candidates encoded at once, each one is an ffmpeg process
+BUDGET_WORKERS = min(4, os.cpu_count() or 1)
+
+# stop after this many candidate encodes even if better ones may fit
+MAX_CANDIDATE_ENCODES = 12
+
+# predicted sizes are trusted within this factor when pruning
+SIZE_MODEL_MARGIN = 1.25
+# ==============================================================================
+
+
+@dataclass(frozen=True)
+class Candidate:
+    width: int
+    fps: int
+    colors: int
+
+    @property
+    def quality(self) -> float:
+        # heuristic ranking: resolution first, then motion, then colours
+        return self.width**2 * math.sqrt(self.fps) * math.sqrt(math.log2(self.colors))
+
+    @property
+    def work(self) -> float:
+        # what the gif size grows with, scaled by the fitted bytes per unit
+        return self.width**2 * self.fps * math.log2(self.colors) / 8
+
+    def dominates(self, other) -> bool:
+        """True when every setting is at least as high as other's."""
+        return (
+            self.width >= other.width
+            and self.fps >= other.fps
+            and self.colors >= other.colors
+        )
+
+
+def _video_width(media_file) -> int:
+    result = subprocess.run(
+        encoding.streams_command(media_file, "v:0"),
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        return int(json.loads(result.stdout)["streams"][0]["width"])
+    except (ValueError, KeyError, IndexError):
+        return None
+
+
+def intermediate_command(_input, _output, trim_start, trim_end, width, fps) -> list:
+    """Decodes the range once into a lossless, already downscaled clip."""
+    return [
+        str(encoding.FFMPEG_PATH),
+        "-y",
+        *encoding.seek_input_args(trim_start, trim_end),
+        "-i",
+        str(_input),
+        "-an",
+        "-sn",
+        "-vf",
+        f"fps={fps},scale='min(iw,{width})':-2:flags=lanczos",
+        "-c:v",
+        "ffv1",
+        str(_output),
+    ]
+
+
+class SizeModel:
+    """
+    Predicts gif sizes as bytes_per_unit * Candidate.work, fitted on the
+    candidates encoded so far. The lowest and highest observed ratio bound the
+    prediction so pruning stays conservative.
+    """
+
+    def __init__(self):
+        self.ratios = []
+
+    def add(self, candidate, size) -> None:
+        self.ratios.append(size / candidate.work)
+
+    def predict(self, candidate):
+        """Returns (low, typical, high) predicted sizes, None before any encode."""
+        if not self.ratios:
+            return None
+        ratios = sorted(self.ratios)
+        typical = ratios[len(ratios) // 2]
+        return (
+            ratios[0] * candidate.work,
+            typical * candidate.work,
+            ratios[-1] * candidate.work,
+        )
+
+
+def _choose(candidates, model, max_bytes, count) -> list:
+    """Picks the next candidates to encode, best predicted fits first."""
+    if not candidates:
+        return []
+    if not model.ratios:
+        # nothing known yet: spread the first round over the size range
+        by_work = sorted(candidates, key=lambda candidate: candidate.work)
+        step = max(1, (len(by_work) - 1) // max(1, count - 1))
+        picks = by_work[::-step][:count] if count > 1 else [by_work[-1]]
+        return picks
+
+    def expected_fit(candidate):
+        _, typical, _ = model.predict(candidate)
+        return typical <= max_bytes
+
+    fitting = [candidate for candidate in candidates if expected_fit(candidate)]
+    fitting.sort(key=lambda candidate: candidate.quality, reverse=True)
+    picks = fitting[:count]
+    if len(picks) < count:
+        # the model expects nothing else to fit, test the smallest ones left
+        rest = sorted(
+            (candidate for candidate in candidates if candidate not in picks),
+            key=lambda candidate: candidate.work,
+        )
+        picks.extend(rest[: count - len(picks)])
+    return picks
+
+
+def fit_gif(
+    _input,
+    _output,
+    max_bytes,
+    trim_start=None,
+    trim_end=None,
+    dither=None,
+    workers=None,
+):
+    """
+    Converts a clip to the best looking gif that is at most max_bytes.
+
+    The range is decoded once into a downscaled lossless intermediate, then
+    candidate gifs (width, fps, palette size) are encoded from it a few at a
+    time. After every round candidates are pruned when a smaller candidate
+    already went over the budget, when a better fitting one was found, or when
+    the size model fitted on the finished encodes predicts they cannot fit.
+
+    Args:
+        _input: Input video file path.
+        _output: Output gif file path.
+        max_bytes (int): Size budget, e.g. 8 * 1024 * 1024.
+        trim_start: Optional start time for trimming (HH:mm:ss format).
+        trim_end: Optional end time for trimming (HH:mm:ss format).
+        dither: Overrides encoding.GIF_DITHER.
+        workers (int): Candidates encoded at once, defaults to BUDGET_WORKERS.
+
+    Returns:
+        dict: Chosen "width", "fps", "colors", "size" and "encodes", or None
+              when no candidate fits.
+    """
+    workers = workers or BUDGET_WORKERS
+    with tempfile.TemporaryDirectory(prefix="gif_budget_") as work_dir:
+        work_dir = Path(work_dir)
+        intermediate = work_dir / "intermediate.mkv"
+        print("Preparing gif intermediate")
+        encoding.run_ffmpeg(
+            intermediate_command(
+                _input,
+                intermediate,
+                trim_start,
+                trim_end,
+                max(BUDGET_WIDTHS),
+                max(BUDGET_FPS),
+            ),
+            "gif_intermediate",
+            check=True,
+        )
+        source_width = _video_width(intermediate) or max(BUDGET_WIDTHS)
+
+        widths = sorted(
+            {min(width, source_width) for width in BUDGET_WIDTHS}, reverse=True
+        )
+        candidates = {
+            Candidate(width, fps, colors)
+            for width in widths
+            for fps in BUDGET_FPS
+            for colors in BUDGET_COLORS
+        }
+        model = SizeModel()
+        klass = governor.current_job_class()
+        best = None
+        encodes = 0
+
+        def encode(candidate):
+            target = (
+                work_dir / f"{candidate.width}_{candidate.fps}_{candidate.colors}.gif"
+            )
+            task = encoding.to_gif_command(
+                intermediate,
+                target,
+                fps=candidate.fps,
+                width=candidate.width,
+                colors=candidate.colors,
+                dither=dither,
+            )
+            # pool threads do not inherit the caller's job class
+            result = governor.run_as(
+                klass.name,
+                encoding.run_ffmpeg,
+                task,
+                "gif_candidate",
+                stdout=subprocess.DEVNULL,
+            )
+            if result.returncode != 0:
+                return candidate, target, None
+            return candidate, target, target.stat().st_size
+
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            while candidates and encodes < MAX_CANDIDATE_ENCODES:
+                count = min(workers, MAX_CANDIDATE_ENCODES - encodes)
+                batch = _choose(candidates, model, max_bytes, count)
+                candidates.difference_update(batch)
+                for candidate, target, size in pool.map(encode, batch):
+                    encodes += 1
+                    if size is None:
+                        print(f"Gif candidate failed: {candidate}")
+                        continue
+                    model.add(candidate, size)
+                    print(
+                        f"Gif candidate {candidate.width}px {candidate.fps}fps "
+                        f"{candidate.colors} colors: {size / 1024:.0f} KiB"
+                    )
+                    if size > max_bytes:
+                        # anything at least as large in every setting is too big
+                        candidates = {
+                            other
+                            for other in candidates
+                            if not other.dominates(candidate)
+                        }
+                    elif best is None or candidate.quality > best[0].quality:
+                        best = (candidate, target, size)
+
+                if best is not None:
+                    candidates = {
+                        other
+                        for other in candidates
+                        if other.quality > best[0].quality
+                        and not best[0].dominates(other)
+                    }
+                if model.ratios:
+                    candidates = {
+                        other
+                        for other in candidates
+                        if model.predict(other)[0] <= max_bytes * SIZE_MODEL_MARGIN
+                    }
+
+        if best is None:
+            print(f"No gif candidate fits in {max_bytes} bytes")
+            return None
+        candidate, target, size = best
+        shutil.copyfile(target, _output)
+        print(
+            f"Gif saved at {candidate.width}px {candidate.fps}fps "
+            f"{candidate.colors} colors, {size / 1024:.0f} KiB after {encodes} encodes"
+        )
+        return {
+            "width": candidate.width,
+            "fps": candidate.fps,
+            "colors": candidate.colors,
+            "size": size,
+            "encodes": encodes,
+        }
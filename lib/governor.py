@@ -0,0 +1,288 @@
+import os
+import sys
+import ctypes
+import shutil
+import platform
+import subprocess
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+
+# -------------------------------------------------------------------------------
+# CONFIGURABLE SETTINGS
+# -------------------------------------------------------------------------------
+
+# number of cores kept free of background jobs for the GUI and interactive jobs
+RESERVED_CPUS = max(1, (os.cpu_count() or 1) // 4)
+
+# class used when nothing else was asked for, "normal" runs ffmpeg at the
+# default priority like before the job classes existed
+DEFAULT_JOB_CLASS = "normal"
+# ==============================================================================
+
+
+@dataclass
+class JobClass:
+    """
+    How a class of ffmpeg jobs is scheduled.
+
+    nice: niceness the process runs at (0-19, can only be raised).
+    ionice_class: 1 realtime, 2 best-effort, 3 idle (Linux only).
+    ionice_level: priority inside the best-effort class (0 high - 7 low).
+    reserved_cpus: False to run on every core, True to stay off the reserved cores.
+    threads: ffmpeg/x264 thread count, 0 lets ffmpeg decide, None to match the
+        number of cores the job may use.
+    """
+
+    name: str
+    nice: int = 0
+    ionice_class: int = 2
+    ionice_level: int = 4
+    reserved_cpus: bool = False
+    threads: int = 0
+
+
+JOB_CLASSES = {
+    "interactive": JobClass("interactive", nice=0, ionice_class=2, ionice_level=0),
+    "normal": JobClass("normal", nice=0, ionice_class=2, ionice_level=4),
+    "background": JobClass(
+        "background",
+        nice=19,
+        ionice_class=3,
+        ionice_level=7,
+        reserved_cpus=True,
+        threads=None,
+    ),
+}
+
+# context variables rather than thread locals, so the class also follows
+# asyncio tasks (each task runs in a copy of the context it was created in)
+_job_class = ContextVar("job_class", default=None)
+_threads = ContextVar("threads", default=None)
+
+
+def current_job_class() -> JobClass:
+    """Returns the job class of the calling thread or asyncio task."""
+    return JOB_CLASSES[_job_class.get() or DEFAULT_JOB_CLASS]
+
+
+@contextmanager
+def job_class(name: str):
+    """
+    Runs every ffmpeg job started by the calling thread (or asyncio task, and
+    the tasks it creates) in the given class.
+
+    Example:
+        with governor.job_class("background"):
+            encoding.encode_web_mp4(...)
+    """
+    if name not in JOB_CLASSES:
+        raise ValueError(f"Unknown job class: {name}")
+    token = _job_class.set(name)
+    try:
+        yield JOB_CLASSES[name]
+    finally:
+        _job_class.reset(token)
+
+
+@contextmanager
+def thread_cap(threads: int):
+    """
+    Overrides the thread count of the job class for the calling thread's jobs,
+    used by the adaptive scheduler to share the cores between its jobs.
+    """
+    token = _threads.set(threads)
+    try:
+        yield
+    finally:
+        _threads.reset(token)
+
+
+def run_as(name: str, function, *args, **kwargs):
+    """Calls function inside job_class(name), handy as a threading.Thread target."""
+    with job_class(name):
+        return function(*args, **kwargs)
+
+
+def allowed_cpus(klass: JobClass) -> set:
+    """Returns the cores a job of the class may run on, None if unrestricted."""
+    if not hasattr(os, "sched_getaffinity"):
+        return None
+    available = sorted(os.sched_getaffinity(0))
+    if not klass.reserved_cpus or len(available) <= RESERVED_CPUS:
+        return set(available)
+    return set(available[RESERVED_CPUS:])
+
+
+def thread_count(klass: JobClass) -> int:
+    override = _threads.get()
+    if override is not None:
+        return override
+    if klass.threads is not None:
+        return klass.threads
+    cpus = allowed_cpus(klass)
+    return len(cpus) if cpus else max(1, (os.cpu_count() or 1) - RESERVED_CPUS)
+
+
+# ffmpeg options that take no value, any other option is followed by its value
+_FLAG_OPTIONS = {
+    "-y",
+    "-n",
+    "-an",
+    "-vn",
+    "-sn",
+    "-dn",
+    "-re",
+    "-nostdin",
+    "-copyts",
+    "-shortest",
+    "-start_at_zero",
+    "-hide_banner",
+    "-stats",
+    "-nostats",
+    "-benchmark",
+    "-benchmark_all",
+}
+
+
+def output_positions(task) -> list:
+    """Positions of the output files (or urls, "-" for stdout) of an ffmpeg command."""
+    positions = []
+    position = 1
+    while position < len(task):
+        argument = str(task[position])
+        if argument.startswith("-") and argument != "-":
+            position += 1 if argument in _FLAG_OPTIONS else 2
+        else:
+            positions.append(position)
+            position += 1
+    return positions
+
+
+def apply_thread_cap(task, threads: int) -> list:
+    """
+    Sets the encoder (-threads, given to every output) and filter graph
+    (-filter_threads) thread counts of an ffmpeg command, replacing any
+    -threads already given for an output.
+    """
+    task = list(task)
+    if threads <= 0:
+        return task
+
+    outputs = output_positions(task)
+    last_input = max(
+        (position for position, argument in enumerate(task) if argument == "-i"),
+        default=-1,
+    )
+    # the options of an output sit between the previous output (or the last
+    # input) and the output itself, insert from the end so positions hold
+    starts = [last_input + 2] + [output + 1 for output in outputs[:-1]]
+    for start, output in reversed(list(zip(starts, outputs))):
+        for position in range(start, output - 1):
+            if task[position] == "-threads":
+                task[position + 1] = str(threads)
+                break
+        else:
+            task[output:output] = ["-threads", str(threads)]
+    return [task[0], "-filter_threads", str(threads), *task[1:]]
+
+
+def popen_kwargs(klass: JobClass) -> dict:
+    """Priority settings that have to be given to Popen (Windows only)."""
+    if sys.platform != "win32":
+        return {}
+    if klass.nice >= 15:
+        return {"creationflags": subprocess.IDLE_PRIORITY_CLASS}
+    if klass.nice > 0:
+        return {"creationflags": subprocess.BELOW_NORMAL_PRIORITY_CLASS}
+    return {}
+
+
+# ioprio_set syscall numbers, the I/O priority is set without running ionice
+_IOPRIO_SET = {
+    "x86_64": 251,
+    "i386": 289,
+    "i686": 289,
+    "aarch64": 30,
+    "armv7l": 314,
+    "ppc64le": 273,
+    "riscv64": 30,
+    "s390x": 282,
+}
+_IOPRIO_WHO_PROCESS = 1
+_IOPRIO_CLASS_SHIFT = 13
+
+
+def set_io_priority(pid: int, klass: JobClass) -> None:
+    """
+    Sets the I/O priority of a process (Linux only), nothing is done for
+    best-effort level 4, which processes at nice 0 already have.
+    """
+    if not sys.platform.startswith("linux"):
+        return
+    if klass.ionice_class == 2 and klass.ionice_level == 4:
+        return
+    level = klass.ionice_level if klass.ionice_class == 2 else 0
+    syscall_number = _IOPRIO_SET.get(platform.machine())
+    if syscall_number is None:
+        ionice = shutil.which("ionice")
+        if ionice:
+            command = [ionice, "-c", str(klass.ionice_class)]
+            if klass.ionice_class == 2:
+                command.extend(["-n", str(level)])
+            command.extend(["-p", str(pid)])
+            subprocess.run(
+                command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+            )
+        return
+    libc = ctypes.CDLL(None, use_errno=True)
+    priority = (klass.ionice_class << _IOPRIO_CLASS_SHIFT) | level
+    if libc.syscall(syscall_number, _IOPRIO_WHO_PROCESS, pid, priority) != 0:
+        error = ctypes.get_errno()
+        print(f"Could not set I/O priority of {pid}: {os.strerror(error)}")
+
+
+def apply_to_process(pid: int, klass: JobClass) -> None:
+    """
+    Applies niceness, I/O priority and CPU affinity to a running process.
+
+    This is done from the parent right after the process is spawned instead of
+    with preexec_fn, which is not safe with the GUI worker threads around.
+    """
+    if hasattr(os, "setpriority"):
+        try:
+            current = os.getpriority(os.PRIO_PROCESS, pid)
+            if klass.nice > current:
+                os.setpriority(os.PRIO_PROCESS, pid, klass.nice)
+        except OSError as e:
+            print(f"Could not set niceness of {pid}: {e}")
+
+    cpus = allowed_cpus(klass)
+    if cpus and hasattr(os, "sched_setaffinity"):
+        try:
+            os.sched_setaffinity(pid, cpus)
+        except OSError as e:
+            print(f"Could not set CPU affinity of {pid}: {e}")
+
+    set_io_priority(pid, klass)
+
+
+def govern(task, klass: JobClass = None) -> tuple:
+    """
+    Prepares an ffmpeg command for the current job class.
+
+    Args:
+        task (list): ffmpeg command line.
+        klass (JobClass): Class to use, defaults to the calling thread's class.
+
+    Returns:
+        tuple: (command with thread caps, extra Popen kwargs, on_spawn callback).
+    """
+    if klass is None:
+        klass = current_job_class()
+    task = apply_thread_cap(task, thread_count(klass))
+
+    def on_spawn(process):
+        apply_to_process(process.pid, klass)
+
+    return task, popen_kwargs(klass), on_spawn
@@ -0,0 +1,275 @@
+import uuid
+import subprocess
+from fractions import Fraction
+from pathlib import Path
+
+import lib.encoding as encoding
+import lib.encoders as encoders
+import lib.capabilities as capabilities
+import lib.library as library
+
+# -------------------------------------------------------------------------------
+# CONFIGURABLE SETTINGS
+# -------------------------------------------------------------------------------
+
+# audio of a re-encoded join, the first input's sample rate is kept when known
+JOIN_SAMPLE_RATE = 48000
+
+# stream properties that must match for the concat demuxer to copy the inputs
+VIDEO_KEYS = (
+    "codec_name",
+    "profile",
+    "width",
+    "height",
+    "pix_fmt",
+    "frame_rate",
+    "time_base",
+)
+AUDIO_KEYS = ("codec_name", "profile", "sample_rate", "channels", "channel_layout")
+# ==============================================================================
+
+
+def stream_signature(streams) -> tuple:
+    """
+    What a file's streams have to share with the other inputs of a stream
+    copied join: every stream in order, with the VIDEO_KEYS or AUDIO_KEYS of
+    audio and video streams.
+    """
+    signature = []
+    for stream in streams:
+        if stream["codec_type"] == "video":
+            keys = VIDEO_KEYS
+        elif stream["codec_type"] == "audio":
+            keys = AUDIO_KEYS
+        else:
+            keys = ("codec_name",)
+        signature.append((stream["codec_type"], *(stream.get(key) for key in keys)))
+    return tuple(signature)
+
+
+def mismatches(files, media_library) -> list:
+    """
+    Returns the inputs whose streams differ from the first one's, with a short
+    reason, empty when the concat demuxer can copy them all.
+    """
+    reference = stream_signature(media_library.streams(files[0]))
+    if not reference:
+        return [(files[0], "could not be probed")]
+    found = []
+    for path in files[1:]:
+        signature = stream_signature(media_library.streams(path))
+        if signature == reference:
+            continue
+        if len(signature) != len(reference):
+            reason = f"{len(signature)} streams instead of {len(reference)}"
+        else:
+            reason = next(
+                f"{ours[0]} {ours[1:]} instead of {theirs[1:]}"
+                for ours, theirs in zip(signature, reference)
+                if ours != theirs
+            )
+        found.append((path, reason))
+    return found
+
+
+def concat_list(files) -> str:
+    """concat demuxer script reading the files one after the other."""
+    lines = ["ffconcat version 1.0"]
+    for path in files:
+        path = str(Path(path).absolute()).replace("'", "'\\''")
+        lines.append(f"file '{path}'")
+    return "\n".join(lines) + "\n"
+
+
+def concat_copy_command(list_file, output_file) -> list:
+    """Joins the files of a concat_list with stream copy, nothing is decoded."""
+    task = [
+        str(encoding.FFMPEG_PATH),
+        "-y",
+        "-f",
+        "concat",
+        "-safe",
+        "0",
+        "-i",
+        str(list_file),
+        "-map",
+        "0",
+        "-c",
+        "copy",
+    ]
+    if Path(output_file).suffix.lower() in (".mp4", ".m4v", ".mov", ".m4a"):
+        task.extend(["-movflags", "+faststart"])
+    task.append(str(output_file))
+    return task
+
+
+def _first_stream(streams, codec_type) -> dict:
+    return next(
+        (stream for stream in streams if stream["codec_type"] == codec_type), None
+    )
+
+
+def _frame_rate(value) -> str:
+    # ffprobe reports 0/0 for streams without a constant rate
+    try:
+        if Fraction(value) > 0:
+            return value
+    except (TypeError, ValueError, ZeroDivisionError):
+        pass
+    return "25/1"
+
+
+def concat_filter_command(files, output_file, media_library, encoder=None) -> list:
+    """
+    Joins mismatched inputs in a single encode with the concat filter.
+
+    Every video is scaled and padded to the first one's size and frame rate
+    in yuv420p, every audio resampled to one layout. Inputs without audio
+    get silence for their duration. Video outputs use the encoder profile
+    (WEB_ENCODER by default), audio only outputs FILTERED_AUDIO_CODECS.
+    """
+    streams = [media_library.streams(path) for path in files]
+    videos = [_first_stream(file_streams, "video") for file_streams in streams]
+    audios = [_first_stream(file_streams, "audio") for file_streams in streams]
+    has_video = videos[0] is not None
+    has_audio = any(audios)
+
+    task = [str(encoding.FFMPEG_PATH), "-y"]
+    for path in files:
+        task.extend(["-i", str(path)])
+
+    filters = []
+    labels = []
+    if has_video:
+        reference = videos[0]
+        width = reference["width"]
+        height = reference["height"]
+        frame_rate = _frame_rate(reference.get("frame_rate"))
+    if has_audio:
+        reference_audio = next(audio for audio in audios if audio)
+        sample_rate = reference_audio.get("sample_rate") or JOIN_SAMPLE_RATE
+        layout = "mono" if reference_audio.get("channels") == 1 else "stereo"
+    for index, path in enumerate(files):
+        if has_video:
+            filters.append(
+                f"[{index}:v:0]scale={width}:{height}:"
+                "force_original_aspect_ratio=decrease,"
+                f"pad={width}:{height}:(ow-iw)/2:(oh-ih)/2,setsar=1,"
+                f"fps={frame_rate},format=yuv420p[v{index}]"
+            )
+            labels.append(f"[v{index}]")
+        if has_audio:
+            if audios[index]:
+                source = f"[{index}:a:0]"
+            else:
+                duration = media_library.duration(path) or 0
+                source = (
+                    f"anullsrc=r={sample_rate}:cl={layout},"
+                    f"atrim=duration={duration:.3f},"
+                )
+                filters.append(f"{source}asetpts=N/SR/TB[s{index}]")
+                source = f"[s{index}]"
+            filters.append(
+                f"{source}aresample={sample_rate},"
+                f"aformat=sample_fmts=fltp:channel_layouts={layout}[a{index}]"
+            )
+            labels.append(f"[a{index}]")
+    outputs = ("[v]" if has_video else "") + ("[a]" if has_audio else "")
+    filters.append(
+        f"{''.join(labels)}concat=n={len(files)}:v={int(has_video)}:"
+        f"a={int(has_audio)}{outputs}"
+    )
+    task.extend(["-filter_complex", ";".join(filters)])
+
+    if has_video:
+        task.extend(["-map", "[v]"])
+        # see lib/encoders.py
+        task.extend(encoders.video_args(encoder or encoding.WEB_ENCODER, output_file))
+    if has_audio:
+        task.extend(["-map", "[a]"])
+        if has_video:
+            task.extend(["-c:a", "aac"])
+        else:
+            task.extend(
+                encoding.FILTERED_AUDIO_CODECS.get(
+                    Path(output_file).suffix.lower(), ["-c:a", "aac", "-b:a", "192k"]
+                )
+            )
+    if Path(output_file).suffix.lower() in (".mp4", ".m4v", ".mov", ".m4a"):
+        task.extend(["-movflags", "+faststart"])
+    task.append(str(output_file))
+    return task
+
+
+def join(files, output_file, media_library=None, copy=None, encoder=None) -> bool:
+    """
+    Joins clips end to end into one file.
+
+    The inputs' streams are compared from the media library (probed when new
+    or changed). When codec, size, pixel format, frame rate, timebase and
+    audio layout all match, as with clips cut from one recording by the trim
+    functions, the concat demuxer copies them without decoding. Otherwise
+    they are normalised and re-encoded in one concat filter pass.
+
+    Args:
+        files: The clips, in order.
+        output_file: Path of the joined file, use the clips' container when
+            they match.
+        media_library: MediaLibrary holding the stream data, defaults to the
+            shared one.
+        copy (bool): Force stream copy (True) or re-encoding (False).
+        encoder (str): Encoder profile of a video re-encode (see
+            lib/encoders.py), defaults to encoding.WEB_ENCODER.
+
+    Returns:
+        bool: True if the inputs were stream copied.
+    """
+    files = [Path(path).absolute() for path in files]
+    if len(files) < 2:
+        print("Select at least two clips to join")
+        return False
+    media_library = media_library or library.get_library()
+    media_library.scan(files, prune=False)
+
+    if copy is None:
+        found = mismatches(files, media_library)
+        for path, reason in found:
+            print(f"{path.name}: {reason}")
+        copy = not found
+    if not copy and _first_stream(media_library.streams(files[0]), "video"):
+        encoder = encoders.resolve(encoder or encoding.WEB_ENCODER)
+        capabilities.require(
+            [encoders.get_profile(encoder)["codec"]],
+            ["concat", "pad", "aresample"],
+            operation="join",
+        )
+    elif not copy:
+        if any(
+            _first_stream(media_library.streams(path), "video") for path in files[1:]
+        ):
+            print("Audio files and videos cannot be joined together")
+            return False
+        capabilities.require(filters=["concat", "aresample"], operation="join")
+    else:
+        capabilities.require(operation="join")
+
+    print(f"Joining {len(files)} clips ({'stream copy' if copy else 're-encode'})")
+    list_file = None
+    try:
+        if copy:
+            list_file = Path(output_file).with_name(
+                f"{Path(output_file).stem}.{uuid.uuid4().hex}.ffconcat"
+            )
+            list_file.write_text(concat_list(files), encoding="utf-8")
+            task = concat_copy_command(list_file, output_file)
+        else:
+            task = concat_filter_command(files, output_file, media_library, encoder)
+        encoding.run_ffmpeg(task, "join", check=True)
+        print("Join done!")
+    except subprocess.CalledProcessError as e:
+        print(f"An error occurred: {e}")
+        raise
+    finally:
+        if list_file is not None and list_file.exists():
+            list_file.unlink()
+    return copy
@@ -0,0 +1,281 @@
+import subprocess
+from pathlib import Path
+
+import lib.encoding as encoding
+import lib.encoders as encoders
+import lib.capabilities as capabilities
+import lib.library as library
+
+# -------------------------------------------------------------------------------
+# CONFIGURABLE SETTINGS
+# -------------------------------------------------------------------------------
+
+# renditions as (height, video bitrate, audio bitrate), renditions taller than
+# the source are skipped
+LADDER = [
+    (1080, "5000k", "192k"),
+    (720, "2800k", "128k"),
+    (480, "1400k", "128k"),
+    (360, "800k", "96k"),
+]
+
+# segment length (seconds), every rendition gets a keyframe at each multiple so
+# the players can switch between them at any segment
+SEGMENT_SECONDS = 4
+
+# peak rate and buffer of the renditions, relative to their bitrate
+MAXRATE_RATIO = 1.07
+BUFSIZE_RATIO = 1.5
+
+# encoder profile (see lib/encoders.py) of the renditions, their bitrates
+# come from LADDER
+LADDER_ENCODER = "ladder"
+
+# "fmp4" or "ts" HLS segments, DASH always uses fmp4
+HLS_SEGMENT_TYPE = "fmp4"
+
+PACKAGING_FORMATS = ("hls", "dash", "hls+dash")
+# ==============================================================================
+
+
+def _kilobits(rate) -> int:
+    return int(str(rate).lower().rstrip("k"))
+
+
+def ladder_for(source_height, ladder=None) -> list:
+    """The renditions of the ladder not taller than the source, at least one."""
+    ladder = ladder or LADDER
+    if not source_height:
+        return list(ladder)
+    fitting = [rung for rung in ladder if rung[0] <= source_height]
+    return fitting or [min(ladder)]
+
+
+def ladder_encode_args(
+    ladder, has_audio, audio_channel=0, shared_audio=False, encoder=None
+):
+    """
+    filter_complex and the output options of a ladder encode.
+
+    The source is decoded once and split into one scaled branch per rendition,
+    all encoded in the same process with keyframes forced at every segment
+    boundary and no scene cut keyframes, so the GOPs line up across renditions.
+
+    Args:
+        shared_audio (bool): Encode the audio once (DASH adaptation set)
+            instead of once per rendition (HLS variant streams).
+        encoder (str): Encoder profile, defaults to LADDER_ENCODER. Its crf
+            or qp is left out, the renditions are encoded at their bitrates.
+    """
+    branches = "".join(f"[split{index}]" for index in range(len(ladder)))
+    filters = [f"[0:v:0]split={len(ladder)}{branches}"]
+    for index, (height, _, _) in enumerate(ladder):
+        filters.append(f"[split{index}]scale=-2:{height}[v{index}]")
+    args = ["-filter_complex", ";".join(filters)]
+
+    for index in range(len(ladder)):
+        args.extend(["-map", f"[v{index}]"])
+    if has_audio:
+        for _ in range(1 if shared_audio else len(ladder)):
+            args.extend(["-map", f"0:a:{audio_channel}"])
+
+    # see lib/encoders.py
+    args.extend(encoders.video_args(encoder or LADDER_ENCODER, rate_control=False))
+    args.extend(
+        [
+            "-force_key_frames",
+            f"expr:gte(t,n_forced*{SEGMENT_SECONDS})",
+            "-sc_threshold",
+            "0",
+            # the split branches carry no frame rate, keep the source timestamps
+            "-fps_mode",
+            "passthrough",
+        ]
+    )
+    for index, (_, video_rate, audio_rate) in enumerate(ladder):
+        kilobits = _kilobits(video_rate)
+        args.extend(
+            [
+                f"-b:v:{index}",
+                f"{kilobits}k",
+                f"-maxrate:v:{index}",
+                f"{int(kilobits * MAXRATE_RATIO)}k",
+                f"-bufsize:v:{index}",
+                f"{int(kilobits * BUFSIZE_RATIO)}k",
+            ]
+        )
+        if has_audio and not shared_audio:
+            args.extend([f"-b:a:{index}", audio_rate])
+    if has_audio:
+        args.extend(["-c:a", "aac", "-ac", "2"])
+        if shared_audio:
+            args.extend(["-b:a", ladder[0][2]])
+    return args
+
+
+def hls_command(
+    input_file,
+    output_dir,
+    ladder,
+    has_audio,
+    audio_channel=0,
+    segment_type=None,
+    encoder=None,
+) -> list:
+    """
+    Ladder encode written as HLS: one playlist per rendition under
+    stream_<n>/ and master.m3u8 listing them.
+    """
+    segment_type = segment_type or HLS_SEGMENT_TYPE
+    output_dir = Path(output_dir)
+    extension = "m4s" if segment_type == "fmp4" else "ts"
+    stream_map = " ".join(
+        f"v:{index},a:{index}" if has_audio else f"v:{index}"
+        for index in range(len(ladder))
+    )
+    task = [str(encoding.FFMPEG_PATH), "-y", "-i", str(input_file)]
+    task.extend(ladder_encode_args(ladder, has_audio, audio_channel, encoder=encoder))
+    task.extend(
+        [
+            "-f",
+            "hls",
+            "-hls_time",
+            str(SEGMENT_SECONDS),
+            "-hls_playlist_type",
+            "vod",
+            "-hls_segment_type",
+            "fmp4" if segment_type == "fmp4" else "mpegts",
+            "-hls_flags",
+            "independent_segments",
+            "-hls_segment_filename",
+            str(output_dir / "stream_%v" / f"segment_%05d.{extension}"),
+            "-master_pl_name",
+            "master.m3u8",
+            "-var_stream_map",
+            stream_map,
+            str(output_dir / "stream_%v" / "playlist.m3u8"),
+        ]
+    )
+    return task
+
+
+def dash_command(
+    input_file,
+    output_dir,
+    ladder,
+    has_audio,
+    audio_channel=0,
+    hls_playlist=False,
+    encoder=None,
+) -> list:
+    """
+    Ladder encode written as DASH (manifest.mpd), the audio is encoded once
+    and shared by every rendition. With hls_playlist the same fmp4 segments
+    are also listed in HLS playlists (master.m3u8), nothing is encoded twice.
+    """
+    output_dir = Path(output_dir)
+    adaptation_sets = "id=0,streams=v" + (" id=1,streams=a" if has_audio else "")
+    task = [str(encoding.FFMPEG_PATH), "-y", "-i", str(input_file)]
+    task.extend(
+        ladder_encode_args(
+            ladder, has_audio, audio_channel, shared_audio=True, encoder=encoder
+        )
+    )
+    task.extend(
+        [
+            "-f",
+            "dash",
+            "-seg_duration",
+            str(SEGMENT_SECONDS),
+            "-use_template",
+            "1",
+            "-use_timeline",
+            "1",
+            "-adaptation_sets",
+            adaptation_sets,
+            "-init_seg_name",
+            "init_$RepresentationID$.m4s",
+            "-media_seg_name",
+            "chunk_$RepresentationID$_$Number%05d$.m4s",
+        ]
+    )
+    if hls_playlist:
+        task.extend(["-hls_playlist", "1"])
+    task.append(str(output_dir / "manifest.mpd"))
+    return task
+
+
+def package(
+    input_file,
+    output_dir,
+    packaging="hls",
+    ladder=None,
+    audio_channel=0,
+    media_library=None,
+    encoder=None,
+) -> Path:
+    """
+    Encodes an adaptive bitrate ladder in one decode and packages it.
+
+    Args:
+        input_file: Path to the source video.
+        output_dir: Folder receiving the manifests and segments.
+        packaging (str): "hls", "dash" or "hls+dash" (one set of fmp4
+            segments listed by both manifests).
+        ladder: Renditions as in LADDER, the ones taller than the source
+            are skipped.
+        audio_channel (int): Audio stream kept (-map 0:a:N).
+        media_library: MediaLibrary with the source's streams, defaults to
+            the shared one.
+        encoder (str): Encoder profile of the renditions (see
+            lib/encoders.py), defaults to LADDER_ENCODER.
+
+    Returns:
+        Path: The main manifest (master.m3u8 or manifest.mpd).
+    """
+    if packaging not in PACKAGING_FORMATS:
+        raise ValueError(f"Unknown packaging {packaging}, use {PACKAGING_FORMATS}")
+    encoder = encoders.resolve(encoder or LADDER_ENCODER)
+    capabilities.require([encoders.get_profile(encoder)["codec"]], operation="ladder")
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    media_library = media_library or library.get_library()
+    media_library.scan([input_file], prune=False)
+    streams = media_library.streams(input_file)
+    video = next((stream for stream in streams if stream["codec_type"] == "video"), {})
+    has_audio = any(stream["codec_type"] == "audio" for stream in streams)
+    renditions = ladder_for(video.get("height"), ladder)
+
+    if packaging == "hls":
+        task = hls_command(
+            input_file,
+            output_dir,
+            renditions,
+            has_audio,
+            audio_channel,
+            encoder=encoder,
+        )
+        manifest = output_dir / "master.m3u8"
+    else:
+        task = dash_command(
+            input_file,
+            output_dir,
+            renditions,
+            has_audio,
+            audio_channel,
+            hls_playlist=packaging == "hls+dash",
+            encoder=encoder,
+        )
+        manifest = output_dir / "manifest.mpd"
+
+    print(
+        f"Packaging {input_file} as {packaging}: "
+        + ", ".join(f"{height}p" for height, _, _ in renditions)
+    )
+    try:
+        encoding.run_ffmpeg(task, "ladder", check=True)
+        print(f"Packaging done! {manifest}")
+    except subprocess.CalledProcessError as e:
+        print(f"An error occurred: {e}")
+        raise
+    return manifest
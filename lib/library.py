@@ -0,0 +1,467 @@
+import os
+import json
+import time
+import sqlite3
+import subprocess
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import lib.encoding as encoding
+
+# -------------------------------------------------------------------------------
+# CONFIGURABLE SETTINGS
+# -------------------------------------------------------------------------------
+
+# sqlite database holding the probed metadata
+LIBRARY_PATH = encoding.ROOT_DIRECTORY / "media_library.sqlite3"
+
+# ffprobe processes running at once while scanning
+PROBE_WORKERS = min(16, (os.cpu_count() or 1) * 2)
+# ==============================================================================
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    id INTEGER PRIMARY KEY,
+    path TEXT NOT NULL UNIQUE,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    format_name TEXT,
+    duration REAL,
+    bit_rate INTEGER,
+    width INTEGER,
+    height INTEGER,
+    has_subtitles INTEGER NOT NULL DEFAULT 0,
+    probe_ok INTEGER NOT NULL DEFAULT 1,
+    scanned_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS streams (
+    file_id INTEGER NOT NULL REFERENCES files(id) ON DELETE CASCADE,
+    stream_index INTEGER NOT NULL,
+    codec_type TEXT,
+    codec_name TEXT,
+    width INTEGER,
+    height INTEGER,
+    channels INTEGER,
+    language TEXT,
+    title TEXT,
+    profile TEXT,
+    pix_fmt TEXT,
+    frame_rate TEXT,
+    time_base TEXT,
+    sample_rate INTEGER,
+    channel_layout TEXT,
+    PRIMARY KEY (file_id, stream_index)
+);
+CREATE TABLE IF NOT EXISTS chapters (
+    file_id INTEGER NOT NULL REFERENCES files(id) ON DELETE CASCADE,
+    start REAL,
+    end REAL,
+    title TEXT
+);
+CREATE TABLE IF NOT EXISTS fingerprints (
+    file_id INTEGER PRIMARY KEY REFERENCES files(id) ON DELETE CASCADE,
+    positions TEXT NOT NULL,
+    dhash BLOB,
+    phash BLOB
+);
+CREATE INDEX IF NOT EXISTS files_duration ON files(duration);
+CREATE INDEX IF NOT EXISTS files_resolution ON files(height, width);
+CREATE INDEX IF NOT EXISTS files_subtitles ON files(has_subtitles);
+CREATE INDEX IF NOT EXISTS streams_codec ON streams(codec_type, codec_name);
+CREATE INDEX IF NOT EXISTS streams_language ON streams(codec_type, language);
+CREATE INDEX IF NOT EXISTS chapters_file ON chapters(file_id);
+"""
+
+# stream columns added after the first release, older databases get them added
+# and their files probed again on the next scan
+ADDED_STREAM_COLUMNS = {
+    "profile": "TEXT",
+    "pix_fmt": "TEXT",
+    "frame_rate": "TEXT",
+    "time_base": "TEXT",
+    "sample_rate": "INTEGER",
+    "channel_layout": "TEXT",
+}
+
+
+def _number(value, kind=float):
+    try:
+        return kind(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def probe_file(path) -> dict:
+    """Runs ffprobe on a file, returns its json output or None if it failed."""
+    result = subprocess.run(
+        encoding.probe_command(path),
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,
+    )
+    if result.returncode != 0:
+        return None
+    try:
+        return json.loads(result.stdout)
+    except json.JSONDecodeError:
+        return None
+
+
+def walk_media(roots, recursive=True, extensions=None):
+    """
+    Yields the media files found under the given folders (or files).
+
+    Args:
+        roots: Folder or file paths.
+        recursive (bool): Descend into sub folders.
+        extensions: Extensions to keep, defaults to encoding.SUPPORTED_MEDIA.
+    """
+    if isinstance(roots, (str, Path)):
+        roots = [roots]
+    extensions = {ext.lower() for ext in (extensions or encoding.SUPPORTED_MEDIA)}
+    for root in roots:
+        root = Path(root)
+        if root.is_file():
+            yield root.absolute()
+            continue
+        if recursive:
+            for folder, _, filenames in os.walk(root):
+                for filename in sorted(filenames):
+                    if filename.rsplit(".", 1)[-1].lower() in extensions:
+                        yield Path(folder, filename).absolute()
+        else:
+            for file_path in sorted(root.iterdir()):
+                if file_path.is_file() and file_path.suffix[1:].lower() in extensions:
+                    yield file_path.absolute()
+
+
+class MediaLibrary:
+    """
+    Index of probed media files stored in SQLite.
+
+    scan probes new and changed files (size or mtime differ) concurrently and
+    forgets files that disappeared, find answers the batch queries from the
+    index without touching the files.
+
+    Example:
+        library = MediaLibrary()
+        library.scan("D:/videos")
+        long_ass = library.find(subtitle_codec="ass", min_duration=30 * 60)
+    """
+
+    def __init__(self, path=None):
+        self.path = Path(path or LIBRARY_PATH)
+        # the GUI scans from worker threads, writes are serialised by the lock
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._connection.row_factory = sqlite3.Row
+        self._connection.execute("PRAGMA foreign_keys = ON")
+        self._connection.execute("PRAGMA journal_mode = WAL")
+        self._connection.executescript(SCHEMA)
+        self._add_stream_columns()
+
+    def _add_stream_columns(self) -> None:
+        columns = {
+            row["name"]
+            for row in self._connection.execute("PRAGMA table_info(streams)")
+        }
+        missing = [name for name in ADDED_STREAM_COLUMNS if name not in columns]
+        if not missing:
+            return
+        with self._connection:
+            for name in missing:
+                self._connection.execute(
+                    f"ALTER TABLE streams ADD COLUMN {name} "
+                    f"{ADDED_STREAM_COLUMNS[name]}"
+                )
+            # a size that never matches makes scan probe every file again
+            self._connection.execute("UPDATE files SET size = -1")
+
+    def close(self) -> None:
+        self._connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    # -- scanning -----------------------------------------------------------
+
+    def _known(self) -> dict:
+        with self._lock:
+            rows = self._connection.execute("SELECT path, size, mtime_ns FROM files")
+            return {row["path"]: (row["size"], row["mtime_ns"]) for row in rows}
+
+    def scan(self, roots, recursive=True, workers=None, prune=True) -> dict:
+        """
+        Indexes the media files under roots, probing only new or changed files.
+
+        Args:
+            roots: Folder or file paths.
+            recursive (bool): Descend into sub folders.
+            workers (int): ffprobe processes at once, defaults to PROBE_WORKERS.
+            prune (bool): Drop files under the roots that no longer exist.
+
+        Returns:
+            dict: Counts of "probed", "unchanged", "failed" and "removed" files.
+        """
+        if isinstance(roots, (str, Path)):
+            roots = [roots]
+        known = self._known()
+        seen = set()
+        changed = []
+        for file_path in walk_media(roots, recursive):
+            key = str(file_path)
+            seen.add(key)
+            try:
+                stat = file_path.stat()
+            except OSError:
+                continue
+            if known.get(key) != (stat.st_size, stat.st_mtime_ns):
+                changed.append((file_path, stat))
+
+        counts = {"probed": 0, "unchanged": len(seen) - len(changed), "failed": 0}
+        with ThreadPoolExecutor(max_workers=workers or PROBE_WORKERS) as pool:
+            probes = pool.map(lambda item: probe_file(item[0]), changed)
+            for (file_path, stat), data in zip(changed, probes):
+                self._store(file_path, stat, data)
+                counts["probed" if data else "failed"] += 1
+
+        counts["removed"] = 0
+        if prune:
+            root_prefixes = [str(Path(root).absolute()) for root in roots]
+            gone = [
+                path
+                for path in known
+                if path not in seen
+                and any(path.startswith(prefix) for prefix in root_prefixes)
+                and not os.path.exists(path)
+            ]
+            with self._lock, self._connection:
+                self._connection.executemany(
+                    "DELETE FROM files WHERE path = ?", [(path,) for path in gone]
+                )
+            counts["removed"] = len(gone)
+        print(
+            f"Library scan: {counts['probed']} probed, {counts['unchanged']} "
+            f"unchanged, {counts['failed']} failed, {counts['removed']} removed"
+        )
+        return counts
+
+    def _store(self, file_path, stat, data) -> None:
+        data = data or {}
+        file_format = data.get("format", {})
+        streams = data.get("streams", [])
+        video = next(
+            (stream for stream in streams if stream.get("codec_type") == "video"), {}
+        )
+        has_subtitles = any(
+            stream.get("codec_type") == "subtitle" for stream in streams
+        )
+        with self._lock, self._connection:
+            self._connection.execute(
+                "DELETE FROM files WHERE path = ?", (str(file_path),)
+            )
+            cursor = self._connection.execute(
+                "INSERT INTO files (path, size, mtime_ns, format_name, duration, "
+                "bit_rate, width, height, has_subtitles, probe_ok, scanned_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    str(file_path),
+                    stat.st_size,
+                    stat.st_mtime_ns,
+                    file_format.get("format_name"),
+                    _number(file_format.get("duration")),
+                    _number(file_format.get("bit_rate"), int),
+                    video.get("width"),
+                    video.get("height"),
+                    int(has_subtitles),
+                    int(bool(data)),
+                    time.time(),
+                ),
+            )
+            file_id = cursor.lastrowid
+            self._connection.executemany(
+                "INSERT INTO streams (file_id, stream_index, codec_type, codec_name, "
+                "width, height, channels, language, title, profile, pix_fmt, "
+                "frame_rate, time_base, sample_rate, channel_layout) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [
+                    (
+                        file_id,
+                        stream.get("index", position),
+                        stream.get("codec_type"),
+                        stream.get("codec_name"),
+                        stream.get("width"),
+                        stream.get("height"),
+                        stream.get("channels"),
+                        stream.get("tags", {}).get("language"),
+                        stream.get("tags", {}).get("title"),
+                        stream.get("profile"),
+                        stream.get("pix_fmt"),
+                        stream.get("r_frame_rate"),
+                        stream.get("time_base"),
+                        _number(stream.get("sample_rate"), int),
+                        stream.get("channel_layout"),
+                    )
+                    for position, stream in enumerate(streams)
+                ],
+            )
+            self._connection.executemany(
+                "INSERT INTO chapters VALUES (?, ?, ?, ?)",
+                [
+                    (
+                        file_id,
+                        _number(chapter.get("start_time")),
+                        _number(chapter.get("end_time")),
+                        chapter.get("tags", {}).get("title"),
+                    )
+                    for chapter in data.get("chapters", [])
+                ],
+            )
+
+    # -- queries ------------------------------------------------------------
+
+    def find(
+        self,
+        video_codec=None,
+        audio_codec=None,
+        subtitle_codec=None,
+        audio_language=None,
+        subtitle_language=None,
+        has_subtitles=None,
+        min_duration=None,
+        max_duration=None,
+        min_height=None,
+        max_height=None,
+        under=None,
+    ) -> list:
+        """
+        Returns the paths of the indexed files matching every given condition.
+
+        Args:
+            video_codec, audio_codec, subtitle_codec (str): ffprobe codec names,
+                e.g. "h264", "aac", "ass".
+            audio_language, subtitle_language (str): Language tags, e.g. "eng".
+            has_subtitles (bool): Files with / without subtitle streams.
+            min_duration, max_duration (float): Duration bounds in seconds.
+            min_height, max_height (int): Video height bounds in pixels.
+            under: Only files inside this folder.
+
+        Returns:
+            list: Paths (Path) ordered by path.
+        """
+        conditions = ["files.probe_ok = 1"]
+        parameters = []
+        for codec_type, column, value in [
+            ("video", "codec_name", video_codec),
+            ("audio", "codec_name", audio_codec),
+            ("subtitle", "codec_name", subtitle_codec),
+            ("audio", "language", audio_language),
+            ("subtitle", "language", subtitle_language),
+        ]:
+            if value is not None:
+                conditions.append(
+                    "EXISTS (SELECT 1 FROM streams WHERE streams.file_id = files.id "
+                    f"AND streams.codec_type = ? AND streams.{column} = ?)"
+                )
+                parameters.extend([codec_type, value])
+        for condition, value in [
+            (
+                "files.has_subtitles = ?",
+                None if has_subtitles is None else int(has_subtitles),
+            ),
+            ("files.duration >= ?", min_duration),
+            ("files.duration <= ?", max_duration),
+            ("files.height >= ?", min_height),
+            ("files.height <= ?", max_height),
+        ]:
+            if value is not None:
+                conditions.append(condition)
+                parameters.append(value)
+        if under is not None:
+            conditions.append("files.path LIKE ? ESCAPE '\\'")
+            prefix = str(Path(under).absolute()).replace("\\", "\\\\")
+            prefix = prefix.replace("%", "\\%").replace("_", "\\_")
+            parameters.append(prefix + "%")
+
+        query = (
+            "SELECT path FROM files WHERE "
+            + " AND ".join(conditions)
+            + " ORDER BY path"
+        )
+        with self._lock:
+            rows = self._connection.execute(query, parameters).fetchall()
+        return [Path(row["path"]) for row in rows]
+
+    def streams(self, path) -> list:
+        """Returns the indexed streams of a file as dicts, in stream order."""
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT streams.* FROM streams JOIN files ON files.id = streams.file_id "
+                "WHERE files.path = ? ORDER BY stream_index",
+                (str(Path(path).absolute()),),
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def duration(self, path) -> float:
+        """Returns the indexed duration of a file in seconds, None if unknown."""
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT duration FROM files WHERE path = ?",
+                (str(Path(path).absolute()),),
+            ).fetchone()
+        return row["duration"] if row else None
+
+    def chapters(self, path) -> list:
+        """Returns the indexed chapters of a file as dicts."""
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT chapters.start, chapters.end, chapters.title FROM chapters "
+                "JOIN files ON files.id = chapters.file_id WHERE files.path = ? "
+                "ORDER BY chapters.start",
+                (str(Path(path).absolute()),),
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    # -- fingerprints -------------------------------------------------------
+
+    def fingerprint_rows(self) -> dict:
+        """
+        Returns the indexed files with their perceptual hashes (see
+        lib/dedupe.py), keyed by path. positions, dhash and phash are None for
+        files not fingerprinted yet. A changed file loses its fingerprint when
+        scan probes it again.
+        """
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT files.path, files.size, files.duration, files.bit_rate, "
+                "files.width, files.height, fingerprints.positions, "
+                "fingerprints.dhash, fingerprints.phash FROM files "
+                "LEFT JOIN fingerprints ON fingerprints.file_id = files.id "
+                "WHERE files.probe_ok = 1"
+            ).fetchall()
+        return {row["path"]: dict(row) for row in rows}
+
+    def store_fingerprint(self, path, positions, dhash, phash) -> None:
+        """Stores the perceptual hashes of an indexed file."""
+        with self._lock, self._connection:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO fingerprints (file_id, positions, dhash, phash) "
+                "SELECT id, ?, ?, ? FROM files WHERE path = ?",
+                (positions, dhash, phash, str(Path(path).absolute())),
+            )
+
+
+_library = None
+_library_lock = threading.Lock()
+
+
+def get_library() -> MediaLibrary:
+    """Returns the shared library stored at LIBRARY_PATH."""
+    global _library
+    with _library_lock:
+        if _library is None:
+            _library = MediaLibrary()
+        return _library
@@ -0,0 +1,198 @@
+import os
+import re
+import json
+import math
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import lib.encoding as encoding
+import lib.governor as governor
+
+# -------------------------------------------------------------------------------
+# CONFIGURABLE SETTINGS
+# -------------------------------------------------------------------------------
+
+# EBU R128 integrated loudness the outputs are normalised to (LUFS), -23 is
+# the broadcast target, -16 suits web and mobile playback
+LOUDNESS_TARGET = -16.0
+
+# the gain is lowered so the true peak stays under this (dBTP)
+TRUE_PEAK_LIMIT = -1.5
+
+# audio at or below this integrated loudness is left alone (silence)
+MIN_MEASURED_LOUDNESS = -60.0
+
+# measurement passes running at once in measure_many
+MEASURE_WORKERS = min(4, os.cpu_count() or 1)
+
+LOUDNESS_CACHE_DIR = encoding.CACHE_DIR / "loudness"
+# ==============================================================================
+
+# ebur128 summary lines, the first "Threshold" is the integrated one
+_SUMMARY_VALUES = {
+    "integrated": re.compile(r"^\s*I:\s+(-?[\d.]+|-inf) LUFS"),
+    "threshold": re.compile(r"^\s*Threshold:\s+(-?[\d.]+|-inf) LUFS"),
+    "range": re.compile(r"^\s*LRA:\s+(-?[\d.]+|-inf) LU"),
+    "true_peak": re.compile(r"^\s*Peak:\s+(-?[\d.]+|-inf) dBFS"),
+}
+
+
+def measure_command(input_file, trim_start=None, trim_end=None, audio_channel=0):
+    """
+    Decodes one audio stream only through ebur128, which reports the same
+    integrated loudness, range and true peak as a first loudnorm pass without
+    resampling everything to 192 kHz.
+    """
+    return [
+        str(encoding.FFMPEG_PATH),
+        "-nostdin",
+        "-vn",
+        "-sn",
+        "-dn",
+        *encoding.seek_input_args(trim_start, trim_end),
+        "-i",
+        str(input_file),
+        "-map",
+        f"0:a:{audio_channel}",
+        "-af",
+        "ebur128=peak=true:framelog=quiet",
+        "-f",
+        "null",
+        "-",
+    ]
+
+
+def measure(input_file, trim_start=None, trim_end=None, audio_channel=0) -> dict:
+    """
+    Measures the loudness of a file or range.
+
+    Args:
+        input_file: Path to the video or audio file.
+        trim_start, trim_end: Optional range (HH:mm:ss), as given to the encode.
+        audio_channel (int): Audio stream to measure (-map 0:a:N).
+
+    Returns:
+        dict: "integrated" (LUFS), "threshold" (LUFS), "range" (LU) and
+              "true_peak" (dBTP), None when the file has no such audio.
+    """
+    values = {}
+    in_summary = [False]
+
+    def on_line(line):
+        if "Summary:" in line:
+            in_summary[0] = True
+            return True
+        if not in_summary[0]:
+            return False
+        for name, pattern in _SUMMARY_VALUES.items():
+            match = pattern.match(line)
+            if match and name not in values:
+                values[name] = float(match[1])
+                return True
+        return False
+
+    result = encoding.run_ffmpeg(
+        measure_command(input_file, trim_start, trim_end, audio_channel),
+        "loudness_measure",
+        stderr_callback=on_line,
+    )
+    if result.returncode != 0 or "integrated" not in values:
+        return None
+    return values
+
+
+def loudness_cache_path(
+    input_file, trim_start=None, trim_end=None, audio_channel=0
+) -> Path:
+    return LOUDNESS_CACHE_DIR / (
+        encoding.cache_key(
+            input_file, start=trim_start, end=trim_end, channel=audio_channel
+        )
+        + ".json"
+    )
+
+
+def get_loudness(input_file, trim_start=None, trim_end=None, audio_channel=0):
+    """measure, cached per file and range (see encoding.cache_key)."""
+    cache_path = loudness_cache_path(input_file, trim_start, trim_end, audio_channel)
+    if cache_path.exists():
+        with open(cache_path, encoding="utf-8") as cache_file:
+            return json.load(cache_file)["loudness"]
+
+    print(f"Measuring loudness of {input_file}")
+    loudness = measure(input_file, trim_start, trim_end, audio_channel)
+    if not loudness:
+        return None
+    # json has no -inf, the true peak and loudness of silence are stored as null
+    loudness = {
+        name: value if math.isfinite(value) else None
+        for name, value in loudness.items()
+    }
+    cache_path.parent.mkdir(parents=True, exist_ok=True)
+    temp_path = cache_path.with_name(f"{cache_path.stem}.{uuid.uuid4().hex}.json")
+    with open(temp_path, "w", encoding="utf-8") as cache_file:
+        json.dump({"source": str(input_file), "loudness": loudness}, cache_file)
+    os.replace(temp_path, cache_path)
+    return loudness
+
+
+def _measured(loudness) -> bool:
+    """True when a measurement has an integrated loudness above silence."""
+    if not loudness or loudness.get("integrated") is None:
+        return False
+    return loudness["integrated"] > MIN_MEASURED_LOUDNESS
+
+
+def normalize_gain(loudness, target=None, true_peak_limit=None) -> float:
+    """
+    Linear gain (dB) bringing a measurement to the target, lowered when the
+    true peak would pass the limit. 0 for silence or a missing measurement,
+    which includes an integrated loudness of -inf (stored as None).
+    """
+    target = LOUDNESS_TARGET if target is None else target
+    true_peak_limit = TRUE_PEAK_LIMIT if true_peak_limit is None else true_peak_limit
+    if not _measured(loudness):
+        return 0.0
+    gain = target - loudness["integrated"]
+    if loudness.get("true_peak") is not None:
+        gain = min(gain, true_peak_limit - loudness["true_peak"])
+    return round(gain, 2)
+
+
+def normalize_filter(
+    input_file, trim_start=None, trim_end=None, audio_channel=0
+) -> str:
+    """
+    Audio filter normalising a file or range, None when nothing changes.
+
+    The gain is applied with the volume filter: the same linear gain as a
+    second loudnorm pass in linear mode, without its 192 kHz resampling.
+    """
+    loudness = get_loudness(input_file, trim_start, trim_end, audio_channel)
+    gain = normalize_gain(loudness)
+    if _measured(loudness) and gain < LOUDNESS_TARGET - loudness["integrated"] - 0.5:
+        print(
+            f"{input_file}: gain limited to {gain:+.1f} dB by the true peak, "
+            f"{loudness['integrated'] + gain:.1f} LUFS instead of {LOUDNESS_TARGET}"
+        )
+    if not gain:
+        return None
+    return f"volume={gain}dB"
+
+
+def measure_many(files, workers=None, job_class="background") -> dict:
+    """
+    Measures (or finds in the cache) the loudness of many files at once, so a
+    batch encode only reads cached measurements.
+
+    Returns:
+        dict: path -> get_loudness result.
+    """
+    files = list(files)
+
+    def measure_file(path):
+        return governor.run_as(job_class, get_loudness, path)
+
+    with ThreadPoolExecutor(max_workers=workers or MEASURE_WORKERS) as pool:
+        return dict(zip(files, pool.map(measure_file, files)))
@@ -0,0 +1,549 @@
+import os
+import re
+import sys
+import json
+import time
+import signal
+import asyncio
+import threading
+import subprocess
+from dataclasses import dataclass, field, asdict
+from pathlib import Path
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+# -------------------------------------------------------------------------------
+# CONFIGURABLE SETTINGS
+# -------------------------------------------------------------------------------
+
+# append every finished job to this JSON lines file (None to disable)
+METRICS_JSONL_PATH = None
+
+# rewrite this Prometheus textfile-collector file after every job (None to disable)
+# point it at the node exporter --collector.textfile.directory, e.g.
+# Path("/var/lib/node_exporter/textfile_collector", "ffmpeg_tools.prom")
+METRICS_PROMETHEUS_PATH = None
+
+# prefix of every exported Prometheus metric
+PROMETHEUS_PREFIX = "ffmpeg_tools"
+
+# how often the running process is sampled for I/O counters, in seconds
+SAMPLE_INTERVAL = 0.1
+# ==============================================================================
+
+_LINE_END = re.compile(rb"(\r|\n)")
+
+# running totals per operation, see prometheus_text: metric -> labels -> value
+_totals = {}
+_totals_lock = threading.RLock()
+
+
+@dataclass
+class JobMetrics:
+    """
+    Resources used by a single ffmpeg invocation.
+
+    user_cpu_seconds/system_cpu_seconds/max_rss_bytes come from os.wait4 on
+    the ffmpeg process, or from the RUSAGE_CHILDREN difference around its wait
+    where wait4 is missing, for synchronous and asyncio jobs alike.
+    read_bytes/write_bytes are the logical bytes the process read and wrote
+    (rchar/wchar from /proc/<pid>/io) when available, otherwise the block I/O
+    reported by getrusage.
+    """
+
+    operation: str
+    started_at: float = 0.0
+    wall_seconds: float = 0.0
+    user_cpu_seconds: float = None
+    system_cpu_seconds: float = None
+    max_rss_bytes: int = None
+    read_bytes: int = None
+    write_bytes: int = None
+    input_bytes: int = 0
+    output_bytes: int = 0
+    media_duration: float = None
+    compression_ratio: float = None
+    speed_factor: float = None
+    returncode: int = None
+    stages: dict = field(default_factory=dict)
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+
+def _read_proc_io(pid):
+    try:
+        with open(f"/proc/{pid}/io") as io_file:
+            counters = dict(
+                line.split(": ", 1) for line in io_file.read().splitlines() if line
+            )
+        return int(counters["rchar"]), int(counters["wchar"])
+    except (OSError, KeyError, ValueError):
+        return None
+
+
+def _maxrss_bytes(ru_maxrss):
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    if sys.platform == "darwin":
+        return int(ru_maxrss)
+    return int(ru_maxrss) * 1024
+
+
+def command_io(command) -> tuple:
+    """
+    Finds the input files and the output file of an ffmpeg command line.
+
+    Args:
+        command (list): ffmpeg arguments.
+
+    Returns:
+        tuple: (list of input paths, output path or None).
+    """
+    arguments = [str(argument) for argument in command]
+    inputs = [
+        arguments[position + 1]
+        for position, argument in enumerate(arguments[:-1])
+        if argument == "-i"
+    ]
+    output = None
+    if len(arguments) > 1 and not arguments[-1].startswith("-"):
+        if arguments[-2] != "-i":
+            output = arguments[-1]
+    return inputs, output
+
+
+def _file_size(path):
+    try:
+        return os.path.getsize(path)
+    except (OSError, TypeError):
+        return 0
+
+
+def _drain(stream, chunks):
+    chunks.append(stream.read())
+    stream.close()
+
+
+def _stream_chunks(stream, callback, errors):
+    # keep reading after a callback error so the child never blocks on the pipe
+    while True:
+        chunk = stream.read1(65536) if hasattr(stream, "read1") else stream.read(65536)
+        if not chunk:
+            break
+        if not errors:
+            try:
+                callback(chunk)
+            except Exception as e:
+                errors.append(e)
+    stream.close()
+
+
+class LineFollower:
+    """
+    Hands every \\r or \\n terminated line of a byte stream to callback and
+    echoes the lines the callback does not claim (returns True for) to echo.
+    """
+
+    def __init__(self, callback, echo=None):
+        self.callback = callback
+        self.echo = echo
+        self.pending = b""
+
+    def feed(self, chunk: bytes) -> None:
+        if isinstance(chunk, str):
+            chunk = chunk.encode("utf-8")
+        parts = _LINE_END.split(self.pending + chunk)
+        self.pending = parts.pop()
+        for line, ending in zip(parts[::2], parts[1::2]):
+            decoded = line.decode("utf-8", errors="replace")
+            if not self.callback(decoded) and self.echo is not None:
+                self.echo.write(decoded + ending.decode())
+                self.echo.flush()
+
+    def close(self) -> None:
+        # flush whatever is left without a terminator
+        if self.pending:
+            self.feed(b"\n")
+
+
+def _follow_lines(stream, callback, echo):
+    follower = LineFollower(callback, echo)
+    while True:
+        chunk = stream.read1(65536) if hasattr(stream, "read1") else stream.read(4096)
+        if not chunk:
+            break
+        follower.feed(chunk)
+    follower.close()
+    stream.close()
+
+
+def _wait_measured(process, job):
+    """Reaps the process with os.wait4 while sampling its I/O counters."""
+    last_io = None
+    while True:
+        exited = None
+        if hasattr(os, "waitid"):
+            exited = os.waitid(
+                os.P_PID, process.pid, os.WEXITED | os.WNOHANG | os.WNOWAIT
+            )
+        sample = _read_proc_io(process.pid)
+        if sample is not None:
+            last_io = sample
+        if exited is not None or not hasattr(os, "waitid"):
+            # either it is a zombie now (final counters read above) or we
+            # cannot peek, in which case wait4 blocks until it exits
+            _, status, usage = os.wait4(process.pid, 0)
+            break
+        time.sleep(SAMPLE_INTERVAL)
+
+    process.returncode = os.waitstatus_to_exitcode(status)
+    job.user_cpu_seconds = usage.ru_utime
+    job.system_cpu_seconds = usage.ru_stime
+    job.max_rss_bytes = _maxrss_bytes(usage.ru_maxrss)
+    if last_io is not None:
+        job.read_bytes, job.write_bytes = last_io
+    else:
+        job.read_bytes = usage.ru_inblock * 512
+        job.write_bytes = usage.ru_oublock * 512
+
+
+def _wait_children_usage(process, job):
+    """Fallback that diffs RUSAGE_CHILDREN around a plain wait."""
+    before = resource.getrusage(resource.RUSAGE_CHILDREN) if resource else None
+    process.wait()
+    if before is None:
+        return
+    after = resource.getrusage(resource.RUSAGE_CHILDREN)
+    job.user_cpu_seconds = after.ru_utime - before.ru_utime
+    job.system_cpu_seconds = after.ru_stime - before.ru_stime
+    job.max_rss_bytes = _maxrss_bytes(after.ru_maxrss)
+    job.read_bytes = (after.ru_inblock - before.ru_inblock) * 512
+    job.write_bytes = (after.ru_oublock - before.ru_oublock) * 512
+
+
+def run_measured(
+    command,
+    operation,
+    check=False,
+    media_duration=None,
+    stderr_callback=None,
+    annotate=None,
+    on_spawn=None,
+    stdout=None,
+    stderr=None,
+    text=False,
+    stdout_callback=None,
+    **popen_kwargs,
+):
+    """
+    Runs a command like subprocess.run and records its resource usage.
+
+    Args:
+        command (list): Command line to execute.
+        operation (str): Name the metrics are tagged with (e.g. "encode_web_mp4").
+        check (bool): Raise CalledProcessError on a non-zero exit code.
+        media_duration (callable): Optional function returning the media
+            duration in seconds of the output, called once the process has
+            succeeded, used for the realtime speed factor.
+        stderr_callback (callable): Optional function called with every stderr
+            line while the process runs; lines it does not return True for are
+            still echoed to the console.
+        annotate (callable): Optional function called with the JobMetrics once the
+            process has exited, before the job is recorded.
+        on_spawn (callable): Optional function called with the Popen object as
+            soon as the process is started.
+        stdout, stderr, text: Same meaning as for subprocess.run.
+        stdout_callback (callable): Optional function called with every chunk
+            of stdout bytes instead of capturing them, for output piped to "-".
+            An exception it raises is re-raised once the process has exited.
+
+    Returns:
+        tuple: (subprocess.CompletedProcess, JobMetrics).
+    """
+    command = [str(argument) for argument in command]
+    inputs, output = command_io(command)
+    job = JobMetrics(operation=operation, started_at=time.time())
+    job.input_bytes = sum(_file_size(path) for path in inputs)
+
+    if stderr_callback is not None:
+        stderr = subprocess.PIPE
+    if stdout_callback is not None:
+        stdout = subprocess.PIPE
+
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        command, stdout=stdout, stderr=stderr, text=text, **popen_kwargs
+    )
+    if on_spawn is not None:
+        on_spawn(process)
+
+    # read pipes in threads so the child never blocks on a full pipe
+    captured = {"stdout": [], "stderr": []}
+    callback_errors = []
+    readers = []
+    for name, stream in (("stdout", process.stdout), ("stderr", process.stderr)):
+        if stream is None:
+            continue
+        if name == "stdout" and stdout_callback is not None:
+            reader = threading.Thread(
+                target=_stream_chunks,
+                args=(stream, stdout_callback, callback_errors),
+                daemon=True,
+            )
+        elif name == "stderr" and stderr_callback is not None:
+            reader = threading.Thread(
+                target=_follow_lines,
+                args=(stream, stderr_callback, sys.stderr),
+                daemon=True,
+            )
+        else:
+            reader = threading.Thread(
+                target=_drain, args=(stream, captured[name]), daemon=True
+            )
+        reader.start()
+        readers.append(reader)
+
+    try:
+        if hasattr(os, "wait4"):
+            _wait_measured(process, job)
+        else:
+            _wait_children_usage(process, job)
+    except BaseException:
+        process.kill()
+        process.wait()
+        raise
+    finally:
+        for reader in readers:
+            reader.join()
+
+    job.wall_seconds = time.perf_counter() - start
+    job.returncode = process.returncode
+    _finish_job(job, output, media_duration, annotate)
+    if callback_errors:
+        raise callback_errors[0]
+
+    result = subprocess.CompletedProcess(
+        command,
+        process.returncode,
+        captured["stdout"][0] if captured["stdout"] else None,
+        captured["stderr"][0] if captured["stderr"] else None,
+    )
+    if check:
+        result.check_returncode()
+    return result, job
+
+
+def _finish_job(job, output, media_duration, annotate):
+    """Derives the size based metrics and records the job."""
+    job.output_bytes = _file_size(output)
+    if job.output_bytes and job.input_bytes:
+        job.compression_ratio = job.input_bytes / job.output_bytes
+    if media_duration is not None and job.returncode == 0 and job.output_bytes:
+        job.media_duration = media_duration()
+    if job.media_duration and job.wall_seconds > 0:
+        job.speed_factor = job.media_duration / job.wall_seconds
+    if annotate is not None:
+        annotate(job)
+
+    record(job)
+
+
+def _signal(process, kill=False):
+    # os.kill rather than Popen.terminate, whose poll could reap the child
+    # before wait4 collects its resource usage
+    if process.returncode is None:
+        try:
+            os.kill(
+                process.pid,
+                getattr(signal, "SIGKILL", signal.SIGTERM) if kill else signal.SIGTERM,
+            )
+        except OSError:
+            pass
+
+
+async def run_measured_async(
+    command,
+    operation,
+    check=False,
+    on_spawn=None,
+    terminate_timeout=5.0,
+    **kwargs,
+):
+    """
+    asyncio version of run_measured.
+
+    The process is run and reaped by run_measured in a worker thread, so the
+    metrics come from wait4 (getrusage off Linux) exactly as for the
+    synchronous calls.
+
+    Cancelling the awaiting task terminates the child (killing it after
+    terminate_timeout seconds) and waits for it to be reaped before the
+    cancellation propagates.
+
+    Args:
+        Same as for run_measured.
+
+    Returns:
+        tuple: (subprocess.CompletedProcess, JobMetrics).
+    """
+    spawned = []
+    cancelled = []
+
+    def spawn(process):
+        spawned.append(process)
+        if on_spawn is not None:
+            on_spawn(process)
+        if cancelled:
+            # cancelled while the thread was still starting it
+            _signal(process)
+
+    measured = asyncio.ensure_future(
+        asyncio.to_thread(
+            run_measured, command, operation, check=check, on_spawn=spawn, **kwargs
+        )
+    )
+    try:
+        return await asyncio.shield(measured)
+    except asyncio.CancelledError:
+        cancelled.append(True)
+        for process in spawned:
+            _signal(process)
+        try:
+            await asyncio.wait_for(asyncio.shield(measured), terminate_timeout)
+        except asyncio.TimeoutError:
+            for process in spawned:
+                _signal(process, kill=True)
+        except Exception:
+            pass
+        # the thread reaps the child, wait for it so nothing outlives the task
+        await asyncio.gather(measured, return_exceptions=True)
+        raise
+
+
+def record(job: JobMetrics) -> None:
+    """
+    Adds a finished job to the running totals and refreshes the configured
+    exports.
+
+    Only the per-operation totals are kept, so memory and the cost of the
+    Prometheus export do not grow with the number of jobs run.
+    """
+    with _totals_lock:
+        _aggregate(_totals, job)
+        if METRICS_JSONL_PATH:
+            export_jsonl(METRICS_JSONL_PATH, [job])
+        if METRICS_PROMETHEUS_PATH:
+            export_prometheus(METRICS_PROMETHEUS_PATH)
+
+
+def clear_totals() -> None:
+    with _totals_lock:
+        _totals.clear()
+
+
+def export_jsonl(path, records) -> None:
+    """
+    Appends job metrics to a JSON lines file, one job per line.
+
+    Args:
+        path: Destination file.
+        records (list): Jobs to write.
+    """
+    with open(path, "a", encoding="utf-8") as jsonl_file:
+        for job in records:
+            jsonl_file.write(json.dumps(job.to_dict()) + "\n")
+
+
+def _escape_label(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+_PROMETHEUS_METRICS = {
+    "jobs_total": ("counter", "Number of ffmpeg jobs run."),
+    "wall_seconds_total": ("counter", "Wall clock time spent in ffmpeg."),
+    "cpu_user_seconds_total": ("counter", "User CPU time used by ffmpeg."),
+    "cpu_system_seconds_total": ("counter", "System CPU time used by ffmpeg."),
+    "read_bytes_total": ("counter", "Bytes read by ffmpeg."),
+    "written_bytes_total": ("counter", "Bytes written by ffmpeg."),
+    "input_bytes_total": ("counter", "Size of the input files."),
+    "output_bytes_total": ("counter", "Size of the output files."),
+    "media_seconds_total": ("counter", "Duration of the media produced."),
+    "max_rss_bytes": ("gauge", "Largest peak resident set size of a job."),
+    "last_compression_ratio": ("gauge", "Input/output size of the last job."),
+    "last_speed_factor": ("gauge", "Media seconds per wall second, last job."),
+}
+
+
+def _aggregate(values, job):
+    """Adds a job to per-operation totals: metric -> labels -> value."""
+    status = "ok" if job.returncode == 0 else "failed"
+    operation = _escape_label(job.operation)
+    job_labels = f'operation="{operation}",status="{status}"'
+    operation_labels = f'operation="{operation}"'
+
+    def add(name, labels, amount):
+        if amount is not None:
+            metric = values.setdefault(name, {})
+            metric[labels] = metric.get(labels, 0) + amount
+
+    add("jobs_total", job_labels, 1)
+    add("wall_seconds_total", operation_labels, job.wall_seconds)
+    add("cpu_user_seconds_total", operation_labels, job.user_cpu_seconds)
+    add("cpu_system_seconds_total", operation_labels, job.system_cpu_seconds)
+    add("read_bytes_total", operation_labels, job.read_bytes)
+    add("written_bytes_total", operation_labels, job.write_bytes)
+    add("input_bytes_total", operation_labels, job.input_bytes)
+    add("output_bytes_total", operation_labels, job.output_bytes)
+    add("media_seconds_total", operation_labels, job.media_duration)
+    if job.max_rss_bytes is not None:
+        peaks = values.setdefault("max_rss_bytes", {})
+        peaks[operation_labels] = max(peaks.get(operation_labels, 0), job.max_rss_bytes)
+    if job.compression_ratio is not None:
+        values.setdefault("last_compression_ratio", {})[
+            operation_labels
+        ] = job.compression_ratio
+    if job.speed_factor is not None:
+        values.setdefault("last_speed_factor", {})[operation_labels] = job.speed_factor
+
+
+def prometheus_text(records=None) -> str:
+    """
+    Renders job metrics in the Prometheus text exposition format, aggregated
+    per operation.
+
+    Args:
+        records (list): Jobs to render, defaults to the running totals of every
+            job recorded so far.
+    """
+    with _totals_lock:
+        if records is None:
+            values = _totals
+        else:
+            values = {}
+            for job in records:
+                _aggregate(values, job)
+
+        lines = []
+        for name, (metric_type, help_text) in _PROMETHEUS_METRICS.items():
+            metric = f"{PROMETHEUS_PREFIX}_{name}"
+            lines.append(f"# HELP {metric} {help_text}")
+            lines.append(f"# TYPE {metric} {metric_type}")
+            for labels, value in sorted(values.get(name, {}).items()):
+                lines.append(f"{metric}{{{labels}}} {value:.15g}")
+    return "\n".join(lines) + "\n"
+
+
+def export_prometheus(path, records=None) -> None:
+    """
+    Writes a textfile-collector file for the node exporter.
+
+    The file is written next to its destination and renamed into place so the
+    exporter never scrapes a half written file.
+    """
+    path = Path(path)
+    temp_path = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    temp_path.write_text(prometheus_text(records), encoding="utf-8")
+    os.replace(temp_path, path)
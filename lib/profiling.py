@@ -0,0 +1,129 @@
+import re
+
+# "bench: 1234 user 56 sys 1500 real decode_video 0.0" printed by -benchmark_all,
+# times are in microseconds since the previous bench line of the same thread
+BENCH_STEP_RE = re.compile(
+    r"bench:\s+(?P<user>\d+)\s+user\s+(?P<sys>\d+)\s+sys\s+(?P<real>\d+)\s+real\s+"
+    r"(?P<label>\S+)"
+)
+
+# "bench: utime=1.234s stime=0.056s rtime=2.345s" printed by -benchmark at exit
+BENCH_TOTAL_RE = re.compile(
+    r"bench:\s+utime=(?P<user>[\d.]+)s\s+stime=(?P<sys>[\d.]+)s\s+rtime=(?P<real>[\d.]+)s"
+)
+
+BENCH_MAXRSS_RE = re.compile(r"bench:\s+maxrss=(?P<maxrss>\d+)\s*(?P<unit>KiB|kB)")
+
+# time ffmpeg spends outside the labelled decode/encode calls: demuxing, the
+# filter graph (scale, subtitles/libass, fps, palette...) and muxing
+RESIDUAL_STAGE = "filter_mux_other"
+
+
+class StageProfiler:
+    """
+    Collects the -benchmark_all/-benchmark lines of one ffmpeg run.
+
+    Pass feed as the stderr callback of metrics.run_measured, it claims the bench
+    lines so they are not echoed to the console.
+    """
+
+    def __init__(self):
+        self.steps = {}
+        self.total = None
+        self.maxrss_bytes = None
+
+    def feed(self, line: str) -> bool:
+        if "bench:" not in line:
+            return False
+
+        match = BENCH_STEP_RE.search(line)
+        if match:
+            stage = self.steps.setdefault(
+                match["label"], {"real": 0.0, "user": 0.0, "sys": 0.0, "calls": 0}
+            )
+            stage["real"] += int(match["real"]) / 1e6
+            stage["user"] += int(match["user"]) / 1e6
+            stage["sys"] += int(match["sys"]) / 1e6
+            stage["calls"] += 1
+            return True
+
+        match = BENCH_TOTAL_RE.search(line)
+        if match:
+            self.total = {
+                "real": float(match["real"]),
+                "user": float(match["user"]),
+                "sys": float(match["sys"]),
+            }
+            return True
+
+        match = BENCH_MAXRSS_RE.search(line)
+        if match:
+            self.maxrss_bytes = int(match["maxrss"]) * 1024
+            return True
+        return False
+
+    def stages(self, wall_seconds=None) -> dict:
+        """
+        Returns the per-stage timings in seconds.
+
+        Decode and encode stages come straight from -benchmark_all
+        (e.g. "decode_video", "encode_video"), the remainder of the total real
+        time is reported as the "filter_mux_other" stage.
+        """
+        stages = {label: dict(values) for label, values in self.steps.items()}
+        total = self.total
+        if total is None and wall_seconds is not None:
+            total = {"real": wall_seconds, "user": None, "sys": None}
+        if total is not None:
+            measured = sum(values["real"] for values in self.steps.values())
+            stages[RESIDUAL_STAGE] = {
+                "real": max(total["real"] - measured, 0.0),
+                "user": None,
+                "sys": None,
+                "calls": 0,
+            }
+            stages["total"] = dict(total, calls=0)
+        return stages
+
+
+def format_breakdown(job) -> str:
+    """
+    Renders the stage timings of a JobMetrics as a small table.
+
+    Args:
+        job (JobMetrics): A job recorded with profiling enabled.
+
+    Returns:
+        str: One line per stage with its real time and share of the total.
+    """
+    stages = dict(job.stages)
+    total = stages.pop("total", None)
+    total_real = total["real"] if total else job.wall_seconds
+
+    lines = [f"Profile of {job.operation} ({total_real:.2f}s):"]
+    for label, values in sorted(
+        stages.items(), key=lambda item: item[1]["real"], reverse=True
+    ):
+        share = values["real"] / total_real * 100 if total_real else 0.0
+        cpu = ""
+        if values.get("user") is not None:
+            cpu = f"  cpu {values['user'] + values['sys']:8.2f}s"
+        lines.append(f"  {label:<20} {values['real']:8.2f}s {share:5.1f}%{cpu}")
+    if job.speed_factor:
+        lines.append(f"  speed {job.speed_factor:.2f}x realtime")
+    return "\n".join(lines)
+
+
+def filter_chain_breakdown(timings) -> str:
+    """
+    Renders the output of encoding.profile_filter_chain.
+
+    Args:
+        timings (list): (step, seconds) tuples, the first step being the decode.
+    """
+    total = sum(seconds for _, seconds in timings)
+    lines = [f"Filter chain profile ({total:.2f}s):"]
+    for step, seconds in timings:
+        share = seconds / total * 100 if total else 0.0
+        lines.append(f"  {step:<40.40} {seconds:8.2f}s {share:5.1f}%")
+    return "\n".join(lines)
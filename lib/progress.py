@@ -0,0 +1,118 @@
+import re
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+# "frame=  240 fps= 48 q=28.0 size=  1024kB time=00:00:08.00 bitrate=... speed=1.6x"
+FRAME_RE = re.compile(r"frame=\s*(?P<frame>\d+)")
+TIME_RE = re.compile(r"time=\s*(?P<hours>-?\d+):(?P<minutes>\d+):(?P<seconds>[\d.]+)")
+SPEED_RE = re.compile(r"speed=\s*(?P<speed>[\d.]+)x")
+# quantizer of the first video output, -1 when the video is stream copied
+Q_RE = re.compile(r"\bq=\s*(?P<q>-?[\d.]+)")
+
+# a context variable so concurrent asyncio tasks keep their own listener
+_listener = ContextVar("listener", default=None)
+
+
+def parse_stats(line: str) -> dict:
+    """
+    Parses an ffmpeg stats line.
+
+    Returns:
+        dict: "frame", "time" (seconds), "speed" and "q" keys for the values
+              found, empty if the line is not a stats line.
+    """
+    stats = {}
+    match = FRAME_RE.search(line)
+    if match:
+        stats["frame"] = int(match["frame"])
+    match = TIME_RE.search(line)
+    if match:
+        stats["time"] = (
+            int(match["hours"]) * 3600 + int(match["minutes"]) * 60
+        ) + float(match["seconds"])
+    match = SPEED_RE.search(line)
+    if match:
+        stats["speed"] = float(match["speed"])
+    match = Q_RE.search(line)
+    if match:
+        stats["q"] = float(match["q"])
+    return stats
+
+
+def current_listener():
+    """Returns the progress listener of the calling thread or task, or None."""
+    return _listener.get()
+
+
+@contextmanager
+def listening(listener):
+    """
+    Reports the progress of every ffmpeg job the calling thread runs.
+
+    Args:
+        listener (callable): Called with the dict returned by parse_stats for every
+            stats line ffmpeg prints.
+    """
+    token = _listener.set(listener)
+    try:
+        yield
+    finally:
+        _listener.reset(token)
+
+
+class StatsFollower:
+    """
+    stderr callback that forwards ffmpeg stats lines to a listener.
+
+    Stats lines are still echoed (feed returns False) so the console output
+    does not change. A follower is made for every ffmpeg process, it adds the
+    frames ("new_frames") and media seconds ("new_time") done by that process
+    since its previous stats line, so listeners following several processes
+    in a row need not track where each one started.
+
+    The listener may be None to only keep track of the media time reached,
+    see media_duration.
+    """
+
+    def __init__(self, listener=None):
+        self.listener = listener
+        self.frame = 0
+        self.time = 0.0
+
+    def feed(self, line: str) -> bool:
+        if "frame=" in line or "time=" in line:
+            stats = parse_stats(line)
+            if stats:
+                if "frame" in stats:
+                    stats["new_frames"] = max(stats["frame"] - self.frame, 0)
+                    self.frame = max(stats["frame"], self.frame)
+                if "time" in stats:
+                    stats["new_time"] = max(stats["time"] - self.time, 0.0)
+                    self.time = max(stats["time"], self.time)
+                if self.listener is not None:
+                    self.listener(stats)
+        return False
+
+    def media_duration(self):
+        """
+        Returns the media seconds the process reached, read from its last stats
+        line, or None before the first one.
+        """
+        return self.time or None
+
+
+def chain_callbacks(*callbacks):
+    """Combines stderr callbacks, a line is claimed if any callback claims it."""
+    callbacks = [callback for callback in callbacks if callback is not None]
+    if not callbacks:
+        return None
+    if len(callbacks) == 1:
+        return callbacks[0]
+
+    def feed(line):
+        claimed = False
+        for callback in callbacks:
+            claimed = callback(line) or claimed
+        return claimed
+
+    return feed
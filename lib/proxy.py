@@ -0,0 +1,227 @@
+import os
+import json
+import uuid
+import threading
+import subprocess
+from dataclasses import dataclass
+from pathlib import Path
+
+import lib.encoding as encoding
+import lib.encoders as encoders
+import lib.capabilities as capabilities
+
+# -------------------------------------------------------------------------------
+# CONFIGURABLE SETTINGS
+# -------------------------------------------------------------------------------
+
+# play a small proxy in the preview instead of large sources
+PROXY_PREVIEW = True
+
+# sources taller than this get a proxy
+PROXY_MIN_HEIGHT = 1440
+
+# height of the proxies
+PROXY_HEIGHT = 540
+
+# frames between keyframes, 1 makes an all-intra proxy (instant seeks, about
+# three times larger), 12 keeps seeks within half a second of decoding at 24fps
+PROXY_GOP = 12
+
+# encoder profile (see lib/encoders.py) of the proxies
+PROXY_ENCODER = "proxy"
+
+PROXY_DIR = encoding.CACHE_DIR / "proxies"
+# ==============================================================================
+
+# one proxy encode at a time, a second request for the same source waits for
+# the first and then finds it in the cache
+_encode_lock = threading.Lock()
+
+
+@dataclass
+class Proxy:
+    """
+    A preview proxy and the offset between its timeline and the source's.
+
+    offset_ms is added to a proxy player position to get the source position:
+    both keep the source timestamps, the offset only covers a different gap
+    between the container start and the first video frame.
+    """
+
+    source: Path
+    path: Path
+    offset_ms: int = 0
+
+    def to_source(self, position_ms: int) -> int:
+        return max(0, position_ms + self.offset_ms)
+
+    def to_proxy(self, position_ms: int) -> int:
+        return max(0, position_ms - self.offset_ms)
+
+
+def proxy_path(source, encoder=None) -> Path:
+    return PROXY_DIR / (
+        encoding.cache_key(
+            source,
+            height=PROXY_HEIGHT,
+            gop=PROXY_GOP,
+            encoder=encoders.get_profile(encoder or PROXY_ENCODER),
+        )
+        + ".mp4"
+    )
+
+
+def _metadata_path(path) -> Path:
+    return Path(path).with_suffix(".json")
+
+
+def start_times_command(media_file) -> list:
+    return [
+        str(encoding.FFPROBE_PATH),
+        "-v",
+        "error",
+        "-select_streams",
+        "v:0",
+        "-show_entries",
+        "format=start_time:stream=start_time,height",
+        "-of",
+        "json",
+        str(media_file),
+    ]
+
+
+def _probe(media_file) -> dict:
+    result = subprocess.run(
+        start_times_command(media_file),
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        return json.loads(result.stdout)
+    except ValueError:
+        return {}
+
+
+def _video_lead_ms(data) -> int:
+    """Milliseconds between the container start and the first video frame."""
+    try:
+        video_start = float(data["streams"][0]["start_time"])
+        container_start = float(data["format"]["start_time"])
+    except (KeyError, IndexError, TypeError, ValueError):
+        return 0
+    return round((video_start - container_start) * 1000)
+
+
+def needs_proxy(source) -> bool:
+    """True when the source is too large for smooth preview scrubbing."""
+    try:
+        height = int(_probe(source)["streams"][0]["height"])
+    except (KeyError, IndexError, TypeError, ValueError):
+        return False
+    return height > PROXY_MIN_HEIGHT
+
+
+def proxy_command(source, output, encoder=None) -> list:
+    """
+    Builds the proxy encode: downscaled, short GOP without b-frames, stereo aac
+    and the source timestamps and frame timing kept as they are. The video
+    uses the encoder profile, PROXY_ENCODER by default.
+    """
+    return [
+        str(encoding.FFMPEG_PATH),
+        "-y",
+        "-copyts",
+        "-i",
+        str(source),
+        "-map",
+        "0:v:0",
+        "-map",
+        "0:a:0?",
+        "-sn",
+        "-vf",
+        f"scale=-2:{PROXY_HEIGHT}:flags=fast_bilinear",
+        "-fps_mode",
+        "passthrough",
+        # see lib/encoders.py
+        *encoders.video_args(encoder or PROXY_ENCODER, output),
+        "-g",
+        str(PROXY_GOP),
+        "-keyint_min",
+        str(PROXY_GOP),
+        "-sc_threshold",
+        "0",
+        "-bf",
+        "0",
+        "-c:a",
+        "aac",
+        "-b:a",
+        "128k",
+        "-ac",
+        "2",
+        "-movflags",
+        "+faststart",
+        str(output),
+    ]
+
+
+def cached_proxy(source, encoder=None):
+    """Returns the cached Proxy of a source, None when there is none yet."""
+    path = proxy_path(source, encoder)
+    metadata = _metadata_path(path)
+    if not (path.exists() and metadata.exists()):
+        return None
+    with open(metadata, encoding="utf-8") as metadata_file:
+        offset_ms = json.load(metadata_file).get("offset_ms", 0)
+    return Proxy(Path(source), path, offset_ms)
+
+
+def make_proxy(source, encoder=None):
+    """
+    Returns the preview proxy of a source, encoding it first if it is not
+    cached (see encoding.cache_key, a changed source gets a new proxy).
+
+    Args:
+        source: Path to the original video.
+        encoder (str): Encoder profile (see lib/encoders.py), defaults to
+            PROXY_ENCODER.
+
+    Returns:
+        Proxy: The proxy, or None when the source is small enough to preview
+               directly or the encode failed.
+    """
+    proxy = cached_proxy(source, encoder)
+    if proxy is not None:
+        return proxy
+    if not needs_proxy(source):
+        return None
+    try:
+        encoder = encoders.resolve(encoder or PROXY_ENCODER)
+        capabilities.require(
+            [encoders.get_profile(encoder)["codec"]], ["scale"], operation="proxy"
+        )
+    except RuntimeError as e:
+        print(f"Could not create a preview proxy of {source}: {e}")
+        return None
+    with _encode_lock:
+        proxy = cached_proxy(source, encoder)
+        if proxy is not None:
+            return proxy
+        path = proxy_path(source, encoder)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        temp_path = path.with_name(f"{path.stem}.{uuid.uuid4().hex}.mp4")
+        print(f"Creating preview proxy of {source}")
+        try:
+            encoding.run_ffmpeg(
+                proxy_command(source, temp_path, encoder), "proxy", check=True
+            )
+        except subprocess.CalledProcessError:
+            if temp_path.exists():
+                temp_path.unlink()
+            print(f"Could not create a preview proxy of {source}")
+            return None
+        offset_ms = _video_lead_ms(_probe(source)) - _video_lead_ms(_probe(temp_path))
+        with open(_metadata_path(path), "w", encoding="utf-8") as metadata_file:
+            json.dump({"source": str(source), "offset_ms": offset_ms}, metadata_file)
+        os.replace(temp_path, path)
+        print(f"Preview proxy ready: {path}")
+        return Proxy(Path(source), path, offset_ms)
@@ -0,0 +1,326 @@
+import os
+import time
+import threading
+from collections import deque
+
+import lib.governor as governor
+import lib.progress as progress
+
+# -------------------------------------------------------------------------------
+# CONFIGURABLE SETTINGS
+# -------------------------------------------------------------------------------
+
+# seconds between two throughput measurements
+MEASURE_INTERVAL = 5.0
+
+# relative throughput change that is treated as noise
+HYSTERESIS = 0.08
+
+# measurements to wait after changing the concurrency before judging it
+SETTLE_INTERVALS = 1
+
+# measurements older than this are discarded so levels get probed again
+FORGET_SECONDS = 120.0
+
+# do not add jobs once the CPUs are busier than this (0-1)
+CPU_HIGH_WATERMARK = 0.95
+# ==============================================================================
+
+
+class CpuMonitor:
+    """Measures the machine wide CPU utilisation between two calls of sample."""
+
+    def __init__(self):
+        self._last = self._read()
+
+    @staticmethod
+    def _read():
+        try:
+            with open("/proc/stat") as stat_file:
+                fields = [int(value) for value in stat_file.readline().split()[1:]]
+        except (OSError, ValueError):
+            return None
+        idle = fields[3] + (fields[4] if len(fields) > 4 else 0)
+        return idle, sum(fields)
+
+    def sample(self):
+        """Returns the utilisation (0-1) since the previous sample, or None."""
+        current = self._read()
+        if current is None or self._last is None:
+            if hasattr(os, "getloadavg"):
+                return min(os.getloadavg()[0] / (os.cpu_count() or 1), 1.0)
+            return None
+        idle = current[0] - self._last[0]
+        total = current[1] - self._last[1]
+        self._last = current
+        if total <= 0:
+            return None
+        return 1.0 - idle / total
+
+
+class AdaptiveScheduler:
+    """
+    Runs jobs concurrently, tuning the number of running ffmpeg processes from
+    the measured aggregate frames per second.
+
+    Stream copies make thousands of "frames" per second for little CPU, so
+    their progress is measured apart, in media seconds per second, and only
+    judged when no encode made progress during a measurement.
+
+    The controller keeps a throughput estimate per concurrency level. It steps
+    back down when the level below was faster by more than the hysteresis band,
+    otherwise it tries one more job when the next level has not been measured
+    recently or was faster by more than the band, so it settles on the best
+    level instead of oscillating.
+    It never adds a job while the CPUs are above CPU_HIGH_WATERMARK. Every job
+    gets an equal share of the cores as its ffmpeg thread count.
+
+    Jobs are callables that run ffmpeg through lib.encoding, e.g.
+    functools.partial(encoding.encode_web_mp4, source, target).
+    A running job is never interrupted, lowering the concurrency only stops
+    new jobs from starting. A failed job does not stop the others, its
+    exception is kept in errors (see run_jobs, which raises it).
+    """
+
+    def __init__(
+        self,
+        min_jobs=1,
+        max_jobs=None,
+        initial_jobs=None,
+        job_class="background",
+        adaptive=True,
+        adapt_threads=True,
+    ):
+        self.cpus = len(
+            governor.allowed_cpus(governor.JOB_CLASSES[job_class])
+            or range(os.cpu_count() or 1)
+        )
+        self.min_jobs = max(1, min_jobs)
+        self.max_jobs = max(self.min_jobs, max_jobs or self.cpus)
+        self.limit = initial_jobs or self.min_jobs
+        self.limit = min(max(self.limit, self.min_jobs), self.max_jobs)
+        self.job_class = job_class
+        self.adaptive = adaptive
+        self.adapt_threads = adapt_threads
+
+        self.queue = deque()
+        # in submission order, None for the jobs that failed
+        self.results = []
+        # (submission index, exception) of the failed jobs
+        self.errors = []
+        self.history = []
+        self._frames = 0
+        self._copied_seconds = 0.0
+        self._running = 0
+        self._workers = []
+        self._condition = threading.Condition()
+        self._closed = False
+        self._controller = None
+
+    # -- job queue ----------------------------------------------------------
+
+    def submit(self, function, *args, **kwargs) -> None:
+        """Queues a job, starting the scheduler if needed."""
+        with self._condition:
+            self.queue.append((len(self.results), function, args, kwargs))
+            self.results.append(None)
+            self._ensure_workers()
+            self._condition.notify_all()
+
+    def run(self, jobs) -> list:
+        """
+        Runs every job and waits for them.
+
+        Args:
+            jobs: Iterable of zero argument callables.
+
+        Returns:
+            list: The job results in job order, None for the failed ones.
+        """
+        for job in jobs:
+            self.submit(job)
+        return self.wait()
+
+    def wait(self) -> list:
+        """
+        Waits for the queue to drain and returns the results, in submission
+        order with None for the failed jobs (see errors).
+        """
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        for worker in list(self._workers):
+            worker.join()
+        if self._controller is not None:
+            self._controller.join()
+        self.errors.sort(key=lambda error: error[0])
+        return self.results
+
+    def _ensure_workers(self):
+        while len(self._workers) < self.max_jobs:
+            worker = threading.Thread(target=self._work, daemon=True)
+            self._workers.append(worker)
+            worker.start()
+        if self.adaptive and self._controller is None:
+            self._controller = threading.Thread(target=self._control, daemon=True)
+            self._controller.start()
+
+    def _on_progress(self, stats):
+        # new_frames/new_time count from zero for every ffmpeg process of a job
+        with self._condition:
+            if stats.get("q", 0) < 0:
+                self._copied_seconds += stats.get("new_time", 0.0)
+            else:
+                self._frames += stats.get("new_frames", 0)
+
+    def _work(self):
+        while True:
+            with self._condition:
+                while self.queue and self._running >= self.limit:
+                    self._condition.wait()
+                if not self.queue:
+                    if self._closed:
+                        self._condition.notify_all()
+                        return
+                    self._condition.wait()
+                    continue
+                index, function, args, kwargs = self.queue.popleft()
+                self._running += 1
+                threads = (
+                    max(1, self.cpus // self.limit) if self.adapt_threads else None
+                )
+
+            try:
+                with governor.job_class(self.job_class), progress.listening(
+                    self._on_progress
+                ):
+                    if threads is not None:
+                        with governor.thread_cap(threads):
+                            result = function(*args, **kwargs)
+                    else:
+                        result = function(*args, **kwargs)
+                self.results[index] = result
+            except Exception as e:
+                print(f"Job failed: {e}")
+                with self._condition:
+                    self.errors.append((index, e))
+            finally:
+                with self._condition:
+                    self._running -= 1
+                    self._condition.notify_all()
+
+    # -- controller ---------------------------------------------------------
+
+    def _set_limit(self, limit):
+        with self._condition:
+            self.limit = min(max(limit, self.min_jobs), self.max_jobs)
+            self._condition.notify_all()
+
+    def _control(self):
+        cpu = CpuMonitor()
+        # throughput measured at each concurrency level, apart for encodes
+        # (fps) and stream copies (media seconds per second):
+        # kind -> limit -> (throughput, when)
+        measured = {"encode": {}, "copy": {}}
+        settle = 0
+        last_frames = 0
+        last_copied = 0.0
+        last_time = time.monotonic()
+
+        while True:
+            with self._condition:
+                finished = self._closed and not self.queue and self._running == 0
+                if finished:
+                    return
+                self._condition.wait(MEASURE_INTERVAL)
+                frames = self._frames
+                copied = self._copied_seconds
+            now = time.monotonic()
+            elapsed = now - last_time
+            if elapsed < MEASURE_INTERVAL:
+                continue
+
+            encoded = (frames - last_frames) / elapsed
+            copy_rate = (copied - last_copied) / elapsed
+            utilisation = cpu.sample()
+            last_frames, last_copied, last_time = frames, copied, now
+            kind, throughput = ("encode", encoded) if encoded else ("copy", copy_rate)
+            self.history.append((now, self.limit, kind, throughput, utilisation))
+
+            if settle > 0:
+                # the jobs started at the new level are still spinning up
+                settle -= 1
+                continue
+            if not throughput:
+                # nothing progressed (probes, analyses), nothing to judge
+                continue
+            levels = measured[kind]
+
+            previous = levels.get(self.limit)
+            if previous is not None and now - previous[1] < FORGET_SECONDS:
+                throughput = previous[0] * 0.5 + throughput * 0.5
+            levels[self.limit] = (throughput, now)
+
+            def known(limit):
+                level = levels.get(limit)
+                if level is None or now - level[1] >= FORGET_SECONDS:
+                    return None
+                return level[0]
+
+            up, down = self.limit + 1, self.limit - 1
+            cpu_busy = utilisation is not None and utilisation >= CPU_HIGH_WATERMARK
+            new_limit = self.limit
+            if (
+                down >= self.min_jobs
+                and known(down) is not None
+                and known(down) > throughput * (1 + HYSTERESIS)
+            ):
+                new_limit = down
+            elif (
+                up <= self.max_jobs
+                and not cpu_busy
+                and (known(up) is None or known(up) > throughput * (1 + HYSTERESIS))
+            ):
+                new_limit = up
+
+            if new_limit != self.limit:
+                unit = "fps" if kind == "encode" else "x copy"
+                print(
+                    f"Concurrency {self.limit} -> {new_limit} "
+                    f"({throughput:.1f} {unit}, cpu {utilisation or 0:.0%})"
+                )
+                self._set_limit(new_limit)
+                settle = SETTLE_INTERVALS
+
+
+def run_jobs(jobs, concurrency="adaptive", job_class="background") -> list:
+    """
+    Runs jobs with a fixed number of concurrent jobs or the adaptive controller.
+
+    A failed job does not stop the others. Once every job has run, the
+    exception of the first failed one (in job order) is raised.
+
+    Args:
+        jobs: Iterable of zero argument callables.
+        concurrency: "adaptive" or a fixed number of concurrent jobs.
+        job_class (str): Governor job class the jobs run in.
+
+    Returns:
+        list: The job results, in job order.
+    """
+    if concurrency == "adaptive":
+        scheduler = AdaptiveScheduler(job_class=job_class)
+    else:
+        concurrency = int(concurrency)
+        scheduler = AdaptiveScheduler(
+            min_jobs=concurrency,
+            max_jobs=concurrency,
+            job_class=job_class,
+            adaptive=False,
+        )
+    results = scheduler.run(jobs)
+    if scheduler.errors:
+        if len(scheduler.errors) > 1:
+            print(f"{len(scheduler.errors)} of {len(results)} jobs failed")
+        raise scheduler.errors[0][1]
+    return results
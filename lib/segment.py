@@ -0,0 +1,275 @@
+import os
+import csv
+import math
+import uuid
+import subprocess
+from pathlib import Path
+
+import lib.encoding as encoding
+import lib.library as library
+
+# -------------------------------------------------------------------------------
+# CONFIGURABLE SETTINGS
+# -------------------------------------------------------------------------------
+
+# default length of the parts (seconds) when neither a size nor chapters are
+# asked for
+SEGMENT_SECONDS = 600
+
+# parts are named <stem>_part001<suffix>, chapters add _<title>
+SEGMENT_NUMBER_DIGITS = 3
+
+# share of the target size filled by the packets of a part, the rest is left
+# for the container overhead
+SIZE_MARGIN = 0.97
+# ==============================================================================
+
+
+def segment_pattern(input_file, output_dir) -> Path:
+    input_file = Path(input_file)
+    return Path(output_dir) / (
+        f"{input_file.stem}_part%0{SEGMENT_NUMBER_DIGITS}d{input_file.suffix}"
+    )
+
+
+def _cut_time(seconds) -> str:
+    # rounded down to the microsecond, a cut rounded up past its keyframe would
+    # move to the next keyframe
+    return f"{math.floor(seconds * 1000000) / 1000000:.6f}"
+
+
+def segment_command(
+    input_file, output_pattern, list_file, segment_time=None, segment_times=None
+) -> list:
+    """
+    Splits a file with the segment muxer in one pass without re-encoding: a
+    part starts on the first video keyframe at or after each boundary and its
+    timestamps start at zero.
+
+    Args:
+        segment_time (float): Cut every this many seconds.
+        segment_times (list): Or cut at these times (seconds).
+    """
+    output_pattern = Path(output_pattern)
+    task = [
+        str(encoding.FFMPEG_PATH),
+        "-y",
+        "-i",
+        str(input_file),
+        "-map",
+        "0:v?",
+        "-map",
+        "0:a?",
+    ]
+    if output_pattern.suffix.lower() == ".mkv":
+        task.extend(["-map", "0:s?"])
+    # the chapters of the whole file would be wrong in every part
+    task.extend(["-map_chapters", "-1", "-c", "copy", "-f", "segment"])
+    if segment_times:
+        task.extend(
+            ["-segment_times", ",".join(_cut_time(time) for time in segment_times)]
+        )
+    else:
+        task.extend(["-segment_time", f"{segment_time or SEGMENT_SECONDS:g}"])
+    task.extend(
+        [
+            "-reset_timestamps",
+            "1",
+            "-segment_start_number",
+            "1",
+            "-segment_list",
+            str(list_file),
+            "-segment_list_type",
+            "csv",
+        ]
+    )
+    if output_pattern.suffix.lower() in (".mp4", ".m4v", ".mov"):
+        task.extend(["-segment_format_options", "movflags=+faststart"])
+    task.append(str(output_pattern))
+    return task
+
+
+def packets_command(input_file) -> list:
+    """Lists every packet's stream type, time, size and flags, nothing is decoded."""
+    return [
+        str(encoding.FFPROBE_PATH),
+        "-v",
+        "error",
+        "-show_entries",
+        "packet=codec_type,pts_time,size,flags",
+        "-of",
+        "csv=p=0",
+        str(input_file),
+    ]
+
+
+def _packets(input_file):
+    """Yields (codec_type, pts_time, size, keyframe) in file order."""
+    with subprocess.Popen(
+        packets_command(input_file),
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,
+        text=True,
+    ) as process:
+        for line in process.stdout:
+            fields = line.strip().split(",")
+            if len(fields) < 4:
+                continue
+            try:
+                time = float(fields[1])
+                size = int(fields[2])
+            except ValueError:
+                continue
+            yield fields[0], time, size, fields[3].startswith("K")
+
+
+def size_cut_times(packets, target_bytes) -> list:
+    """
+    Plans cuts so every part stays under target_bytes.
+
+    The packets are summed in file order, when a part would pass the target
+    it is cut at its last video keyframe, where the segment muxer cuts too. A
+    part without any keyframe to cut at is left longer than the target.
+
+    Args:
+        packets: (codec_type, pts_time, size, keyframe) tuples, see _packets.
+        target_bytes (int): Largest part size.
+
+    Returns:
+        list: Cut times in seconds.
+    """
+    budget = target_bytes * SIZE_MARGIN
+    cuts = []
+    total = 0
+    part_start_bytes = 0
+    part_start_time = None
+    # last keyframe of the current part: (time, bytes before it)
+    candidate = None
+    for codec_type, time, size, keyframe in packets:
+        if codec_type == "video" and keyframe:
+            if part_start_time is None:
+                part_start_time = time
+            elif time > part_start_time:
+                candidate = (time, total)
+        total += size
+        if total - part_start_bytes > budget and candidate is not None:
+            cut_time, cut_bytes = candidate
+            cuts.append(cut_time)
+            part_start_time = cut_time
+            part_start_bytes = cut_bytes
+            candidate = None
+    return cuts
+
+
+def file_chapters(input_file, media_library=None) -> list:
+    """
+    Chapters of a file from the media library's probe data, the file is
+    probed and indexed first when it is new or changed.
+    """
+    media_library = media_library or library.get_library()
+    media_library.scan([input_file], prune=False)
+    return media_library.chapters(input_file)
+
+
+def chapter_cut_times(chapters) -> list:
+    """Chapter starts to cut at, a first chapter starting at 0 needs no cut."""
+    return [chapter["start"] for chapter in chapters if (chapter["start"] or 0) > 0.05]
+
+
+def _read_segment_list(list_file, output_dir) -> list:
+    parts = []
+    with open(list_file, encoding="utf-8", newline="") as segments:
+        for row in csv.reader(segments):
+            if len(row) >= 3:
+                parts.append(
+                    (Path(output_dir) / Path(row[0]).name, float(row[1]), float(row[2]))
+                )
+    return parts
+
+
+def _title_suffix(title) -> str:
+    title = encoding.clean_text(title or "")
+    return "".join(
+        character if character.isalnum() or character in "_-" else "_"
+        for character in title
+    ).strip("_")
+
+
+def split(
+    input_file,
+    output_dir=None,
+    duration=None,
+    size=None,
+    chapters=False,
+    media_library=None,
+) -> list:
+    """
+    Splits a recording into parts with stream copy, in one pass.
+
+    Args:
+        input_file: Path to the recording.
+        output_dir: Folder of the parts, defaults to the input's folder.
+        duration (float): Part length in seconds, defaults to SEGMENT_SECONDS.
+        size (int): Or the largest part size in bytes, planned from the packet
+            sizes (ffprobe, no decoding).
+        chapters (bool): Or one part per chapter, the chapter title is added
+            to the name.
+        media_library: MediaLibrary with the chapters, defaults to the shared
+            one.
+
+    Returns:
+        list: (path, start, end) of every part, times in seconds of the input.
+    """
+    input_file = Path(input_file)
+    output_dir = Path(output_dir or input_file.parent)
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    segment_times = None
+    titles = []
+    if chapters:
+        file_chapter_list = file_chapters(input_file, media_library)
+        segment_times = chapter_cut_times(file_chapter_list)
+        titles = [chapter["title"] for chapter in file_chapter_list]
+        if len(segment_times) == len(titles):
+            # the part before the first chapter has no title
+            titles.insert(0, None)
+        if not segment_times:
+            print(f"{input_file} has no chapters to split at")
+            return []
+    elif size:
+        segment_times = size_cut_times(_packets(input_file), size)
+        if not segment_times:
+            print(f"{input_file} already fits in {size / 1024 / 1024:.1f} MB")
+            return []
+
+    list_file = output_dir / f".{input_file.stem}.{uuid.uuid4().hex}.csv"
+    task = segment_command(
+        input_file,
+        segment_pattern(input_file, output_dir),
+        list_file,
+        duration,
+        segment_times,
+    )
+    print(f"Splitting {input_file}")
+    try:
+        encoding.run_ffmpeg(task, "split", check=True)
+        parts = _read_segment_list(list_file, output_dir)
+        print(f"Split into {len(parts)} part(s)")
+    except subprocess.CalledProcessError as e:
+        print(f"An error occurred: {e}")
+        raise
+    finally:
+        if list_file.exists():
+            list_file.unlink()
+
+    if chapters and len(titles) == len(parts):
+        named = []
+        for (path, start, end), title in zip(parts, titles):
+            suffix = _title_suffix(title)
+            if suffix:
+                new_path = path.with_name(f"{path.stem}_{suffix}{path.suffix}")
+                os.replace(path, new_path)
+                path = new_path
+            named.append((path, start, end))
+        parts = named
+    return parts
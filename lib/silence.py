@@ -0,0 +1,337 @@
+import os
+import re
+import json
+import uuid
+import subprocess
+from pathlib import Path
+
+import lib.encoding as encoding
+import lib.encoders as encoders
+import lib.capabilities as capabilities
+import lib.progress as progress
+
+# -------------------------------------------------------------------------------
+# CONFIGURABLE SETTINGS
+# -------------------------------------------------------------------------------
+
+# audio quieter than this counts as silence
+SILENCE_NOISE_DB = -35
+
+# shortest silence that is detected at all
+MIN_SILENCE_SECONDS = 1.0
+
+# internal silences longer than this are removed by remove_silences, leading
+# and trailing ones are always trimmed
+MAX_PAUSE_SECONDS = 5.0
+
+# silence kept next to the speech at every cut so words are not clipped
+SILENCE_PADDING = 0.5
+
+# the analysis pass downmixes to mono at this rate before silencedetect, the
+# decode is then the only real cost
+ANALYSIS_SAMPLE_RATE = 8000
+
+SILENCE_CACHE_DIR = encoding.CACHE_DIR / "silence"
+# ==============================================================================
+
+_SILENCE_START = re.compile(r"silence_start: (-?[\d.]+)")
+_SILENCE_END = re.compile(r"silence_end: (-?[\d.]+)")
+
+
+def silencedetect_command(input_file, audio_channel=0) -> list:
+    """Decodes one audio stream only and logs its silences, nothing is written."""
+    return [
+        str(encoding.FFMPEG_PATH),
+        "-nostdin",
+        "-vn",
+        "-sn",
+        "-dn",
+        "-i",
+        str(input_file),
+        "-map",
+        f"0:a:{audio_channel}",
+        "-af",
+        f"aresample={ANALYSIS_SAMPLE_RATE},aformat=channel_layouts=mono,"
+        f"silencedetect=noise={SILENCE_NOISE_DB}dB:d={MIN_SILENCE_SECONDS}",
+        "-f",
+        "null",
+        "-",
+    ]
+
+
+def detect_silences(input_file, audio_channel=0) -> tuple:
+    """
+    Finds the silences of a file in one audio-only decode.
+
+    Args:
+        input_file: Path to the video or audio file.
+        audio_channel (int): Audio stream to analyse (-map 0:a:N).
+
+    Returns:
+        tuple: (list of (start, end) silences in seconds, duration in seconds
+               of the decoded audio).
+    """
+    silences = []
+    end_time = [0.0]
+
+    def on_line(line):
+        match = _SILENCE_START.search(line)
+        if match:
+            silences.append([max(0.0, float(match[1])), None])
+            return True
+        match = _SILENCE_END.search(line)
+        if match:
+            if silences and silences[-1][1] is None:
+                silences[-1][1] = float(match[1])
+            return True
+        time = progress.parse_stats(line).get("time")
+        if time is not None:
+            end_time[0] = max(end_time[0], time)
+        return False
+
+    encoding.run_ffmpeg(
+        silencedetect_command(input_file, audio_channel),
+        "silence_detect",
+        check=True,
+        stderr_callback=on_line,
+    )
+    duration = end_time[0]
+    # a file ending in silence has no silence_end line
+    silences = [(start, duration if end is None else end) for start, end in silences]
+    return silences, duration
+
+
+def silence_cache_path(input_file, audio_channel=0) -> Path:
+    return SILENCE_CACHE_DIR / (
+        encoding.cache_key(
+            input_file,
+            channel=audio_channel,
+            noise=SILENCE_NOISE_DB,
+            minimum=MIN_SILENCE_SECONDS,
+        )
+        + ".json"
+    )
+
+
+def get_silences(input_file, audio_channel=0) -> dict:
+    """
+    detect_silences, cached per file (see encoding.cache_key).
+
+    Returns:
+        dict: "silences" as [start, end] lists and "duration" in seconds.
+    """
+    cache_path = silence_cache_path(input_file, audio_channel)
+    if cache_path.exists():
+        with open(cache_path, encoding="utf-8") as cache_file:
+            return json.load(cache_file)
+
+    print(f"Detecting silences of {input_file}")
+    silences, duration = detect_silences(input_file, audio_channel)
+    result = {
+        "source": str(input_file),
+        "silences": [list(silence) for silence in silences],
+        "duration": duration,
+    }
+    cache_path.parent.mkdir(parents=True, exist_ok=True)
+    temp_path = cache_path.with_name(f"{cache_path.stem}.{uuid.uuid4().hex}.json")
+    with open(temp_path, "w", encoding="utf-8") as cache_file:
+        json.dump(result, cache_file)
+    os.replace(temp_path, cache_path)
+    print(f"Found {len(silences)} silence(s) in {input_file}")
+    return result
+
+
+def keep_ranges(
+    silences, duration, remove_pauses=False, max_pause=None, padding=None
+) -> list:
+    """
+    Turns silences into the (start, end) ranges worth keeping.
+
+    Leading and trailing silences are dropped, internal ones only when
+    remove_pauses is set and they are longer than max_pause. padding seconds
+    of every dropped silence are kept next to the sound.
+    """
+    max_pause = MAX_PAUSE_SECONDS if max_pause is None else max_pause
+    padding = SILENCE_PADDING if padding is None else padding
+    # silencedetect's last silence_end and the probed duration differ by a
+    # few milliseconds, a silence ending this close to the end reaches it
+    tolerance = MIN_SILENCE_SECONDS / 2
+    cuts = []
+    for start, end in sorted(silences):
+        leading = start <= 0
+        trailing = end >= duration - tolerance
+        if not (leading or trailing or (remove_pauses and end - start > max_pause)):
+            continue
+        cut_start = start if leading else start + padding
+        cut_end = duration if trailing else end - padding
+        if cut_end > cut_start:
+            cuts.append((cut_start, cut_end))
+
+    ranges = []
+    position = 0.0
+    for cut_start, cut_end in cuts:
+        if cut_start > position:
+            ranges.append((position, cut_start))
+        position = max(position, cut_end)
+    if position < duration:
+        ranges.append((position, duration))
+    return ranges
+
+
+def _has_video(input_file) -> bool:
+    result = subprocess.run(
+        encoding.streams_command(input_file, "v:0"),
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        streams = json.loads(result.stdout)["streams"]
+    except (ValueError, KeyError):
+        return False
+    # cover art is a video stream too
+    return any(
+        not stream.get("disposition", {}).get("attached_pic") for stream in streams
+    )
+
+
+def concat_list(input_file, ranges) -> str:
+    """concat demuxer script reading every range of the same file."""
+    path = str(Path(input_file).absolute()).replace("'", "'\\''")
+    lines = ["ffconcat version 1.0"]
+    for start, end in ranges:
+        lines.extend([f"file '{path}'", f"inpoint {start:.3f}", f"outpoint {end:.3f}"])
+    return "\n".join(lines) + "\n"
+
+
+def copy_ranges_command(list_file, output_file, audio_channel=0) -> list:
+    """Stream copies the ranges of a concat_list in one process."""
+    return [
+        str(encoding.FFMPEG_PATH),
+        "-y",
+        "-f",
+        "concat",
+        "-safe",
+        "0",
+        "-i",
+        str(list_file),
+        "-map",
+        "0:v:0?",
+        "-map",
+        f"0:a:{audio_channel}",
+        "-c",
+        "copy",
+        str(output_file),
+    ]
+
+
+def _select_expression(ranges) -> str:
+    return "+".join(f"between(t\\,{start:.3f}\\,{end:.3f})" for start, end in ranges)
+
+
+def encode_ranges_command(
+    input_file, output_file, ranges, audio_channel=0, encoder=None
+) -> list:
+    """
+    Re-encodes only the ranges of a video in one decode: select/aselect drop
+    the rest and the timestamps are rebuilt, the video uses the encoder
+    profile (WEB_ENCODER by default).
+    """
+    expression = _select_expression(ranges)
+    return [
+        str(encoding.FFMPEG_PATH),
+        "-y",
+        "-i",
+        str(input_file),
+        "-filter_complex",
+        f"[0:v:0]select='{expression}',setpts=N/FRAME_RATE/TB[v];"
+        f"[0:a:{audio_channel}]aselect='{expression}',asetpts=N/SR/TB[a]",
+        "-map",
+        "[v]",
+        "-map",
+        "[a]",
+        # the filtered stream has no frame rate, keep the rebuilt timestamps
+        "-fps_mode",
+        "passthrough",
+        # see lib/encoders.py
+        *encoders.video_args(encoder or encoding.WEB_ENCODER, output_file),
+        "-c:a",
+        "aac",
+        "-movflags",
+        "+faststart",
+        str(output_file),
+    ]
+
+
+def remove_silences(
+    input_file,
+    output_file,
+    remove_pauses=False,
+    audio_channel=0,
+    copy=None,
+    encoder=None,
+) -> list:
+    """
+    Trims the dead air of a recording.
+
+    The silences come from get_silences (cached). The kept ranges are stream
+    copied through the concat demuxer when that is exact enough: always for
+    audio files, and for videos when only the leading and trailing silence
+    go (the start snaps back to a keyframe, keeping a little more silence).
+    Videos with internal cuts are re-encoded in a single pass instead, as a
+    copied range could start at a keyframe inside the previous one.
+
+    Args:
+        input_file: Path to the recording.
+        output_file: Path of the trimmed file.
+        remove_pauses (bool): Also cut internal silences longer than
+            MAX_PAUSE_SECONDS.
+        audio_channel (int): Audio stream analysed and kept.
+        copy (bool): Force stream copy (True) or re-encoding (False).
+        encoder (str): Encoder profile of a re-encode (see lib/encoders.py),
+            defaults to encoding.WEB_ENCODER.
+
+    Returns:
+        list: The (start, end) ranges of the source that were kept.
+    """
+    capabilities.require(filters=["silencedetect"], operation="remove_silences")
+    analysis = get_silences(input_file, audio_channel)
+    ranges = keep_ranges(analysis["silences"], analysis["duration"], remove_pauses)
+    if not ranges:
+        print(f"{input_file} is silent, nothing to keep")
+        return []
+    if copy is None:
+        copy = len(ranges) == 1 or not _has_video(input_file)
+    if not copy:
+        encoder = encoders.resolve(encoder or encoding.WEB_ENCODER)
+        capabilities.require(
+            [encoders.get_profile(encoder)["codec"]],
+            ["select", "aselect"],
+            operation="remove_silences",
+        )
+
+    kept = sum(end - start for start, end in ranges)
+    print(
+        f"Keeping {kept:.1f}s of {analysis['duration']:.1f}s in {len(ranges)} "
+        f"range(s) ({'stream copy' if copy else 're-encode'})"
+    )
+    list_file = None
+    try:
+        if copy:
+            list_file = Path(output_file).with_name(
+                f"{Path(output_file).stem}.{uuid.uuid4().hex}.ffconcat"
+            )
+            list_file.write_text(concat_list(input_file, ranges), encoding="utf-8")
+            task = copy_ranges_command(list_file, output_file, audio_channel)
+        else:
+            task = encode_ranges_command(
+                input_file, output_file, ranges, audio_channel, encoder
+            )
+        encoding.run_ffmpeg(task, "remove_silences", check=True)
+        print("Silence removal done!")
+    except subprocess.CalledProcessError as e:
+        print(f"An error occurred: {e}")
+        raise
+    finally:
+        if list_file is not None and list_file.exists():
+            list_file.unlink()
+    return ranges
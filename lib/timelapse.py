@@ -0,0 +1,173 @@
+import subprocess
+from pathlib import Path
+
+import lib.encoding as encoding
+import lib.encoders as encoders
+import lib.capabilities as capabilities
+
+# -------------------------------------------------------------------------------
+# CONFIGURABLE SETTINGS
+# -------------------------------------------------------------------------------
+
+# frame rate of the timelapse
+TIMELAPSE_FPS = 30
+
+# "auto" decodes only keyframes when they alone give at least
+# MIN_KEYFRAME_FPS frames per second of timelapse, "keyframes" or "select"
+# force a path
+TIMELAPSE_MODE = "auto"
+MIN_KEYFRAME_FPS = 10
+
+# seconds of packets read to measure the keyframe interval
+KEYFRAME_PROBE_SECONDS = 120
+# ==============================================================================
+
+MODES = ["auto", "keyframes", "select"]
+
+
+def keyframe_interval_command(input_file) -> list:
+    """Lists the video packet times and flags, nothing is decoded."""
+    return [
+        str(encoding.FFPROBE_PATH),
+        "-v",
+        "error",
+        "-select_streams",
+        "v:0",
+        "-read_intervals",
+        f"%+{KEYFRAME_PROBE_SECONDS}",
+        "-show_entries",
+        "packet=pts_time,flags",
+        "-of",
+        "csv=p=0",
+        str(input_file),
+    ]
+
+
+def keyframe_interval(input_file) -> float:
+    """Median seconds between keyframes at the start of a video, None if unknown."""
+    result = subprocess.run(
+        keyframe_interval_command(input_file),
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,
+        text=True,
+    )
+    times = []
+    for line in result.stdout.splitlines():
+        fields = line.split(",")
+        if len(fields) >= 2 and fields[1].startswith("K"):
+            try:
+                times.append(float(fields[0]))
+            except ValueError:
+                continue
+    times.sort()
+    gaps = sorted(later - earlier for earlier, later in zip(times, times[1:]))
+    if not gaps:
+        return None
+    return gaps[len(gaps) // 2]
+
+
+def choose_mode(input_file, speed, mode=None) -> str:
+    """Resolves "auto" to "keyframes" or "select" for a speed factor."""
+    mode = mode or TIMELAPSE_MODE
+    if mode != "auto":
+        return mode
+    interval = keyframe_interval(input_file)
+    if interval and speed / interval >= MIN_KEYFRAME_FPS:
+        return "keyframes"
+    return "select"
+
+
+def timelapse_command(
+    input_file,
+    output_file,
+    speed,
+    mode="select",
+    trim_start=None,
+    trim_end=None,
+    fps=None,
+    encoder=None,
+) -> list:
+    """
+    Builds the timelapse encode.
+
+    "keyframes" discards the non-key video packets in the demuxer
+    (-discard nokey), the decoder only ever sees keyframes. "select" decodes
+    everything but only keeps one frame per output frame before the
+    timestamps are compressed, so scaling and encoding run on the kept frames.
+    """
+    fps = fps or TIMELAPSE_FPS
+    output_file = Path(output_file).with_suffix(".mp4")
+    task = [str(encoding.FFMPEG_PATH), "-y"]
+    if mode == "keyframes":
+        task.extend(["-discard", "nokey", "-skip_frame", "nokey"])
+        video_filter = f"setpts=(PTS-STARTPTS)/{speed}"
+    elif mode == "select":
+        step = speed / fps
+        video_filter = (
+            f"select='isnan(prev_selected_t)+gte(t-prev_selected_t\\,{step:.6f})',"
+            f"setpts=(PTS-STARTPTS)/{speed}"
+        )
+    else:
+        raise ValueError(f"Unknown timelapse mode: {mode}")
+    task.extend(encoding.seek_input_args(trim_start, trim_end))
+    task.extend(["-i", str(input_file), "-map", "0:v:0", "-an", "-sn"])
+    task.extend(
+        [
+            "-vf",
+            f"{video_filter},fps={fps},scale={encoding.WEB_MP4_WIDTH}:-2",
+            # see lib/encoders.py, WEB_ENCODER by default
+            *encoders.video_args(encoder or encoding.WEB_ENCODER, output_file),
+            "-movflags",
+            "+faststart",
+            str(output_file),
+        ]
+    )
+    return task
+
+
+def timelapse(
+    input_file,
+    output_file,
+    speed,
+    mode=None,
+    trim_start=None,
+    trim_end=None,
+    fps=None,
+    encoder=None,
+) -> str:
+    """
+    Speeds a video up into a silent web mp4 overview.
+
+    Args:
+        input_file: Path to the video.
+        output_file: Path of the mp4.
+        speed (float): Speed factor, e.g. 60 turns an hour into a minute.
+        mode (str): One of MODES, defaults to TIMELAPSE_MODE.
+        trim_start, trim_end: Optional range (HH:mm:ss).
+        fps (int): Output frame rate, defaults to TIMELAPSE_FPS.
+        encoder (str): Encoder profile (see lib/encoders.py), defaults to
+            encoding.WEB_ENCODER.
+
+    Returns:
+        str: The mode that was used.
+    """
+    if speed <= 1:
+        raise ValueError(f"Timelapse speed must be above 1, got {speed}")
+    encoder = encoders.resolve(encoder or encoding.WEB_ENCODER)
+    mode = choose_mode(input_file, speed, mode)
+    capabilities.require(
+        [encoders.get_profile(encoder)["codec"]],
+        ["select"] if mode == "select" else [],
+        operation="timelapse",
+    )
+    task = timelapse_command(
+        input_file, output_file, speed, mode, trim_start, trim_end, fps, encoder
+    )
+    print(f"Processing timelapse x{speed:g} ({mode})")
+    try:
+        encoding.run_ffmpeg(task, "timelapse", check=True)
+        print("Timelapse done!")
+    except subprocess.CalledProcessError as e:
+        print(f"An error occurred: {e}")
+        raise
+    return mode
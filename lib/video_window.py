@@ -4,7 +4,7 @@ import time
 from pathlib import Path
 from PySide6.QtWidgets import QFileDialog, QMainWindow
 
-from PySide6.QtCore import QDir, Qt, QUrl, QDateTime, QTime
+from PySide6.QtCore import QDir, Qt, QUrl, QDateTime, QTime, Signal
 from PySide6.QtMultimedia import QMediaPlayer, QAudioOutput
 from PySide6.QtMultimediaWidgets import QVideoWidget
 from PySide6.QtWidgets import (
@@ -21,6 +21,9 @@ from PySide6.QtWidgets import (
     QDateTimeEdit,
     QTimeEdit,
     QInputDialog,
+    QDialog,
+    QDialogButtonBox,
+    QListWidget,
 )
 from PySide6.QtGui import QIcon, QAction, QColor, QPalette
 
@@ -28,10 +31,22 @@ from PySide6.QtGui import QIcon, QAction, QColor, QPalette
 import datetime
 import lib.media_info as media_info
 import lib.encoding as encoding
+import lib.governor as governor
+import lib.gif_budget as gif_budget
+import lib.frame_export as frame_export
+import lib.frame_archive as frame_archive
+import lib.dedupe as dedupe
+import lib.proxy as proxy
+import lib.timelapse as timelapse
+import lib.silence as silence
+import lib.cutlist as cutlist
+import lib.segment as segment
+import lib.join as join
+import lib.ladder as ladder
+import lib.encoders as encoders
 import subprocess
 import threading
 
-
 # -------------------------------------------------------------------------------
 # CONFIGURABLE SETTINGS
 # -------------------------------------------------------------------------------
@@ -40,8 +55,11 @@ APP_NAME = "Ffmpeg encoder"
 VIDEO_FILTER = "Videos(*.mp4 *.mkv *.avi *.mov *.gif *.3gp)"
 SUB_FILTER = "Subtitle(*.srt *.ass *.sub)"
 GIF_FILTER = "GIF(*.gif)"
+FRAME_ARCHIVE_FILTER = "Frame container(*.fpak);;Tar(*.tar);;Zip(*.zip)"
+ANIMATION_FILTER = "GIF(*.gif);;WebP(*.webp);;APNG(*.apng *.png)"
 IMAGE_FILTER = "Images(*.jpg *.jpeg *.png *.bmp *.tiff *.webp)"
 AUDIO_FILTER = "Audio(*.wav *.mp3 *.flac *.aac *.ogg)"
+CUT_LIST_FILTER = "Cut list(*.csv *.json *.edl)"
 PLAY_PAUSE_STATE = 0
 # -------------------------------------------------------------------------------
 
@@ -431,7 +449,43 @@ def get_modern_stylesheet():
     """
 
 
+def seconds_time_format(seconds):
+    return QTime(0, 0).addMSecs(int(round(seconds * 1000)))
+
+
+class CutListDialog(QDialog):
+    """Lists the clips of a cut list, selecting one previews its range."""
+
+    def __init__(self, parent, cuts):
+        super().__init__(parent)
+        self.setWindowTitle("Cut list")
+        self.cuts = cuts
+        self.cut_list = QListWidget(self)
+        for index, cut in enumerate(cuts):
+            _range = (
+                f"{seconds_time_format(cut.start).toString('HH:mm:ss.zzz')} - "
+                f"{seconds_time_format(cut.end).toString('HH:mm:ss.zzz')}"
+            )
+            self.cut_list.addItem(f"{index + 1:03d}  {_range}  {cut.name}")
+        self.cut_list.currentRowChanged.connect(self.preview_row)
+        buttons = QDialogButtonBox(QDialogButtonBox.Close, self)
+        cut_button = buttons.addButton("Cut all clips", QDialogButtonBox.AcceptRole)
+        cut_button.clicked.connect(self.accept)
+        buttons.rejected.connect(self.reject)
+        layout = QVBoxLayout(self)
+        layout.addWidget(self.cut_list)
+        layout.addWidget(buttons)
+        self.resize(520, 360)
+
+    def preview_row(self, row):
+        if row >= 0:
+            self.parent().preview_cut(self.cuts[row])
+
+
 class VideoWindow(QMainWindow):
+    # emitted from the proxy worker thread, handled on the GUI thread
+    proxy_ready = Signal(str, object)
+
     def __init__(self):
         super().__init__()
         self.setupUI()
@@ -447,6 +501,11 @@ class VideoWindow(QMainWindow):
         self.media_info = media_info.MediaInfo()
 
         self.video_player = QMediaPlayer()
+        # proxy shown in the preview, positions are mapped through it
+        self.preview_proxy = None
+        self.proxy_ready.connect(self.use_preview_proxy)
+        # encoder profile (see lib/encoders.py) passed to the encoding jobs
+        self.web_encoder = encoding.WEB_ENCODER
         self.audio_player = QAudioOutput()
         self.video_player.setAudioOutput(self.audio_player)
 
@@ -526,6 +585,16 @@ class VideoWindow(QMainWindow):
         encoding_action.setStatusTip("Encode all videos inside a folder")
         encoding_action.triggered.connect(self.batch_encode)
 
+        encoding_unique_action = QAction("Encode mp4 (skip duplicates)", self)
+        encoding_unique_action.setStatusTip(
+            "Encode the videos of a folder once, skipping re-uploads and re-encodes"
+        )
+        encoding_unique_action.triggered.connect(self.batch_encode_unique)
+
+        find_duplicates_action = QAction("Find duplicates", self)
+        find_duplicates_action.setStatusTip("List near duplicate videos in a folder")
+        find_duplicates_action.triggered.connect(self.find_duplicates)
+
         # Create batch extract subtitles action
         extract_susbs_action = QAction("Extract subtitles", self)
         extract_susbs_action.setStatusTip("Extract all subtitles inside a folder")
@@ -535,7 +604,9 @@ class VideoWindow(QMainWindow):
         encoding_menu = menu_bar.addMenu("&Batch")
         # fileMenu.addAction(newAction)
         encoding_menu.addAction(encoding_action)
+        encoding_menu.addAction(encoding_unique_action)
         encoding_menu.addAction(extract_susbs_action)
+        encoding_menu.addAction(find_duplicates_action)
 
         encoding_menu = menu_bar.addMenu("&Extra")
 
@@ -554,10 +625,14 @@ class VideoWindow(QMainWindow):
         brun_subs_action.addAction(burn_external_subs_action)
 
         # Create gif action
-        to_gif_action = QAction("Convert to gif", self)
-        to_gif_action.setStatusTip("Convert to gif")
+        to_gif_action = QAction("Convert to gif / webp / apng", self)
+        to_gif_action.setStatusTip("Convert to an animated gif, webp or png")
         to_gif_action.triggered.connect(self.to_gif)
 
+        fit_gif_action = QAction("Convert to gif (size limit)", self)
+        fit_gif_action.setStatusTip("Best gif under a size limit")
+        fit_gif_action.triggered.connect(self.fit_gif)
+
         # Create extract subs action
         extract_subs_action = QAction("Extract subtitle", self)
         extract_subs_action.setStatusTip("Extract subtitle")
@@ -567,15 +642,51 @@ class VideoWindow(QMainWindow):
         loop_video_action.setStatusTip("Loop video")
         loop_video_action.triggered.connect(self.loop_video)
 
+        timelapse_action = QAction("Timelapse / fast preview", self)
+        timelapse_action.setStatusTip("Sped up silent overview of the video")
+        timelapse_action.triggered.connect(self.make_timelapse)
+
+        remove_silences_action = QAction("Trim silence", self)
+        remove_silences_action.setStatusTip("Cut the dead air of a recording")
+        remove_silences_action.triggered.connect(self.remove_silences)
+
+        cut_list_action = QAction("Cut list", self)
+        cut_list_action.setStatusTip("Cut many clips from a CSV, JSON or EDL list")
+        cut_list_action.triggered.connect(self.open_cut_list)
+
+        split_parts_action = QAction("Split into parts", self)
+        split_parts_action.setStatusTip("Split by duration, size or chapters")
+        split_parts_action.triggered.connect(self.split_parts)
+
+        join_clips_action = QAction("Join clips", self)
+        join_clips_action.setStatusTip("Join clips end to end")
+        join_clips_action.triggered.connect(self.join_clips)
+
+        package_ladder_action = QAction("Package for streaming", self)
+        package_ladder_action.setStatusTip("HLS/DASH renditions from one decode")
+        package_ladder_action.triggered.connect(self.package_ladder)
+
         video_to_frames_action = QAction("Export Frames", self)
         video_to_frames_action.setStatusTip("Export Frames")
         video_to_frames_action.triggered.connect(self.export_frames)
 
+        frames_archive_action = QAction("Export Frames to archive", self)
+        frames_archive_action.setStatusTip("Export Frames into one tar/zip/fpak file")
+        frames_archive_action.triggered.connect(self.export_frames_archive)
+
         # Create convert menu bar and add gif and extract_subs action
         encoding_menu.addAction(to_gif_action)
+        encoding_menu.addAction(fit_gif_action)
         encoding_menu.addAction(extract_subs_action)
         encoding_menu.addAction(loop_video_action)
+        encoding_menu.addAction(timelapse_action)
+        encoding_menu.addAction(remove_silences_action)
+        encoding_menu.addAction(cut_list_action)
+        encoding_menu.addAction(split_parts_action)
+        encoding_menu.addAction(join_clips_action)
+        encoding_menu.addAction(package_ladder_action)
         encoding_menu.addAction(video_to_frames_action)
+        encoding_menu.addAction(frames_archive_action)
 
         # Create trim_preset action
         trim_internal_preset_action = QAction("Trim internal preset", self)
@@ -605,6 +716,55 @@ class VideoWindow(QMainWindow):
         image_audio_to_video_action.triggered.connect(self.image_audio_to_video)
         encoding_menu.addAction(image_audio_to_video_action)
 
+        batch_image_audio_action = QAction("Image + Audio folder to Videos", self)
+        batch_image_audio_action.setStatusTip(
+            "One video per audio file of a folder, all with the same image"
+        )
+        batch_image_audio_action.triggered.connect(self.batch_image_audio_to_video)
+        encoding_menu.addAction(batch_image_audio_action)
+
+        # Add profiling toggle
+        profile_jobs_action = QAction("Profile jobs", self)
+        profile_jobs_action.setStatusTip(
+            "Print a per-stage timing breakdown after every ffmpeg job"
+        )
+        profile_jobs_action.setCheckable(True)
+        profile_jobs_action.setChecked(encoding.PROFILE_JOBS)
+        profile_jobs_action.toggled.connect(self.toggle_profile_jobs)
+        preview_proxy_action = QAction("Preview proxies", self)
+        preview_proxy_action.setStatusTip(
+            "Preview large videos through a small proxy, encodes use the original"
+        )
+        preview_proxy_action.setCheckable(True)
+        preview_proxy_action.setChecked(proxy.PROXY_PREVIEW)
+        preview_proxy_action.toggled.connect(self.toggle_preview_proxies)
+        auto_crop_action = QAction("Auto crop black bars", self)
+        auto_crop_action.setStatusTip(
+            "Crop letterbox bars in web mp4, trim presets and batch encodes"
+        )
+        auto_crop_action.setCheckable(True)
+        auto_crop_action.setChecked(encoding.AUTO_CROP)
+        auto_crop_action.toggled.connect(self.toggle_auto_crop)
+        normalize_loudness_action = QAction("Normalize loudness", self)
+        normalize_loudness_action.setStatusTip(
+            "EBU R128 loudness in web mp4, audio extraction, trim presets and batch encodes"
+        )
+        normalize_loudness_action.setCheckable(True)
+        normalize_loudness_action.setChecked(encoding.NORMALIZE_LOUDNESS)
+        normalize_loudness_action.toggled.connect(self.toggle_normalize_loudness)
+        web_encoder_action = QAction("Encoder profile...", self)
+        web_encoder_action.setStatusTip(
+            "Encoder of web mp4, trim presets, batch encodes, timelapses, "
+            "cut lists, joins and silence trims"
+        )
+        web_encoder_action.triggered.connect(self.select_web_encoder)
+        encoding_menu.addSeparator()
+        encoding_menu.addAction(web_encoder_action)
+        encoding_menu.addAction(auto_crop_action)
+        encoding_menu.addAction(normalize_loudness_action)
+        encoding_menu.addAction(profile_jobs_action)
+        encoding_menu.addAction(preview_proxy_action)
+
         self.play_button = QPushButton()
         self.play_button.setEnabled(False)
         self.play_button.setIcon(self.style().standardIcon(QStyle.SP_MediaPlay))
@@ -776,7 +936,9 @@ class VideoWindow(QMainWindow):
         global PLAY_PAUSE_STATE
         if self.media_info.file_location != "":
             print(self.media_info.file_location)
+            self.preview_proxy = None
             self.video_player.setSource(self.media_info.file_location)
+            self.load_preview_proxy()
             self.play_button.setEnabled(True)
             self.label_file_location.setText(self.media_info.file_location)
             self.play_button.setIcon(self.style().standardIcon(QStyle.SP_MediaPause))
@@ -860,7 +1022,62 @@ class VideoWindow(QMainWindow):
     def set_current_time_slider(self, position):
         self.label_current_time.setText(f"{time_select_format(position)}")
 
+    def source_position(self, position):
+        """Maps a player position to the original video's timeline."""
+        if self.preview_proxy is None:
+            return position
+        return self.preview_proxy.to_source(position)
+
+    def player_position(self, position):
+        """Maps a position of the original video to the player's timeline."""
+        if self.preview_proxy is None:
+            return position
+        return self.preview_proxy.to_proxy(position)
+
+    def load_preview_proxy(self):
+        if not proxy.PROXY_PREVIEW or not self.media_info.file_location:
+            return
+        _proxy_thread = threading.Thread(
+            target=lambda source: self.proxy_ready.emit(
+                source, governor.run_as("background", proxy.make_proxy, source)
+            ),
+            args=(self.media_info.file_location,),
+            daemon=True,
+        )
+        _proxy_thread.start()
+
+    def use_preview_proxy(self, source, preview_proxy):
+        """Swaps the preview to a proxy (or back to the original with None)."""
+        if source != self.media_info.file_location or (
+            preview_proxy is not None and not proxy.PROXY_PREVIEW
+        ):
+            # the file changed or proxies were turned off during the encode
+            return
+        if preview_proxy is None and self.preview_proxy is None:
+            return
+        _position = self.source_position(self.video_player.position())
+        _playing = (
+            self.video_player.playbackState() == QMediaPlayer.PlaybackState.PlayingState
+        )
+        self.preview_proxy = preview_proxy
+        if preview_proxy is None:
+            self.video_player.setSource(self.media_info.file_location)
+        else:
+            print(f"Previewing through {preview_proxy.path}")
+            self.video_player.setSource(QUrl.fromLocalFile(str(preview_proxy.path)))
+        self.video_player.setPosition(self.player_position(_position))
+        if _playing:
+            self.video_player.play()
+
+    def toggle_preview_proxies(self, checked):
+        proxy.PROXY_PREVIEW = checked
+        if checked:
+            self.load_preview_proxy()
+        else:
+            self.use_preview_proxy(self.media_info.file_location, None)
+
     def position_changed(self, position):
+        position = self.source_position(position)
         self.position_slider.setValue(position)
         self.set_current_time_slider(position)
 
@@ -873,7 +1090,7 @@ class VideoWindow(QMainWindow):
         self.trim_end_date_time_edit.setTime(time_edit_format(_display_str))
 
     def set_position(self, position):
-        self.video_player.setPosition(position)
+        self.video_player.setPosition(self.player_position(position))
 
     def load_audio_tracks(self):
         """Load audio tracks from the current video file and populate the combobox."""
@@ -945,7 +1162,7 @@ class VideoWindow(QMainWindow):
 
     def set_start_time_from_position(self):
         """Set the start time to the current video position."""
-        current_position = self.video_player.position()
+        current_position = self.source_position(self.video_player.position())
         if current_position >= 0:
             # Convert position (milliseconds) to time string, then to QTime
             time_str = time_select_format(current_position)
@@ -955,7 +1172,7 @@ class VideoWindow(QMainWindow):
 
     def set_end_time_from_position(self):
         """Set the end time to the current video position."""
-        current_position = self.video_player.position()
+        current_position = self.source_position(self.video_player.position())
         if current_position >= 0:
             # Convert position (milliseconds) to time string, then to QTime
             time_str = time_select_format(current_position)
@@ -963,15 +1180,52 @@ class VideoWindow(QMainWindow):
             self.trim_end_date_time_edit.setTime(qtime)
             # The value change will trigger trim_end_value_change automatically
 
+    def toggle_profile_jobs(self, checked):
+        encoding.PROFILE_JOBS = checked
+
+    def toggle_auto_crop(self, checked):
+        encoding.AUTO_CROP = checked
+
+    def toggle_normalize_loudness(self, checked):
+        encoding.NORMALIZE_LOUDNESS = checked
+
+    def select_web_encoder(self):
+        _profiles = list(encoders.ENCODER_PROFILES)
+        _profile, result = QInputDialog.getItem(
+            self,
+            "Encoder profile",
+            "Web mp4 encoder:",
+            _profiles,
+            _profiles.index(self.web_encoder),
+            False,
+        )
+        if result:
+            self.web_encoder = _profile
+
     def handle_error(self):
         self.play_button.setEnabled(False)
         self.error_label.setText("Error: " + self.video_player.errorString())
 
+    def save_animation(self):
+        if self.media_info.file_location == "":
+            print("No media selected")
+            self.media_info.file_location = self.browse_video()
+        _output, _selected_filter = QFileDialog.getSaveFileName(
+            self,
+            "Save File",
+            f"{self.media_info.file_location[:len(self.media_info.file_location) - 4]}",
+            ANIMATION_FILTER,
+        )
+        if _output and not Path(_output).suffix:
+            # add the extension of the selected filter, e.g. "WebP(*.webp)"
+            _output += _selected_filter.split("*", 1)[1].split(")")[0].split()[0]
+        return _output
+
     def to_gif(self):
-        _output = self.save_video(GIF_FILTER)
+        _output = self.save_animation()
         if _output:
             _to_gif_thread = threading.Thread(
-                target=encoding.to_gif,
+                target=encoding.to_animation,
                 args=(
                     self.media_info.file_location,
                     _output,
@@ -981,6 +1235,205 @@ class VideoWindow(QMainWindow):
             )
             _to_gif_thread.start()
 
+    def fit_gif(self):
+        _size_mb, result = QInputDialog.getDouble(
+            self, "Gif size limit", "Maximum size (MB):", 8.0, 0.1, 1000.0, 1
+        )
+        if not result:
+            return
+        _output = self.save_video(GIF_FILTER)
+        if _output:
+            _fit_gif_thread = threading.Thread(
+                target=gif_budget.fit_gif,
+                args=(
+                    self.media_info.file_location,
+                    _output,
+                    int(_size_mb * 1024 * 1024),
+                    self.media_info.trim_start,
+                    self.media_info.trim_end,
+                ),
+            )
+            _fit_gif_thread.start()
+
+    def make_timelapse(self):
+        _speed, result = QInputDialog.getDouble(
+            self, "Timelapse", "Speed factor:", 60.0, 1.1, 10000.0, 1
+        )
+        if not result:
+            return
+        _output = self.save_video(VIDEO_FILTER)
+        if _output:
+            _timelapse_thread = threading.Thread(
+                target=timelapse.timelapse,
+                args=(
+                    self.media_info.file_location,
+                    _output,
+                    _speed,
+                    None,
+                    self.media_info.trim_start,
+                    self.media_info.trim_end,
+                ),
+                kwargs={"encoder": self.web_encoder},
+            )
+            _timelapse_thread.start()
+
+    def open_cut_list(self):
+        if self.media_info.file_location == "":
+            print("No media selected")
+            self.media_info.file_location = self.browse_video()
+            self.set_media()
+        if not self.media_info.file_location:
+            return
+        _list_path = QFileDialog.getOpenFileName(
+            self,
+            "Open cut list",
+            os.path.dirname(self.media_info.file_location),
+            CUT_LIST_FILTER,
+        )[0]
+        if not _list_path:
+            return
+        try:
+            _cuts = cutlist.load_cut_list(_list_path)
+        except (OSError, ValueError, KeyError) as e:
+            print(f"Could not read the cut list: {e}")
+            return
+        _dialog = CutListDialog(self, _cuts)
+        if _dialog.exec() != QDialog.Accepted:
+            return
+        _output_dir = self.select_folder()
+        if _output_dir:
+            _cut_clips_thread = threading.Thread(
+                target=cutlist.cut_clips,
+                args=(
+                    self.media_info.file_location,
+                    _cuts,
+                    _output_dir,
+                    self.media_info.audio_channel,
+                ),
+                kwargs={"encoder": self.web_encoder},
+            )
+            _cut_clips_thread.start()
+
+    def preview_cut(self, cut):
+        """Seeks the preview to a cut and shows its range as the trim times."""
+        self.trim_start_date_time_edit.setTime(seconds_time_format(cut.start))
+        self.trim_end_date_time_edit.setTime(seconds_time_format(cut.end))
+        self.set_position(int(cut.start * 1000))
+
+    def split_parts(self):
+        if self.media_info.file_location == "":
+            print("No media selected")
+            self.media_info.file_location = self.browse_video()
+            self.set_media()
+        if not self.media_info.file_location:
+            return
+        _modes = ["Duration", "Size", "Chapters"]
+        _mode, result = QInputDialog.getItem(
+            self, "Split into parts", "Split by:", _modes, 0, False
+        )
+        if not result:
+            return
+        _options = {}
+        if _mode == _modes[0]:
+            _minutes, result = QInputDialog.getDouble(
+                self,
+                "Split into parts",
+                "Minutes per part:",
+                segment.SEGMENT_SECONDS / 60,
+                0.1,
+                10000.0,
+                1,
+            )
+            _options["duration"] = _minutes * 60
+        elif _mode == _modes[1]:
+            _size_mb, result = QInputDialog.getDouble(
+                self, "Split into parts", "Largest part (MB):", 100.0, 1.0, 100000.0, 1
+            )
+            _options["size"] = int(_size_mb * 1024 * 1024)
+        else:
+            _options["chapters"] = True
+        if not result:
+            return
+        _output_dir = self.select_folder()
+        if _output_dir:
+            _split_thread = threading.Thread(
+                target=segment.split,
+                args=(self.media_info.file_location, _output_dir),
+                kwargs=_options,
+            )
+            _split_thread.start()
+
+    def join_clips(self):
+        _clips = QFileDialog.getOpenFileNames(
+            self,
+            "Select clips in order",
+            os.path.dirname(self.media_info.file_location),
+            VIDEO_FILTER,
+        )[0]
+        if len(_clips) < 2:
+            print("Select at least two clips to join")
+            return
+        _output = QFileDialog.getSaveFileName(
+            self,
+            "Save File",
+            str(Path(_clips[0]).with_name(f"{Path(_clips[0]).stem}_joined")),
+            VIDEO_FILTER,
+        )[0]
+        if _output:
+            _join_thread = threading.Thread(
+                target=join.join,
+                args=(_clips, _output),
+                kwargs={"encoder": self.web_encoder},
+            )
+            _join_thread.start()
+
+    def package_ladder(self):
+        if self.media_info.file_location == "":
+            print("No media selected")
+            self.media_info.file_location = self.browse_video()
+            self.set_media()
+        if not self.media_info.file_location:
+            return
+        _packaging, result = QInputDialog.getItem(
+            self,
+            "Package for streaming",
+            "Format:",
+            list(ladder.PACKAGING_FORMATS),
+            0,
+            False,
+        )
+        if not result:
+            return
+        _output_dir = self.select_folder()
+        if _output_dir:
+            _package_thread = threading.Thread(
+                target=ladder.package,
+                args=(self.media_info.file_location, _output_dir, _packaging),
+                kwargs={"audio_channel": self.media_info.audio_channel},
+            )
+            _package_thread.start()
+
+    def remove_silences(self):
+        _scopes = ["Start and end only", "Start, end and long pauses"]
+        _scope, result = QInputDialog.getItem(
+            self, "Trim silence", "Remove:", _scopes, 0, False
+        )
+        if not result:
+            return
+        _output = self.save_video()
+        if _output:
+            _remove_silences_thread = threading.Thread(
+                target=silence.remove_silences,
+                args=(
+                    self.media_info.file_location,
+                    _output,
+                    _scope == _scopes[1],
+                    self.media_info.audio_channel,
+                ),
+                kwargs={"encoder": self.web_encoder},
+            )
+            _remove_silences_thread.start()
+
     def extract_subtitle(self):
         if self.media_info.file_location == "":
             print("No media selected")
@@ -1068,20 +1521,68 @@ class VideoWindow(QMainWindow):
                 )
                 _loop_video_thread.start()
 
+    def get_frame_selection(self):
+        _mode, result = QInputDialog.getItem(
+            self, "Export frames", "Frames to export:", frame_export.MODES, 0, False
+        )
+        if not result:
+            return None
+        _value = None
+        if _mode in ("every", "fps", "scene"):
+            _prompts = {
+                "every": ("Export one frame out of:", 10.0, 1.0, 100000.0, 0),
+                "fps": ("Frames per second:", 1.0, 0.01, 120.0, 2),
+                "scene": ("Scene change threshold (0-1):", 0.3, 0.01, 1.0, 2),
+            }
+            _label, _default, _minimum, _maximum, _decimals = _prompts[_mode]
+            _value, result = QInputDialog.getDouble(
+                self, "Export frames", _label, _default, _minimum, _maximum, _decimals
+            )
+            if not result:
+                return None
+        _format, result = QInputDialog.getItem(
+            self, "Export frames", "Image format:", ["png", "jpg", "webp"], 0, False
+        )
+        if not result:
+            return None
+        return _mode, _value, _format
+
     def export_frames(self):
+        _selection = self.get_frame_selection()
+        if not _selection:
+            return
         _media_folder = f"{self.select_folder()}"
         if _media_folder:
             _export_frames_thread = threading.Thread(
-                target=encoding.video_to_frames,
+                target=frame_export.export_frames,
                 args=(
                     self.media_info.file_location,
                     _media_folder,
                     self.media_info.trim_start,
                     self.media_info.trim_end,
+                    *_selection,
                 ),
             )
             _export_frames_thread.start()
 
+    def export_frames_archive(self):
+        _selection = self.get_frame_selection()
+        if not _selection:
+            return
+        _output = self.save_video(FRAME_ARCHIVE_FILTER)
+        if _output:
+            _archive_frames_thread = threading.Thread(
+                target=frame_archive.archive_frames,
+                args=(
+                    self.media_info.file_location,
+                    _output,
+                    self.media_info.trim_start,
+                    self.media_info.trim_end,
+                    *_selection,
+                ),
+            )
+            _archive_frames_thread.start()
+
     def lossless_mp4(self):
         _output = self.save_video(VIDEO_FILTER)
         if _output:
@@ -1107,6 +1608,7 @@ class VideoWindow(QMainWindow):
                     self.media_info.trim_start,
                     self.media_info.trim_end,
                 ),
+                kwargs={"encoder": self.web_encoder},
             )
             _encode_web_mp4_thread.start()
 
@@ -1114,10 +1616,37 @@ class VideoWindow(QMainWindow):
         _media_folder = f"{self.select_folder()}"
         if _media_folder:
             _batch_encode_thread = threading.Thread(
-                target=encoding.batch_encode, args=(_media_folder,)
+                target=encoding.batch_encode,
+                args=(_media_folder,),
+                kwargs={"encoder": self.web_encoder},
             )
             _batch_encode_thread.start()
 
+    def batch_encode_unique(self):
+        _media_folder = f"{self.select_folder()}"
+        if _media_folder:
+            _batch_encode_thread = threading.Thread(
+                target=encoding.batch_encode,
+                args=(_media_folder,),
+                kwargs={"skip_duplicates": True, "encoder": self.web_encoder},
+            )
+            _batch_encode_thread.start()
+
+    def find_duplicates(self):
+        _media_folder = self.select_folder()
+        if _media_folder:
+
+            def report():
+                for cluster in dedupe.find_duplicates(_media_folder, recursive=True):
+                    print(f"Keep {cluster[0]}")
+                    for duplicate in cluster[1:]:
+                        print(f"    duplicate {duplicate}")
+
+            _find_duplicates_thread = threading.Thread(
+                target=governor.run_as, args=("background", report)
+            )
+            _find_duplicates_thread.start()
+
     def batch_extract_subs(self):
         _media_folder = self.select_folder()
         if _media_folder:
@@ -1132,8 +1661,10 @@ class VideoWindow(QMainWindow):
         if _output:
             _subs_status = "internal"
             _trim_presets_thread = threading.Thread(
-                target=encoding.trim_preset_new,
+                target=governor.run_as,
                 args=(
+                    "interactive",
+                    encoding.trim_preset_new,
                     self.media_info.file_location,
                     self.media_info.subtitle_location,
                     _output,
@@ -1143,6 +1674,7 @@ class VideoWindow(QMainWindow):
                     self.media_info.audio_channel,
                     self.media_info.subtitle_channel,
                 ),
+                kwargs={"encoder": self.web_encoder},
             )
             _trim_presets_thread.start()
 
@@ -1152,8 +1684,10 @@ class VideoWindow(QMainWindow):
             self.media_info.subtitle_location = self.select_subtitle()
             _subs_status = "external"
             _trim_presets_thread = threading.Thread(
-                target=encoding.trim_preset_new,
+                target=governor.run_as,
                 args=(
+                    "interactive",
+                    encoding.trim_preset_new,
                     self.media_info.file_location,
                     self.media_info.subtitle_location,
                     _output,
@@ -1163,6 +1697,7 @@ class VideoWindow(QMainWindow):
                     self.media_info.audio_channel,
                     self.media_info.subtitle_channel,
                 ),
+                kwargs={"encoder": self.web_encoder},
             )
             _trim_presets_thread.start()
 
@@ -1170,8 +1705,10 @@ class VideoWindow(QMainWindow):
         _output = self.save_video(VIDEO_FILTER)
         if _output:
             _basic_trim_thread = threading.Thread(
-                target=encoding.trim_basic,
+                target=governor.run_as,
                 args=(
+                    "interactive",
+                    encoding.trim_basic,
                     self.media_info.trim_start,
                     self.media_info.trim_end,
                     self.media_info.file_location,
@@ -1188,8 +1725,10 @@ class VideoWindow(QMainWindow):
             _result = self.get_duration_wanted()
             if _result:
                 _trim_duration_thread = threading.Thread(
-                    target=encoding.trim_duration,
+                    target=governor.run_as,
                     args=(
+                        "interactive",
+                        encoding.trim_duration,
                         self.media_info.trim_start,
                         self.trim_duration_in_seconds,
                         self.media_info.file_location,
@@ -1204,8 +1743,10 @@ class VideoWindow(QMainWindow):
         _output = self.save_video(VIDEO_FILTER)
         if _output:
             trim_with_internal_subs_thread = threading.Thread(
-                target=encoding.trim_with_hard_subs,
+                target=governor.run_as,
                 args=(
+                    "interactive",
+                    encoding.trim_with_hard_subs,
                     self.media_info.trim_start,
                     self.media_info.trim_end,
                     self.media_info.file_location,
@@ -1223,8 +1764,10 @@ class VideoWindow(QMainWindow):
             if not self.media_info.subtitle_location:
                 self.media_info.subtitle_location = self.select_subtitle()
             trim_with_internal_subs_thread = threading.Thread(
-                target=encoding.trim_with_hard_subs,
+                target=governor.run_as,
                 args=(
+                    "interactive",
+                    encoding.trim_with_hard_subs,
                     self.media_info.trim_start,
                     self.media_info.trim_end,
                     self.media_info.file_location,
@@ -1299,5 +1842,27 @@ class VideoWindow(QMainWindow):
         image_audio_thread = threading.Thread(
             target=encoding.image_audio_to_video,
             args=(image_path, audio_path, output_path),
+            kwargs={"encoder": self.web_encoder},
         )
         image_audio_thread.start()
+
+    def batch_image_audio_to_video(self):
+        image_path = self.select_image()
+        if not image_path:
+            return
+
+        audio_folder = self.select_folder()
+        if not audio_folder:
+            return
+
+        batch_image_audio_thread = threading.Thread(
+            target=governor.run_as,
+            args=(
+                "background",
+                encoding.batch_image_audio_to_video,
+                image_path,
+                audio_folder,
+            ),
+            kwargs={"encoder": self.web_encoder},
+        )
+        batch_image_audio_thread.start()